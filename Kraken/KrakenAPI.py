@@ -1,4 +1,5 @@
 import requests
+import base64
 import hashlib
 import hmac
 import time
@@ -38,9 +39,12 @@ class KrakenAPI:
         response = self._request('GET', endpoint, data)
         return response
 
-    def place_order(self, pair, type, price, volume):
+    def place_order(self, pair, type, price, volume, ordertype="market"):
+        # Blocking single-leg helper; multi-leg execution belongs in order_gateway.OrderGateway
         endpoint = '/0/private/AddOrder'
-        data = f"pair={pair}&type={type}&ordertype=market&price={price}&volume={volume}"
+        data = f"pair={pair}&type={type}&ordertype={ordertype}&volume={volume}"
+        if ordertype != "market":
+            data += f"&price={price}"
         response = self._request('POST', endpoint, data)
         return response
 
@@ -1,61 +1,40 @@
-import pandas as pd
-import sqlite3
-import numpy as np
 import logging
 import asyncio
+import aiohttp
+import os
+import signal
+import sys
 from datetime import datetime
-from kraken_api import KrakenAPI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "kraken_backtest", "ARB Foresight"))
+from arb_foresight import KrakenAPI, load_config, load_trade_fees
+from latency import SUMMARY_INTERVAL, LatencyRecorder, log_summaries, serve_metrics
+from live_scheduler import DEFAULT_CONCURRENCY, LATENCY_BUDGET, CandleScheduler, LiveRunner, ZScoreStrategy
+from market_log import MarketLogWriter
+from pipeline import DB_FILE, build_pipeline
+from rolling_stats import ewm_zscores
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-# File paths
-DB_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/arbitrage_data.db"
+# Half-life of the per-pair EWMA statistics
+EWM_HALFLIFE = "6h"
+# Raw market logs for replay; config "record_dir" is relative to the ARB Foresight directory, null turns recording off
+ARB_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kraken_backtest", "ARB Foresight")
+RECORD_DIR = "recordings"
 
 # Functions for Enhanced Real-Time Analysis
 
-async def fetch_real_time_data(api, pairs):
-    """
-    Fetch real-time OHLC data for given pairs using Kraken API.
-    """
-    try:
-        ohlc_data = await api.fetch_ohlc_batch(pairs, interval=15)  # Assuming 15-minute intervals
-        real_time_df = pd.concat(
-            [pd.DataFrame(data, columns=["time", "open", "high", "low", "close", "vwap", "volume", "count"]) for pair, data in ohlc_data.items()],
-            keys=ohlc_data.keys(),
-            names=["pair"]
-        ).reset_index()
-        real_time_df["time"] = pd.to_datetime(real_time_df["time"], unit="s")
-        logger.info(f"Fetched real-time data for {len(pairs)} pairs.")
-        return real_time_df
-    except Exception as e:
-        logger.error(f"Error fetching real-time data: {e}")
-        return pd.DataFrame()
-
-def load_existing_data(db_file):
-    """Load historical data from SQLite database."""
-    try:
-        conn = sqlite3.connect(db_file)
-        df = pd.read_sql("SELECT * FROM arbitrage_opportunities", conn, parse_dates=['time'])
-        conn.close()
-        logger.info(f"Loaded {len(df)} rows of historical data from {db_file}.")
-        return df
-    except Exception as e:
-        logger.warning(f"No historical data found: {e}")
-        return pd.DataFrame()
-
 def calculate_real_profit(df):
     """
     Calculate real profit incorporating bid/ask prices, fees, and slippage.
     """
     if 'volume_a' in df.columns and 'fee_a' in df.columns and 'fee_b' in df.columns:
         logger.info("Calculating real profit based on volumes, fees, and bid/ask prices...")
-        # Example profit formula; real implementation requires actual bid/ask prices
-        df['real_profit'] = (
-            df['adjusted_discrepancy'] * df['volume_a']
-            - (df['fee_a'] + df['fee_b']) * df['volume_a']
-        )
+        # Example profit formula; real implementation requires actual bid/ask prices.
+        # adjusted_discrepancy is already net of both legs' fees
+        df['real_profit'] = df['adjusted_discrepancy'] * df['volume_a']
     else:
         logger.warning("Insufficient data for real profit calculation. Using adjusted discrepancy as proxy.")
         df['real_profit'] = df['adjusted_discrepancy']
@@ -64,6 +43,9 @@ def calculate_real_profit(df):
 def identify_profitable_thresholds(df, mean, std_dev):
     """
     Identify optimal thresholds for profitability.
+
+    mean and std_dev may be scalars or per-row arrays (e.g. EWMA statistics),
+    in which case every row is compared against its own adaptive threshold.
     """
     thresholds = {
         "mean + 2*std_dev": mean + 2 * std_dev,
@@ -79,55 +61,100 @@ def identify_profitable_thresholds(df, mean, std_dev):
         results[label] = {"threshold": threshold, "total_profit": total_profit, "trades": trade_count}
     return results
 
-async def execute_dynamic_strategy(api, db_file):
+async def execute_dynamic_strategy(db_file, config, trade_fees, stop=None):
     """
-    Execute a dynamic strategy combining historical and real-time data.
+    Run the dynamic strategy on every candle close until stop is set.
+
+    Historical opportunities are loaded once, through the pipeline cache, to
+    report threshold profitability and to warm the per-combination EWMA
+    statistics. From then on the scheduler wakes on candle boundaries of each
+    configured interval, fetches only new candles for the whole pair universe
+    and updates the statistics in memory.
     """
     logger.info("Starting dynamic strategy...")
 
-    # Load historical data
-    historical_data = load_existing_data(db_file)
+    historical_data = build_pipeline(db_file).get("load")
     if historical_data.empty:
-        logger.error("No historical data available. Exiting.")
-        return
-
-    # Fetch real-time data
-    pairs = historical_data["pair_a"].unique()[:10]  # Limit to first 10 pairs for demonstration
-    real_time_data = await fetch_real_time_data(api, pairs)
-    if real_time_data.empty:
-        logger.error("No real-time data fetched. Exiting.")
-        return
-
-    # Combine historical and real-time data
-    combined_data = pd.concat([historical_data, real_time_data], ignore_index=True)
-
-    # Calculate mean and standard deviation
-    mean = combined_data['adjusted_discrepancy'].mean()
-    std_dev = combined_data['adjusted_discrepancy'].std()
-
-    # Calculate real profit
-    combined_data = calculate_real_profit(combined_data)
-
-    # Identify profitable thresholds
-    logger.info("Identifying profitable thresholds...")
-    threshold_results = identify_profitable_thresholds(combined_data, mean, std_dev)
-
-    # Execute dynamic strategy
-    threshold = mean + 2 * std_dev
-    filtered_trades = combined_data[combined_data['adjusted_discrepancy'] > threshold]
-    total_profit = filtered_trades['real_profit'].sum()
-    logger.info(f"Dynamic Strategy: Total Profit = {total_profit:.2f}, Trades Executed: {len(filtered_trades)}")
+        logger.warning("No historical data available; statistics start from live candles.")
+    else:
+        historical_data = historical_data.dropna(subset=['pair_a', 'pair_b', 'adjusted_discrepancy'])
+        stats = ewm_zscores(historical_data, halflife=EWM_HALFLIFE)
+        logger.info("Identifying profitable thresholds...")
+        identify_profitable_thresholds(calculate_real_profit(historical_data.copy()), stats['ewm_mean'].to_numpy(), stats['ewm_std'].to_numpy())
+
+    intervals = config.get("live_intervals", [config.get("interval", 15)])
+    totals = {"profit": 0.0, "trades": 0}
+
+    def on_signals(interval, signals, trace):
+        trades = calculate_real_profit(signals)
+        trace.mark("size")
+        totals["profit"] += trades['real_profit'].sum()
+        totals["trades"] += len(trades)
+        logger.info(
+            f"{interval}m candle {trades['time'].iloc[0]}: {len(trades)} signals, profit {trades['real_profit'].sum():.2f} "
+            f"(session: {totals['profit']:.2f} over {totals['trades']} trades)"
+        )
 
-    return total_profit, filtered_trades
+    pairs = await KrakenAPI().fetch_asset_pairs()
+    if not pairs:
+        logger.error("No trading pairs found. Exiting.")
+        return totals["profit"], totals["trades"]
+    pairs = pairs[:config.get("pair_limit", len(pairs))]
+
+    # Per-stage latency histograms, summarized in the log and served at /metrics when config sets metrics_port
+    latency = LatencyRecorder()
+    metrics = await serve_metrics(latency, port=config["metrics_port"]) if config.get("metrics_port") else None
+    summaries = asyncio.create_task(log_summaries(latency, config.get("latency_summary_interval", SUMMARY_INTERVAL)))
+    record_dir = config.get("record_dir", RECORD_DIR)
+    recorder = None
+    if record_dir:
+        recorder = MarketLogWriter(os.path.join(ARB_DIRECTORY, record_dir, f"market-{datetime.now():%Y%m%d-%H%M%S}.arblog"))
+        logger.info(f"Recording market data to {recorder.path}")
+
+    async with aiohttp.ClientSession() as session:
+        runner = LiveRunner(
+            session, pairs, intervals, trade_fees["taker_fee"], [ZScoreStrategy(k=2)], on_signals,
+            halflife=EWM_HALFLIFE,
+            latency_budget=config.get("latency_budget", LATENCY_BUDGET),
+            concurrency=config.get("batch_size", DEFAULT_CONCURRENCY),
+            history=historical_data if not historical_data.empty else None,
+            latency=latency,
+            recorder=recorder,
+        )
+        logger.info(f"Scheduling {len(pairs)} pairs on {intervals} minute candles.")
+        try:
+            await CandleScheduler(intervals).run(runner.on_candle, stop)
+        finally:
+            summaries.cancel()
+            if metrics is not None:
+                await metrics.cleanup()
+            if recorder is not None:
+                recorder.close()
+            for line in latency.summary():
+                logger.info(f"Latency {line}")
+
+    return totals["profit"], totals["trades"]
 
 # Main function
 async def main():
     logger.info("Starting enhanced real-time analysis and strategy execution...")
+    try:
+        config = load_config()
+        trade_fees = load_trade_fees()
+    except Exception as e:
+        logger.error(f"Failed to load configuration or trade fees: {e}")
+        return 1
+
+    # Stop cleanly between candles on Ctrl-C or a service manager's SIGTERM
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
 
-    api = KrakenAPI()  # Assuming you have a class in your real-time script for API handling
-    total_profit, strategy_trades = await execute_dynamic_strategy(api, DB_FILE)
+    total_profit, trade_count = await execute_dynamic_strategy(DB_FILE, config, trade_fees, stop)
 
-    logger.info(f"Analysis Complete. Total Profit: {total_profit:.2f}, Trades Executed: {len(strategy_trades)}")
+    logger.info(f"Analysis Complete. Total Profit: {total_profit:.2f}, Trades Executed: {trade_count}")
+    return 0
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    sys.exit(asyncio.run(main()))
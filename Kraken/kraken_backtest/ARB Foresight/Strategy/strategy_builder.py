@@ -1,43 +1,36 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import logging
 import os
+import sys
+
+PARENT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PARENT_DIRECTORY)
+sys.path.insert(0, os.path.dirname(PARENT_DIRECTORY))
+from fee_schedule import net_of_fees
+from result_cache import ResultCache, code_version
+from pipeline import TRADE_FEES_FILE, TRADE_FEE_TIERS_FILE, build_pipeline
+from portfolio import load_balances, load_pair_assets, simulate_portfolio
+from profiling import profiled
+from risk_metrics import bootstrap_risk_by_group
+from utils.kernels import gate_opportunities
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Zero disables the cooldown and inventory limit
+COOLDOWN = pd.Timedelta(0)
+MAX_OPEN_TRADES = 0
+HOLDING_TIME = pd.Timedelta(minutes=1)
+
 # Paths
-DATA_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/optimized_pair_comparison_results.csv"
-TRADE_FEES_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/trade_fees.csv"
+BALANCES_FILE = "balances.csv"
 STRATEGY_RESULTS_FILE = "strategy_results.csv"
+PORTFOLIO_RESULTS_FILE = "portfolio_results.csv"
 STRATEGY_CHART_FILE = "strategy_visualization.png"
 CUMULATIVE_PROFIT_CHART = "cumulative_profit.png"
 
-def load_data(file_path):
-    """Load historical data for analysis."""
-    try:
-        df = pd.read_csv(file_path, parse_dates=["time"])
-        logger.info(f"Loaded {len(df)} rows from {file_path}.")
-        return df
-    except Exception as e:
-        logger.error(f"Error loading data: {e}")
-        return None
-
-def load_trade_fees(file_path):
-    """Load trade fees from a CSV file."""
-    try:
-        fees = pd.read_csv(file_path)
-        fees.rename(columns={"Pair": "pair", "TakerFee%": "taker_fee"}, inplace=True)
-        fees["taker_fee"] /= 100  # Convert percentage to decimal
-        fees.set_index("pair", inplace=True)
-        logger.info(f"Trade fees loaded successfully from {file_path}.")
-        return fees
-    except Exception as e:
-        logger.error(f"Error loading trade fees: {e}")
-        return None
-
 def validate_data(df):
     """Validate and clean data."""
     df = df[(df["adjusted_discrepancy"] > 0) & (df["volume_a"] > 0)]
@@ -46,32 +39,45 @@ def validate_data(df):
         exit(1)
     return df
 
+@profiled()
 def calculate_profit(trades, fees):
-    """Calculate profit based on discrepancies and fees."""
+    """Calculate profit based on discrepancies and taker fees on both legs."""
     try:
-        # Ensure pairs exist in the fee table
-        trades["profit"] = trades.apply(
-            lambda row: (
-                row["adjusted_discrepancy"] - fees.at[row["pair_a"], "taker_fee"]
-            ) * row["volume_a"]
-            if row["pair_a"] in fees.index
-            else 0,
-            axis=1,
-        )
+        trades = net_of_fees(fees.apply(trades.copy()))
+        # Pairs missing from the fee table are not tradable
+        known = fees.pair_ids(trades["pair_a"]) >= 0
+        trades["profit"] = np.where(known, trades["adjusted_discrepancy"] * trades["volume_a"], 0)
         trades = trades[trades["profit"] > 0]  # Remove unprofitable trades
         return trades
     except Exception as e:
         logger.error(f"Error calculating profit: {e}")
         return trades
 
-def formulate_strategy(df, threshold_factor=2):
-    """Formulate trading strategy based on thresholds."""
+@profiled()
+def formulate_strategy(df, threshold_factor=2, cooldown=COOLDOWN, max_open=MAX_OPEN_TRADES, hold=HOLDING_TIME):
+    """
+    Formulate trading strategy based on thresholds.
+
+    Candidates above the threshold are replayed in time order: a pair
+    combination waits cooldown after each trade, and at most max_open trades,
+    each held for hold, can be open at once.
+    """
     mean_discrepancy = df["adjusted_discrepancy"].mean()
     std_discrepancy = df["adjusted_discrepancy"].std()
     threshold = mean_discrepancy + threshold_factor * std_discrepancy
 
     logger.info(f"Using trading threshold: {threshold:.2f}")
-    strategy_trades = df[df["adjusted_discrepancy"] > threshold]
+    candidates = df[df["adjusted_discrepancy"] > threshold].sort_values("time", kind="stable")
+    groups = candidates.groupby(["pair_a", "pair_b"], sort=False).ngroup().to_numpy()
+    keep = gate_opportunities(
+        groups,
+        candidates["time"].to_numpy(dtype="datetime64[ns]").view("int64"),
+        cooldown=pd.Timedelta(cooldown).value,
+        max_open=max_open,
+        hold=pd.Timedelta(hold).value,
+    )
+    strategy_trades = candidates[keep]
+    logger.info(f"Kept {len(strategy_trades)} of {len(candidates)} candidate trades after cooldown and inventory limits.")
     return strategy_trades
 
 def evaluate_strategy(trades):
@@ -82,10 +88,37 @@ def evaluate_strategy(trades):
 
     sharpe_ratio = mean_return / std_return if std_return != 0 else 0
     logger.info(f"Sharpe Ratio: {sharpe_ratio:.2f}")
+
+    # Per-pair bootstrap distributions of Sharpe, Sortino, drawdown and recovery
+    risk_by_pair = bootstrap_risk_by_group(trades, resamples=1000)
+    if not risk_by_pair.empty:
+        logger.info(f"Bootstrapped risk by pair:\n{risk_by_pair[['pair_a', 'pair_b', 'trades', 'sharpe_p5', 'sharpe_p50', 'sharpe_p95', 'max_drawdown_p95']]}")
     return sharpe_ratio
 
+@profiled()
+def evaluate_portfolio(trades, balances_file, output_file):
+    """Replay the trades against the account's balances so capital is never double-counted."""
+    if not os.path.exists(balances_file):
+        logger.warning(f"No balances file at {balances_file}; skipping portfolio simulation.")
+        return None
+    try:
+        result = simulate_portfolio(trades, load_balances(balances_file), load_pair_assets(TRADE_FEES_FILE), hold=HOLDING_TIME)
+    except ValueError as e:
+        logger.warning(f"Skipping portfolio simulation: {e}")
+        return None
+    logger.info(
+        f"Portfolio profit: {result['profit']:.2f} from {result['filled']} of {result['requested']} trades "
+        f"(unconstrained total: {trades['profit'].sum():.2f})."
+    )
+    logger.info(f"Final balances:\n{result['balances']}")
+    save_strategy_results(result["trades"], output_file)
+    return result
+
+@profiled()
 def visualize_strategy(summary, trades, output_file):
     """Visualize top arbitrage opportunities."""
+    import matplotlib.pyplot as plt  # Deferred: only plotting pays for matplotlib
+
     try:
         plt.figure(figsize=(12, 6))
 
@@ -129,17 +162,13 @@ def main():
     """Main analysis function."""
     logger.info("Starting strategy analysis...")
 
-    # Load data
-    df = load_data(DATA_FILE)
-    if df is None or df.empty:
+    # Load data and trade fees through the shared pipeline, which reuses cached artifacts
+    pipeline = build_pipeline()
+    df = pipeline.get("load")
+    if df.empty:
         logger.error("No data available for analysis. Exiting.")
         return
-
-    # Load trade fees
-    trade_fees = load_trade_fees(TRADE_FEES_FILE)
-    if trade_fees is None or trade_fees.empty:
-        logger.error("No trade fee data available. Exiting.")
-        return
+    trade_fees = pipeline.get("fees")
 
     # Validate data
     df = validate_data(df)
@@ -147,12 +176,22 @@ def main():
     # Formulate strategy
     trades = formulate_strategy(df)
 
-    # Calculate profits
-    trades = calculate_profit(trades, trade_fees)
+    # Calculate profits one day at a time, reusing days whose trades and fees are unchanged
+    code = code_version(
+        os.path.abspath(__file__),
+        os.path.join(PARENT_DIRECTORY, "fee_schedule.py"),
+        *(path for path in (TRADE_FEES_FILE, TRADE_FEE_TIERS_FILE) if os.path.exists(path)),
+    )
+    trades = ResultCache().map_partitions(
+        trades, lambda partition: calculate_profit(partition, trade_fees), {"step": "calculate_profit"}, code
+    )
 
     # Evaluate strategy
     sharpe_ratio = evaluate_strategy(trades)
 
+    # Constrain the trades by the capital actually available in each asset
+    evaluate_portfolio(trades, BALANCES_FILE, PORTFOLIO_RESULTS_FILE)
+
     # Analyze top opportunities
     summary = df.groupby(["pair_a", "pair_b"])["adjusted_discrepancy"].agg(["mean", "std"]).reset_index()
 
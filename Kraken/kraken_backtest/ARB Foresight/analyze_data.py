@@ -1,19 +1,26 @@
 import pandas as pd
 import sqlite3
-import matplotlib.pyplot as plt
 from datetime import datetime
 import logging
+import os
+import sys
+from pipeline import DB_FILE, DIRECTORY, build_pipeline
+from profiling import profiled
+from rolling_stats import DEFAULT_WINDOW, rolling_zscores
+
+sys.path.insert(0, os.path.dirname(DIRECTORY))
+from utils.rendering import chart, line, panel, render_charts, scatter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 # Paths to files
-INPUT_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/optimized_pair_comparison_results.csv"
-DB_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/arbitrage_data.db"
-CHART_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/arbitrage_opportunities.png"
+INPUT_FILE = os.path.join(DIRECTORY, "optimized_pair_comparison_results.csv")
+CHART_FILE = os.path.join(DIRECTORY, "arbitrage_opportunities.png")
 
 
+@profiled()
 def load_csv(input_file):
     """
     Load new data from a CSV file.
@@ -42,6 +49,7 @@ def load_existing_data(db_file):
         return pd.DataFrame()
 
 
+@profiled()
 def save_to_database(df, db_file):
     """
     Save the DataFrame to an SQLite database, appending only new records.
@@ -65,14 +73,7 @@ def save_to_database(df, db_file):
         logger.error(f"Error saving data to database: {e}")
 
 
-def get_combined_data(db_file):
-    """
-    Load and combine historical and new data.
-    """
-    historical_data = load_existing_data(db_file)
-    return historical_data
-
-
+@profiled()
 def get_top_opportunities(df, n=10, method="percentile", value=95):
     """
     Extract the top N opportunities based on the chosen thresholding method.
@@ -80,8 +81,10 @@ def get_top_opportunities(df, n=10, method="percentile", value=95):
     Parameters:
         df (DataFrame): The data containing discrepancies.
         n (int): The number of top opportunities to extract.
-        method (str): The thresholding method ("percentile", "std_dev", "fixed").
+        method (str): The thresholding method ("percentile", "std_dev", "rolling_zscore", "fixed").
         value (float): The threshold value (percentile, standard deviation multiplier, or fixed number).
+            For "rolling_zscore" it is the z-score each row must exceed against its own pair
+            combination's trailing one-day mean and std, so the threshold follows current volatility.
         
     Returns:
         DataFrame: The top opportunities based on the chosen method.
@@ -94,11 +97,15 @@ def get_top_opportunities(df, n=10, method="percentile", value=95):
         std_dev = df['adjusted_discrepancy'].std()
         threshold = mean + value * std_dev
         logger.info(f"Using std-dev-based threshold: mean + {value}*std_dev = {threshold:.2f}")
+    elif method == "rolling_zscore":
+        scores = rolling_zscores(df)
+        threshold = scores['rolling_mean'] + value * scores['rolling_std']
+        logger.info(f"Using rolling per-pair threshold: mean + {value}*std_dev over a {DEFAULT_WINDOW} window")
     elif method == "fixed":
         threshold = value
         logger.info(f"Using fixed numeric threshold: {threshold:.2f}")
     else:
-        raise ValueError(f"Invalid method: {method}. Choose 'percentile', 'std_dev', or 'fixed'.")
+        raise ValueError(f"Invalid method: {method}. Choose 'percentile', 'std_dev', 'rolling_zscore', or 'fixed'.")
 
     # Filter and select top N
     filtered_df = df[df['adjusted_discrepancy'] > threshold]
@@ -107,39 +114,35 @@ def get_top_opportunities(df, n=10, method="percentile", value=95):
     logger.info(f"Top opportunities extracted:\n{top_opportunities}")
     return top_opportunities
 
+@profiled()
 def plot_opportunities(df, top_opportunities, chart_file):
     """
     Plot raw discrepancies and adjusted discrepancies with enhanced visualization.
+
+    The full history is min-max decimated to what the figure can show, and
+    the chart is skipped when its inputs are unchanged since the last run.
     """
     try:
-        plt.figure(figsize=(14, 8))
-
-        # Plot raw discrepancies
-        plt.subplot(2, 1, 1)
-        plt.plot(df['time'], df['discrepancy'], label="Raw Discrepancy", alpha=0.4, color='blue')
-        plt.scatter(top_opportunities['time'], top_opportunities['discrepancy'], color='red', label="Top Raw Opportunities", s=50)
-        plt.xlabel("Time")
-        plt.ylabel("Raw Discrepancy")
-        plt.title("Raw Discrepancy Over Time")
-        plt.legend()
-        plt.grid(alpha=0.3)
-
-        # Plot adjusted discrepancies
-        plt.subplot(2, 1, 2)
-        plt.plot(df['time'], df['adjusted_discrepancy'], label="Adjusted Discrepancy", alpha=0.4, color='orange')
-        plt.scatter(top_opportunities['time'], top_opportunities['adjusted_discrepancy'], color='green', label="Top Adjusted Opportunities", s=50)
-        plt.xlabel("Time")
-        plt.ylabel("Adjusted Discrepancy")
-        plt.title("Adjusted Discrepancy Over Time")
-        plt.legend()
-        plt.grid(alpha=0.3)
-
-        # Rotate x-axis labels to handle dense time data
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        plt.savefig(chart_file)
-        plt.close()
-        logger.info(f"Enhanced charts saved to: {chart_file}")
+        ordered = df.sort_values('time', kind='stable')
+        times = ordered['time'].to_numpy()
+        spec = chart([
+            panel(
+                [
+                    line(times, ordered['discrepancy'], label="Raw Discrepancy", alpha=0.4, color='blue'),
+                    scatter(top_opportunities['time'], top_opportunities['discrepancy'], label="Top Raw Opportunities", color='red', s=50),
+                ],
+                title="Raw Discrepancy Over Time", xlabel="Time", ylabel="Raw Discrepancy",
+            ),
+            panel(
+                [
+                    line(times, ordered['adjusted_discrepancy'], label="Adjusted Discrepancy", alpha=0.4, color='orange'),
+                    scatter(top_opportunities['time'], top_opportunities['adjusted_discrepancy'], label="Top Adjusted Opportunities", color='green', s=50),
+                ],
+                title="Adjusted Discrepancy Over Time", xlabel="Time", ylabel="Adjusted Discrepancy",
+            ),
+        ], figsize=(14, 8), rotate_xticks=True)
+        if render_charts({chart_file: spec}):
+            logger.info(f"Enhanced charts saved to: {chart_file}")
     except Exception as e:
         logger.error(f"Error creating chart: {e}")
 
@@ -159,9 +162,9 @@ def main():
     logger.info("Saving data to database...")
     save_to_database(new_data, DB_FILE)
 
-    # Load combined data
+    # Load combined data; the pipeline reloads only if the database changed
     logger.info("Loading combined data...")
-    combined_data = get_combined_data(DB_FILE)
+    combined_data = build_pipeline(DB_FILE).get("load")
 
     # Analyze top opportunities
     logger.info("Analyzing top opportunities...")
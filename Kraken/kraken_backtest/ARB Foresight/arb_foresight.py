@@ -3,39 +3,48 @@ import asyncio
 import logging
 import json
 import os
+import sys
 import pandas as pd
 from datetime import datetime
+from parallel_compare import iter_compare_all_pairs_parallel
+from result_sink import ResultSink
+from pipeline import DIRECTORY, TRADE_FEES_FILE
+from profiling import profiled
+from threshold_sweep import load_threshold_table
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-# Load configuration from config.json
-config_path = os.path.expanduser("~/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/config.json")
-try:
-    with open(config_path, "r") as config_file:
-        config = json.load(config_file)
-except Exception as e:
-    logger.error(f"Failed to load configuration: {e}")
-    exit(1)
-
-# Load trade fees from CSV
-trade_fees_path = os.path.expanduser("~/Desktop/Archive/Crypto/Kraken/kraken_backtest/trade_fees.csv")
-try:
-    trade_fees = pd.read_csv(trade_fees_path)
+# Per-pair thresholds written by arb_backtest_tuner.py
+PAIR_THRESHOLDS_FILE = os.path.join(DIRECTORY, "pair_thresholds.csv")
+CONFIG_FILE = os.path.join(DIRECTORY, "config.json")
+
+def load_config(config_file=CONFIG_FILE):
+    """
+    Load the comparison settings (batch_size, interval, pair_limit, parallel_workers).
+    """
+    with open(config_file, "r") as file:
+        config = json.load(file)
+    logger.info(f"Loaded configuration from {config_file}.")
+    return config
+
+def load_trade_fees(trade_fees_file=TRADE_FEES_FILE):
+    """
+    Load the fee table written by kraken_get_trade_fees.py, indexed by pair with decimal fees.
+    """
+    trade_fees = pd.read_csv(trade_fees_file)
     trade_fees.rename(columns={"Pair": "pair", "TakerFee%": "taker_fee", "MakerFee%": "maker_fee"}, inplace=True)
     trade_fees["taker_fee"] /= 100  # Convert percentage to decimal
     trade_fees["maker_fee"] /= 100  # Convert percentage to decimal
     trade_fees.set_index("pair", inplace=True)
     logger.info("Trade fees DataFrame processed successfully.")
-except Exception as e:
-    logger.error(f"Failed to load or process trade fees file: {e}")
-    exit(1)
+    return trade_fees
 
 class KrakenAPI:
-    def __init__(self):
+    def __init__(self, batch_size=10):
         self.base_url = "https://api.kraken.com"
-        self.batch_size = config.get("batch_size", 10)
+        self.batch_size = batch_size
 
     async def fetch_asset_pairs(self):
         """
@@ -81,6 +90,28 @@ class KrakenAPI:
         results = await asyncio.gather(*tasks)
         return {pair: data for pair, data in results if data}
 
+    async def fetch_order_books(self, pairs, count=25):
+        """
+        Fetch order book snapshots for all pairs using asyncio.
+        Feed the result to slippage.book_to_arrays for depth-walk sizing.
+        """
+        async def fetch(session, pair):
+            url = f"{self.base_url}/0/public/Depth?pair={pair}&count={count}"
+            try:
+                async with session.get(url) as response:
+                    data = await response.json()
+                    if "result" in data:
+                        key = list(data["result"].keys())[0]
+                        return pair, data["result"][key]
+            except Exception as e:
+                logger.error(f"Error fetching order book for {pair}: {e}")
+            return pair, None
+
+        async with aiohttp.ClientSession() as session:
+            results = await asyncio.gather(*[fetch(session, pair) for pair in pairs])
+        return {pair: book for pair, book in results if book}
+
+@profiled()
 def process_ohlc_data(ohlc_data, pair_name):
     """
     Process OHLC data into a pandas DataFrame.
@@ -94,68 +125,106 @@ def process_ohlc_data(ohlc_data, pair_name):
     ])
     df["time"] = pd.to_datetime(df["time"], unit="s")
     df["close"] = df["close"].astype(float)
+    df["volume"] = df["volume"].astype(float)
     df["pair"] = pair_name  # Add pair name column
     return df
 
-def analyze_results(results, dynamic_threshold=True):
+def compare_pairs(pair_dfs, taker_fees):
+    """
+    Compare two pairs candle by candle and compute fee-adjusted discrepancies.
+    taker_fees maps pair names to decimal taker fees.
+    """
+    df_a, df_b = pair_dfs
+    merged = df_a.merge(df_b, on="time", suffixes=("_a", "_b"))
+    merged["discrepancy"] = (merged["close_a"] - merged["close_b"]).abs()
+    merged["fee_a"] = merged["pair_a"].map(taker_fees).fillna(0)
+    merged["fee_b"] = merged["pair_b"].map(taker_fees).fillna(0)
+    merged["adjusted_discrepancy"] = merged["discrepancy"] - merged["fee_a"] - merged["fee_b"]
+    return merged
+
+def iter_pair_comparisons(dataframes, taker_fees):
+    """
+    Yield comparison results one pair combination at a time.
+    """
+    pairs = list(dataframes)
+    for i, pair_a in enumerate(pairs):
+        for pair_b in pairs[i+1:]:
+            yield compare_pairs((dataframes[pair_a], dataframes[pair_b]), taker_fees)
+
+@profiled()
+def analyze_results(results, dynamic_threshold=True, output_file=None, top_k=10):
     """
     Analyze results to determine profitability and generate insights.
+
+    Results are streamed through a ResultSink, so memory stays bounded by the
+    top-K heaps and the spill chunk size rather than by the full N^2 output.
+    All rows are spilled to output_file.
     """
-    if not results:
+    sink = ResultSink(output_file, top_k=top_k)
+    for result in results:
+        sink.add(result)
+    sink.close()
+
+    if sink.count == 0:
         logger.info("No results to analyze.")
-        return
+        return None
 
-    combined_results = pd.concat(results, ignore_index=True)
-    combined_results["profit"] = combined_results["adjusted_discrepancy"] * combined_results["volume_a"]
-    logger.info(f"Total Profit: {combined_results['profit'].sum():.2f}")
+    logger.info(f"Total Profit: {sink.total_profit:.2f}")
 
     # Generate insights
     if dynamic_threshold:
-        threshold = combined_results["adjusted_discrepancy"].mean() + 2 * combined_results["adjusted_discrepancy"].std()
-        filtered_results = combined_results[combined_results["adjusted_discrepancy"] > threshold]
-        logger.info(f"Filtered Results Exceeding Dynamic Threshold ({threshold:.2f}):")
-        logger.info(filtered_results)
-    return combined_results
-
-async def main():
-    kraken_api = KrakenAPI()
+        threshold = sink.threshold(2)
+        logger.info(f"Filtered Results Exceeding Dynamic Threshold ({threshold:.2f}): {sink.count_above(threshold)} rows")
+        if os.path.exists(PAIR_THRESHOLDS_FILE):
+            pair_thresholds = load_threshold_table(PAIR_THRESHOLDS_FILE)
+            logger.info(f"Filtered Results Exceeding Per-Pair Thresholds: {sink.count_above(threshold, pair_thresholds)} rows")
+        logger.info(f"Top {top_k} results:\n{sink.top()}")
+    return sink
+
+async def main(config_file=CONFIG_FILE, trade_fees_file=TRADE_FEES_FILE, output_file="analyzed_pair_comparison_results.csv"):
+    try:
+        config = load_config(config_file)
+        trade_fees = load_trade_fees(trade_fees_file)
+    except Exception as e:
+        logger.error(f"Failed to load configuration or trade fees: {e}")
+        return 1
+    taker_fees = trade_fees["taker_fee"]
+
+    kraken_api = KrakenAPI(config.get("batch_size", 10))
 
     # Fetch trading pairs
     logger.info("Fetching all trading pairs...")
     pairs = await kraken_api.fetch_asset_pairs()
     if not pairs:
         logger.error("No trading pairs found.")
-        return
+        return 1
 
     # Fetch OHLC data
     logger.info("Fetching OHLC data for selected pairs...")
-    ohlc_data = await kraken_api.fetch_ohlc_parallel(pairs[:config["pair_limit"]])
+    ohlc_data = await kraken_api.fetch_ohlc_parallel(pairs[:config["pair_limit"]], interval=config.get("interval", 15))
 
     # Process data
-    dataframes = {
-        pair: process_ohlc_data(data, pair)
-        for pair, data in ohlc_data.items()
-        if process_ohlc_data(data, pair) is not None
-    }
+    dataframes = {}
+    for pair, data in ohlc_data.items():
+        df = process_ohlc_data(data, pair)
+        if df is not None:
+            dataframes[pair] = df
 
     # Compare pairs
     logger.info("Comparing pairs for arbitrage opportunities...")
-    results = []
-    seen = set()
-    for i, pair_a in enumerate(dataframes):
-        for pair_b in list(dataframes)[i+1:]:
-            if (pair_a, pair_b) in seen or (pair_b, pair_a) in seen:
-                continue
-            seen.add((pair_a, pair_b))
-            results.append(compare_pairs((dataframes[pair_a], dataframes[pair_b])))
-
-    # Analyze results
-    analyzed_results = analyze_results(results)
-
-    # Save analyzed results
+    workers = config.get("parallel_workers", 0)
+    if workers:
+        # Shard the N^2 sweep across a process pool over shared memory, one block at a time into the sink
+        results = iter_compare_all_pairs_parallel(dataframes, fees=taker_fees.to_dict(), workers=workers)
+    else:
+        results = iter_pair_comparisons(dataframes, taker_fees)
+
+    # Analyze results, spilling analyzed rows straight to the results file
+    analyzed_results = analyze_results(results, output_file=output_file)
+
     if analyzed_results is not None:
-        analyzed_results.to_csv("analyzed_pair_comparison_results.csv", index=False)
-        logger.info("Analysis complete. Results saved to 'analyzed_pair_comparison_results.csv'.")
+        logger.info(f"Analysis complete. Results saved to '{output_file}'.")
+    return 0
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    sys.exit(asyncio.run(main()))
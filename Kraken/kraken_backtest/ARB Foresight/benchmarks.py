@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the ARB Foresight hot paths on generated data.
+
+    python benchmarks.py                      run the small and medium sizes
+    python benchmarks.py --size full          791 pairs and 1M rows
+    python benchmarks.py --save-baseline      record this machine's baseline
+    python benchmarks.py --only compare       benchmarks whose name contains "compare"
+
+Every run writes its timings to benchmarks/results-<timestamp>.json. When a
+baseline exists the run fails (exit 1) if any benchmark's best time is more
+than --max-slowdown times its baseline. Baselines are per machine, so record
+one before starting performance work and compare against it afterwards.
+"""
+import argparse
+import gc
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORY))
+sys.path.insert(0, os.path.join(DIRECTORY, "Strategy"))
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DIR = os.path.join(DIRECTORY, "benchmarks")
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+# (pairs, rows) per dataset size; 791 is the full Kraken universe
+SIZES = {
+    "small": (10, 1_000),
+    "medium": (100, 100_000),
+    "full": (791, 1_000_000),
+}
+DEFAULT_SIZES = ("small", "medium")
+# Kraken returns at most 720 candles per OHLC request
+CANDLES = 720
+REPEAT = 5
+MAX_SLOWDOWN = 1.25
+# Fast benchmarks are looped until one sample takes at least this long
+MIN_SAMPLE_SECONDS = 0.05
+SEED = 42
+START_TIME = pd.Timestamp("2024-01-01")
+
+Benchmark = namedtuple("Benchmark", ["name", "sizes", "setup"])
+
+
+# Synthetic data
+
+def synthetic_pairs(n_pairs):
+    """Pair names in Kraken's BASEQUOTE style."""
+    return [f"A{i:03d}USD" for i in range(n_pairs)]
+
+
+def synthetic_pair_frames(n_pairs, n_candles=CANDLES, seed=SEED):
+    """
+    Per-pair OHLC frames (time, close, volume, pair) on a shared 1-minute grid.
+
+    Every pair follows one random walk around 1.0 plus its own noise, so
+    cross-pair discrepancies are of the same order as fees, and about 1% of
+    candles are missing so the comparison has to align them.
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(START_TIME, periods=n_candles, freq="min")
+    market = np.exp(np.cumsum(rng.normal(0, 0.002, n_candles)))
+    frames = {}
+    for pair in synthetic_pairs(n_pairs):
+        close = market * (1 + rng.normal(0, 0.002, n_candles))
+        keep = rng.random(n_candles) > 0.01
+        frames[pair] = pd.DataFrame({
+            "time": times[keep],
+            "close": close[keep],
+            "volume": rng.lognormal(2, 1, n_candles)[keep],
+            "pair": pair,
+        })
+    return frames
+
+
+def synthetic_opportunities(n_rows, n_pairs, seed=SEED):
+    """
+    Comparison rows shaped like the pipeline's profit artifact, sorted by time.
+
+    Discrepancies are mostly small with a heavy right tail, as in the
+    recorded pair_comparison_results.csv.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.asarray(synthetic_pairs(n_pairs), dtype=object)
+    a = rng.integers(0, n_pairs - 1, n_rows)
+    b = a + 1 + (rng.random(n_rows) * (n_pairs - 1 - a)).astype(np.int64)
+    minutes = np.sort(rng.integers(0, max(n_rows // 10, 1), n_rows))
+    discrepancy = np.abs(rng.normal(0.005, 0.01, n_rows)) + rng.exponential(0.01, n_rows) * (rng.random(n_rows) < 0.05)
+    df = pd.DataFrame({
+        "time": START_TIME + pd.to_timedelta(minutes, unit="min"),
+        "pair_a": names[a],
+        "pair_b": names[b],
+        "close_a": rng.lognormal(0, 1, n_rows),
+        "close_b": rng.lognormal(0, 1, n_rows),
+        "volume_a": rng.lognormal(2, 1, n_rows),
+        "volume_b": rng.lognormal(2, 1, n_rows),
+        "discrepancy": discrepancy,
+        "fee_a": 0.0026,
+        "fee_b": 0.0026,
+    })
+    df["adjusted_discrepancy"] = df["discrepancy"] - df["fee_a"] - df["fee_b"]
+    df["profit"] = df["adjusted_discrepancy"] * df["volume_a"]
+    return df
+
+
+def synthetic_ohlc_rows(n_rows, seed=SEED):
+    """Raw OHLC rows as the API returns them: epoch seconds and string fields."""
+    rng = np.random.default_rng(seed)
+    close = np.exp(np.cumsum(rng.normal(0, 0.002, n_rows)))
+    start = int(START_TIME.timestamp())
+    return [
+        [start + 60 * i, f"{c:.6f}", f"{c * 1.001:.6f}", f"{c * 0.999:.6f}", f"{c:.6f}", f"{c:.6f}", f"{v:.8f}", 10]
+        for i, (c, v) in enumerate(zip(close, rng.lognormal(2, 1, n_rows)))
+    ]
+
+
+def synthetic_ohlc_responses(n_pairs, n_candles=CANDLES, seed=SEED):
+    """
+    Raw /0/public/OHLC response bodies for the first n_pairs pairs of the synthetic market.
+
+    Returns (pairs, bodies, boundary): each body holds n_candles closed
+    candles, all of them closed at boundary.
+    """
+    from synthetic_market import OHLC_INTERVAL, SyntheticMarket, load_universe
+
+    universe = dict(itertools.islice(load_universe().items(), n_pairs))
+    # One step per candle, so every step closes one
+    market = SyntheticMarket(universe, seed=seed, step=OHLC_INTERVAL * 60, start=START_TIME.timestamp())
+    for _ in range(n_candles + 1):
+        market.step()
+    bodies = [json.dumps(market.rest_ohlc(i)).encode() for i in range(len(market.pairs))]
+    return market.pairs, bodies, int(market.candle_start)
+
+
+# Benchmarks: setup(pairs, rows, scratch) builds the inputs and returns the callable to time;
+# scratch is a temporary directory removed after the benchmark
+
+def setup_ohlc_decode(pairs, rows, scratch):
+    from arb_foresight import process_ohlc_data
+
+    ohlc = synthetic_ohlc_rows(rows)
+    return lambda: process_ohlc_data(ohlc, "A000USD")
+
+
+def setup_live_ohlc_decode(pairs, rows, scratch):
+    from live_scheduler import OhlcFeed
+    from synthetic_market import OHLC_INTERVAL
+
+    names, bodies, boundary = synthetic_ohlc_responses(pairs)
+    feed = OhlcFeed(None, names, OHLC_INTERVAL)
+    # A live poll's work after the response arrives: parse the body, then keep the closed candles
+    return lambda: [feed._decode(pair, json.loads(body), boundary) for pair, body in zip(names, bodies)]
+
+
+def setup_compare_serial(pairs, rows, scratch):
+    from arb_foresight import iter_pair_comparisons
+
+    frames = synthetic_pair_frames(pairs)
+    fees = pd.Series(0.0026, index=list(frames))
+    return lambda: sum(len(result) for result in iter_pair_comparisons(frames, fees))
+
+
+def setup_compare_parallel(pairs, rows, scratch):
+    from parallel_compare import compare_all_pairs_parallel
+
+    frames = synthetic_pair_frames(pairs)
+    fees = {pair: 0.0026 for pair in frames}
+    # Keep only the tail (a few rows in 10,000), so the output stays bounded at 791 pairs
+    return lambda: compare_all_pairs_parallel(frames, fees=fees, min_discrepancy=0.005)
+
+
+def setup_threshold_sweep(pairs, rows, scratch):
+    from pipeline import THRESHOLD_GRID, summary_stats, threshold_table
+
+    df = synthetic_opportunities(rows, pairs)
+    stats = summary_stats(df)
+    return lambda: threshold_table(df, stats, THRESHOLD_GRID)
+
+
+def setup_pair_thresholds(pairs, rows, scratch):
+    from pipeline import THRESHOLD_GRID
+    from threshold_sweep import optimize_group_thresholds
+
+    df = synthetic_opportunities(rows, pairs)
+    return lambda: optimize_group_thresholds(df, THRESHOLD_GRID)
+
+
+def setup_strategy_gate(pairs, rows, scratch):
+    from strategy_builder import formulate_strategy
+
+    df = synthetic_opportunities(rows, pairs)
+    return lambda: formulate_strategy(df, threshold_factor=1, cooldown=pd.Timedelta(minutes=5), max_open=20)
+
+
+def setup_backtest_arrays(pairs, rows, scratch):
+    from utils.backtest import backtest_arrays, momentum_signal
+
+    close = np.exp(np.cumsum(np.random.default_rng(SEED).normal(0, 0.002, rows)))
+    return lambda: backtest_arrays(close, momentum_signal(close, 5), periods_per_year=525600)
+
+
+def setup_sqlite_ingest(pairs, rows, scratch):
+    from analyze_data import save_to_database
+
+    df = synthetic_opportunities(rows, pairs)
+    counter = itertools.count()
+
+    def ingest():
+        db_file = os.path.join(scratch, f"ingest_{next(counter)}.db")
+        save_to_database(df, db_file)
+        os.remove(db_file)
+    return ingest
+
+
+def setup_result_cache(pairs, rows, scratch):
+    from result_cache import ResultCache
+
+    df = synthetic_opportunities(rows, pairs)
+    cache = ResultCache(scratch)
+    params = {"threshold": 2.0}
+
+    def roundtrip():
+        key = cache.key(df, params)
+        cache.put(key, {"rows": len(df)}, df)
+        return cache.get(key)
+    return roundtrip
+
+
+def setup_result_sink(pairs, rows, scratch):
+    from result_sink import ResultSink
+
+    df = synthetic_opportunities(rows, pairs).drop(columns="profit")
+    chunks = [df.iloc[start:start + 10_000] for start in range(0, len(df), 10_000)]
+
+    def stream():
+        sink = ResultSink(os.path.join(scratch, "spill.csv"))
+        for chunk in chunks:
+            sink.add(chunk)
+        sink.close()
+        return sink.count_above(sink.threshold(2))
+    return stream
+
+
+ALL_SIZES = tuple(SIZES)
+BENCHMARKS = [
+    Benchmark("ohlc_decode", ALL_SIZES, setup_ohlc_decode),
+    Benchmark("live_ohlc_decode", ALL_SIZES, setup_live_ohlc_decode),
+    # The pandas merge per combination is O(pairs^2) merges; past 10 pairs it only measures patience
+    Benchmark("compare_serial", ("small",), setup_compare_serial),
+    Benchmark("compare_parallel", ALL_SIZES, setup_compare_parallel),
+    Benchmark("threshold_sweep", ALL_SIZES, setup_threshold_sweep),
+    Benchmark("pair_thresholds", ALL_SIZES, setup_pair_thresholds),
+    Benchmark("strategy_gate", ALL_SIZES, setup_strategy_gate),
+    Benchmark("backtest_arrays", ALL_SIZES, setup_backtest_arrays),
+    Benchmark("sqlite_ingest", ALL_SIZES, setup_sqlite_ingest),
+    Benchmark("result_cache", ALL_SIZES, setup_result_cache),
+    Benchmark("result_sink", ALL_SIZES, setup_result_sink),
+]
+
+
+# Running and gating
+
+def measure(func, repeat=REPEAT, min_sample=MIN_SAMPLE_SECONDS):
+    """
+    Per-call seconds of repeat samples, after one warm-up call.
+
+    The warm-up call pays for imports, JIT compilation and first-touch page
+    faults, and sets how many calls make up a sample so that fast functions
+    are not timed below the clock's resolution.
+    """
+    start = time.perf_counter()
+    func()
+    first = time.perf_counter() - start
+    number = max(1, math.ceil(min_sample / first)) if first > 0 else 1000
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples, number
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, only=None, repeat=REPEAT):
+    """Run every selected benchmark at every selected size; returns result dicts."""
+    results = []
+    for size in sizes:
+        pairs, rows = SIZES[size]
+        for benchmark in BENCHMARKS:
+            if size not in benchmark.sizes or (only and not any(name in benchmark.name for name in only)):
+                continue
+            with tempfile.TemporaryDirectory(prefix="arb_bench_") as scratch:
+                samples, number = measure(benchmark.setup(pairs, rows, scratch), repeat)
+            result = {
+                "name": benchmark.name,
+                "size": size,
+                "pairs": pairs,
+                "rows": rows,
+                "number": number,
+                "best": min(samples),
+                "median": statistics.median(samples),
+                "samples": samples,
+            }
+            print(f"{benchmark.name:<18} {size:<7} best {result['best'] * 1e3:12.3f} ms  median {result['median'] * 1e3:12.3f} ms", flush=True)
+            results.append(result)
+    return results
+
+
+def environment():
+    """Machine and library versions a baseline is only valid for."""
+    return {
+        "machine": platform.node(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def _key(result):
+    return f"{result['name']}/{result['size']}"
+
+
+def load_baseline(baseline_file=BASELINE_FILE):
+    if not os.path.exists(baseline_file):
+        return None
+    with open(baseline_file) as file:
+        return json.load(file)
+
+
+def save_baseline(results, baseline_file=BASELINE_FILE):
+    """Record results as the baseline, keeping entries of benchmarks not run this time."""
+    baseline = load_baseline(baseline_file) or {"results": {}}
+    baseline.update(created=datetime.now().isoformat(), environment=environment())
+    baseline["results"].update({_key(result): result for result in results})
+    os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+    with open(baseline_file, "w") as file:
+        json.dump(baseline, file, indent=1)
+    logger.info(f"Baseline with {len(baseline['results'])} entries saved to {baseline_file}")
+
+
+def compare_to_baseline(results, baseline, max_slowdown=MAX_SLOWDOWN):
+    """Slowdown of each result against the baseline; returns the keys that exceed max_slowdown."""
+    if baseline["environment"] != environment():
+        logger.warning("Baseline was recorded on a different machine or library versions; ratios may not be meaningful.")
+    regressions = []
+    for result in results:
+        reference = baseline["results"].get(_key(result))
+        if reference is None:
+            continue
+        ratio = result["best"] / reference["best"]
+        result["baseline_best"] = reference["best"]
+        result["slowdown"] = ratio
+        flag = "REGRESSION" if ratio > max_slowdown else ""
+        print(f"{_key(result):<26} {reference['best'] * 1e3:12.3f} -> {result['best'] * 1e3:12.3f} ms  x{ratio:5.2f} {flag}")
+        if ratio > max_slowdown:
+            regressions.append(_key(result))
+    return regressions
+
+
+def write_results(results, output_dir=BENCHMARK_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"results-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as file:
+        json.dump({"created": datetime.now().isoformat(), "environment": environment(), "results": results}, file, indent=1)
+    logger.info(f"Results written to {path}")
+    return path
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmarks", description="Benchmark ARB Foresight hot paths on generated data.")
+    parser.add_argument("--size", default=",".join(DEFAULT_SIZES), help=f"Comma list of dataset sizes: {', '.join(SIZES)}")
+    parser.add_argument("--only", help="Comma list of substrings; run only benchmarks whose name contains one")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Timed samples per benchmark")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline JSON to compare against and save to")
+    parser.add_argument("--save-baseline", action="store_true", help="Record this run as the baseline instead of gating on it")
+    parser.add_argument("--max-slowdown", type=float, default=MAX_SLOWDOWN, help="Fail when best time exceeds baseline times this")
+    parser.add_argument("--output-dir", default=BENCHMARK_DIR, help="Directory for results-<timestamp>.json")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sizes = [size.strip() for size in args.size.split(",") if size.strip()]
+    unknown = sorted(set(sizes) - set(SIZES))
+    if unknown:
+        logger.error(f"Unknown sizes {unknown}; choose from {list(SIZES)}")
+        return 2
+    # The benchmarked scripts log every call, and warn about the empty databases they ingest into
+    logging.getLogger().setLevel(logging.ERROR)
+    logger.setLevel(logging.INFO)
+
+    only = [name.strip() for name in args.only.split(",")] if args.only else None
+    results = run_benchmarks(sizes, only, args.repeat)
+    if args.save_baseline:
+        write_results(results, args.output_dir)
+        save_baseline(results, args.baseline)
+        return 0
+    baseline = load_baseline(args.baseline)
+    regressions = compare_to_baseline(results, baseline, args.max_slowdown) if baseline else []
+    write_results(results, args.output_dir)
+    if baseline is None:
+        logger.info(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    if regressions:
+        logger.error(f"{len(regressions)} benchmarks slowed down more than x{args.max_slowdown}: {', '.join(regressions)}")
+        return 1
+    logger.info("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    sys.exit(main())
@@ -1,74 +1,55 @@
 import pandas as pd
-import sqlite3
-import matplotlib.pyplot as plt
 import numpy as np
 import logging
+import os
+from result_cache import ResultCache, code_version
+from risk_metrics import bootstrap_risk, summarize_distribution
+from pipeline import DIRECTORY, build_pipeline
+from profiling import profiled
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 # Paths to files
-DB_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/arbitrage_data.db"
-CHART_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/arbitrage_opportunities_backtest.png"
-OUTLIER_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/ARB Foresight/outliers.csv"
-TRADE_FEES_FILE = "/Users/nathanhart/Desktop/Archive/Crypto/Kraken/kraken_backtest/trade_fees.csv"
-
-# Load data
-def load_existing_data(db_file):
-    """Load historical data from SQLite database."""
-    try:
-        conn = sqlite3.connect(db_file)
-        df = pd.read_sql("SELECT * FROM arbitrage_opportunities", conn, parse_dates=['time'])
-        conn.close()
-        logger.info(f"Loaded {len(df)} rows of historical data from {db_file}.")
-        return df
-    except Exception as e:
-        logger.warning(f"No historical data found: {e}")
-        return pd.DataFrame()
-
-def load_trade_fees(trade_fees_file):
-    """Load trade fees from CSV file."""
-    try:
-        fees_df = pd.read_csv(trade_fees_file)
-        logger.info("Trade fees loaded successfully.")
-        return fees_df
-    except Exception as e:
-        logger.error(f"Failed to load trade fees: {e}")
-        return pd.DataFrame()
-
-# Real profit calculation
-def calculate_profit(df, fees_df):
-    """Calculate real profit or fallback to adjusted discrepancy as a proxy."""
-    if 'volume_a' in df.columns and 'fee_a' in fees_df.columns:
-        logger.info("Calculating real profit based on trading volumes and fees...")
-        # Merge trade fees with the data
-        df = df.merge(fees_df, on="pair", how="left")
-        df['fee_a'].fillna(0, inplace=True)
-        df['fee_b'].fillna(0, inplace=True)
-
-        # Calculate profit after trade fees
-        df['profit'] = (
-            df['adjusted_discrepancy'] * df['volume_a'] - 
-            (df['fee_a'] + df['fee_b']) * df['volume_a']
-        )
-    else:
-        logger.warning("Volume and fee data unavailable. Using adjusted discrepancy as a proxy.")
-        df['profit'] = df['adjusted_discrepancy']
-    return df
+CHART_FILE = os.path.join(DIRECTORY, "arbitrage_opportunities_backtest.png")
+OUTLIER_FILE = os.path.join(DIRECTORY, "outliers.csv")
+RISK_METRICS_FILE = os.path.join(DIRECTORY, "risk_metrics.py")
+# Backtest partitions; each is traded against thresholds fit on the partitions before it
+BACKTEST_FREQ = "D"
 
 # Backtesting with weights
+@profiled()
 def backtest_trades_with_weights(df, threshold, mean, std_dev):
     """Prioritize trades closer to the mean + 3*std_dev threshold."""
     threshold_value = mean + threshold * std_dev
-    df['weight'] = np.exp(-abs(df['adjusted_discrepancy'] - threshold_value) / std_dev)  # Higher weight closer to the threshold
     filtered_trades = df[df['adjusted_discrepancy'] > threshold_value]
+    # Higher weight closer to the threshold
+    filtered_trades = filtered_trades.assign(weight=np.exp(-abs(filtered_trades['adjusted_discrepancy'] - threshold_value) / std_dev))
     
     total_profit = (filtered_trades['profit'] * filtered_trades['weight']).sum()
     logger.info(f"Weighted Profit: {total_profit:.2f} over {len(filtered_trades)} trades.")
     return total_profit, filtered_trades
 
+def prior_period_stats(df, freq=BACKTEST_FREQ):
+    """
+    Mean and std of adjusted_discrepancy over every period before each row's own.
+
+    Returns two arrays aligned with df's rows, NaN in the first period. Rows of
+    a period only depend on earlier history, so appending new data leaves the
+    values of the periods already seen unchanged.
+    """
+    periods = df['time'].dt.floor(freq)
+    values = df['adjusted_discrepancy'].astype(np.float64)
+    sums = pd.DataFrame({'n': values.groupby(periods).count(), 's': values.groupby(periods).sum(), 'sq': (values ** 2).groupby(periods).sum()})
+    prior = sums.cumsum().shift(1)
+    mean = prior['s'] / prior['n']
+    # Sample variance from running sums, as pandas' std(ddof=1)
+    std = np.sqrt(((prior['sq'] - prior['n'] * mean ** 2) / (prior['n'] - 1)).clip(lower=0))
+    return mean.reindex(periods).to_numpy(), std.reindex(periods).to_numpy()
+
 # Sharpe Ratio and Sortino Ratio
+@profiled()
 def evaluate_risk_metrics(trade_summary):
     """Calculate Sharpe and Sortino Ratios."""
     if trade_summary.empty:
@@ -85,9 +66,18 @@ def evaluate_risk_metrics(trade_summary):
 
     logger.info(f"Sharpe Ratio: {sharpe_ratio:.2f}")
     logger.info(f"Sortino Ratio: {sortino_ratio:.2f}")
+
+    # Bootstrap confidence intervals instead of a single point estimate
+    summary = summarize_distribution(bootstrap_risk(returns.to_numpy()))
+    if summary:
+        logger.info(f"Sharpe 90% CI: [{summary['sharpe_p5']:.2f}, {summary['sharpe_p95']:.2f}]")
+        logger.info(f"Sortino 90% CI: [{summary['sortino_p5']:.2f}, {summary['sortino_p95']:.2f}]")
+        logger.info(f"Max Drawdown median: {summary['max_drawdown_p50']:.2f} (p95: {summary['max_drawdown_p95']:.2f})")
+        logger.info(f"Time to Recovery median: {summary['time_to_recovery_p50']:.0f} trades (p95: {summary['time_to_recovery_p95']:.0f})")
     return sharpe_ratio, sortino_ratio
 
 # Outlier analysis
+@profiled()
 def analyze_outliers(df, mean, std_dev):
     """Deep dive into outliers based on mean + 4*std_dev."""
     outlier_threshold = mean + 4 * std_dev
@@ -98,8 +88,11 @@ def analyze_outliers(df, mean, std_dev):
     return outliers
 
 # Plot discrepancy distribution
+@profiled()
 def plot_discrepancy_distribution(df, mean, std_dev, chart_file):
     """Plot histograms of discrepancies and thresholds."""
+    import matplotlib.pyplot as plt  # Deferred: only plotting pays for matplotlib
+
     try:
         plt.figure(figsize=(10, 6))
         plt.hist(df['adjusted_discrepancy'], bins=50, alpha=0.6, label="Adjusted Discrepancy")
@@ -122,31 +115,45 @@ def plot_discrepancy_distribution(df, mean, std_dev, chart_file):
 def main():
     logger.info("Starting enhanced analysis...")
 
-    # Load data
-    df = load_existing_data(DB_FILE)
+    # Load data, fees, profit and stats from the shared pipeline, recomputing only stale stages
+    pipeline = build_pipeline()
+    df = pipeline.get("profit")
     if df.empty:
         logger.error("No data available for analysis. Exiting.")
         return
+    stats = pipeline.get("stats")
+    mean, std_dev = stats["mean"], stats["std_dev"]
 
-    fees_df = load_trade_fees(TRADE_FEES_FILE)
-    if fees_df.empty:
-        logger.error("Trade fees data unavailable. Exiting.")
-        return
-
-    # Calculate mean and std dev
-    mean = df['adjusted_discrepancy'].mean()
-    std_dev = df['adjusted_discrepancy'].std()
-
-    # Calculate profit
-    df = calculate_profit(df, fees_df)
-
-    # Backtest with weighted thresholds
+    # Backtest with weighted thresholds, one day at a time against the days before it.
+    # Days already backtested come from the result cache.
     logger.info("Backtesting with weighted thresholds...")
-    total_profit, filtered_trades = backtest_trades_with_weights(df, 3, mean, std_dev)
+    cache = ResultCache()
+    code = code_version(os.path.abspath(__file__), RISK_METRICS_FILE)
+    backtest_input = df[['time', 'adjusted_discrepancy', 'profit']]
+    prior_mean, prior_std = prior_period_stats(backtest_input)
+    backtest_input = backtest_input.assign(prior_mean=prior_mean, prior_std=prior_std)
+    # The first day has no history to fit a threshold on, so it cannot trade
+    no_history = np.isnan(prior_mean) | np.isnan(prior_std)
+    if no_history.any():
+        logger.info(f"Skipping {no_history.sum()} of {len(backtest_input)} rows without prior-day history to fit thresholds on.")
+    filtered_trades = cache.map_partitions(
+        backtest_input,
+        lambda day: backtest_trades_with_weights(day, 3, day['prior_mean'].iat[0], day['prior_std'].iat[0])[1],
+        {"step": "weighted_backtest", "threshold": 3}, code, freq=BACKTEST_FREQ,
+    )
+    total_profit = (filtered_trades['profit'] * filtered_trades['weight']).sum()
 
-    # Risk metrics
-    logger.info("Evaluating risk-adjusted returns...")
-    sharpe, sortino = evaluate_risk_metrics(filtered_trades)
+    # Risk metrics; the bootstrap only reruns when the trades change
+    def run_risk_metrics():
+        logger.info("Evaluating risk-adjusted returns...")
+        sharpe, sortino = evaluate_risk_metrics(filtered_trades)
+        return {"sharpe": sharpe, "sortino": sortino}, filtered_trades.iloc[:0]
+
+    metrics, _ = cache.get_or_compute(filtered_trades[['time', 'profit']], {"step": "risk_metrics"}, run_risk_metrics, code)
+    logger.info(
+        f"Weighted Profit: {total_profit:.2f}, Sharpe: {metrics['sharpe']:.2f}, Sortino: {metrics['sortino']:.2f} "
+        f"(out-of-sample: each day traded on thresholds fit to the days before it)"
+    )
 
     # Analyze outliers
     logger.info("Analyzing outliers...")
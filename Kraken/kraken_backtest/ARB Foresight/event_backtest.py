@@ -0,0 +1,309 @@
+import heapq
+import itertools
+import logging
+import time
+from collections import defaultdict, deque, namedtuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Event kinds, in the order they are delivered when timestamps tie
+CANDLE = 0
+TICK = 1
+ORDER_ARRIVAL = 2
+FILL = 3
+
+BUY = 1
+SELL = -1
+
+# One callback per timestamp and event kind, with arrays for every pair that updated
+EventBatch = namedtuple("EventBatch", ["time", "pair_ids", "price", "volume"])
+Fill = namedtuple("Fill", ["time", "order_id", "pair_id", "side", "price", "size", "fee", "remaining"])
+
+
+class Order:
+    """A simulated order working on the exchange."""
+
+    __slots__ = ("order_id", "pair_id", "side", "size", "remaining", "limit", "ioc", "submitted", "cancelled")
+
+    def __init__(self, order_id, pair_id, side, size, limit=None, ioc=False, submitted=0):
+        self.order_id = order_id
+        self.pair_id = pair_id
+        self.side = side
+        self.size = size
+        self.remaining = size
+        self.limit = limit
+        self.ioc = ioc
+        self.submitted = submitted
+        self.cancelled = False
+
+
+class Strategy:
+    """
+    Base class for event-driven strategies. Override the callbacks you need.
+
+    Callbacks receive the engine, which exposes submit_order/cancel_order,
+    the current time, positions and last prices.
+    """
+
+    def on_start(self, engine):
+        pass
+
+    def on_candle(self, engine, batch):
+        pass
+
+    def on_tick(self, engine, batch):
+        pass
+
+    def on_fill(self, engine, fill):
+        pass
+
+    def on_finish(self, engine):
+        pass
+
+
+class SimulatedExchange:
+    """
+    Matches orders against the latest market state of each pair.
+
+    Each candle or tick makes participation * volume of liquidity available
+    for that pair; orders larger than that fill partially and the remainder
+    keeps working on later updates unless it is IOC.
+    """
+
+    def __init__(self, n_pairs, fee=0.0026, participation=0.1):
+        self.fee = fee
+        self.participation = participation
+        self.last_price = np.full(n_pairs, np.nan)
+        self.available = np.zeros(n_pairs)
+        self.resting = defaultdict(deque)
+
+    def update(self, batch):
+        """Apply a batch of market data."""
+        self.last_price[batch.pair_ids] = batch.price
+        self.available[batch.pair_ids] = batch.volume * self.participation
+
+    def match(self, order, now):
+        """Fill as much of order as current liquidity allows; returns a Fill or None."""
+        price = self.last_price[order.pair_id]
+        if order.cancelled or np.isnan(price):
+            return None
+        if order.limit is not None and (price - order.limit) * order.side > 0:
+            return None
+        size = min(order.remaining, self.available[order.pair_id])
+        if size <= 0:
+            return None
+        self.available[order.pair_id] -= size
+        order.remaining -= size
+        return Fill(now, order.order_id, order.pair_id, order.side, price, size, price * size * self.fee, order.remaining)
+
+
+class EventEngine:
+    """
+    Event-driven backtest engine with order latency and partial fills.
+
+    Market data is grouped into one EventBatch per timestamp and kind, so a
+    strategy handles hundreds of pairs per callback. Orders reach the
+    exchange after latency and fills reach the strategy after ack_latency.
+    Both are given as pandas Timedelta strings or nanoseconds.
+    """
+
+    def __init__(self, strategy, pairs, latency="250ms", ack_latency="50ms", fee=0.0026, participation=0.1, initial_cash=0.0):
+        self.strategy = strategy
+        self.pairs = pd.Index(pairs)
+        self.latency = pd.Timedelta(latency).value
+        self.ack_latency = pd.Timedelta(ack_latency).value
+        self.exchange = SimulatedExchange(len(self.pairs), fee=fee, participation=participation)
+        self.positions = np.zeros(len(self.pairs))
+        self.cash = initial_cash
+        self.initial_cash = initial_cash
+        self.now = 0
+        self.fills = []
+        self.orders = {}
+        self.events_processed = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._order_ids = itertools.count(1)
+
+    @property
+    def last_price(self):
+        return self.exchange.last_price
+
+    def pair_id(self, pair):
+        return self.pairs.get_loc(pair)
+
+    def submit_order(self, pair_id, side, size, limit=None, ioc=False):
+        """Send an order; it reaches the exchange after the configured latency."""
+        order = Order(next(self._order_ids), pair_id, side, size, limit, ioc, self.now)
+        self.orders[order.order_id] = order
+        self._schedule(self.now + self.latency, ORDER_ARRIVAL, order)
+        return order.order_id
+
+    def cancel_order(self, order_id):
+        """Cancel the unfilled remainder of an order."""
+        order = self.orders.get(order_id)
+        if order is not None:
+            order.cancelled = True
+
+    def _schedule(self, at, kind, payload):
+        heapq.heappush(self._queue, (at, kind, next(self._seq), payload))
+
+    def _record_fill(self, fill):
+        """Book a fill on the engine ledger and schedule its acknowledgement."""
+        self.positions[fill.pair_id] += fill.side * fill.size
+        self.cash -= fill.side * fill.price * fill.size + fill.fee
+        self.fills.append(fill)
+        self._schedule(fill.time + self.ack_latency, FILL, fill)
+
+    def _arrive(self, order):
+        """An order reaches the exchange: fill what is possible, rest or drop the remainder."""
+        fill = self.exchange.match(order, self.now)
+        if fill is not None:
+            self._record_fill(fill)
+        if order.remaining > 0 and not order.cancelled:
+            if order.ioc:
+                order.cancelled = True
+            else:
+                self.exchange.resting[order.pair_id].append(order)
+
+    def _match_resting(self, pair_ids):
+        """Give resting orders on updated pairs a chance at the new liquidity."""
+        waiting = [pair_id for pair_id, resting in self.exchange.resting.items() if resting]
+        if not waiting:
+            return
+        for pair_id in np.intersect1d(waiting, pair_ids):
+            resting = self.exchange.resting[pair_id]
+            while resting:
+                order = resting[0]
+                if order.cancelled or order.remaining <= 0:
+                    resting.popleft()
+                    continue
+                fill = self.exchange.match(order, self.now)
+                if fill is None:
+                    break
+                self._record_fill(fill)
+                if order.remaining <= 0:
+                    resting.popleft()
+
+    def _drain(self, until):
+        """Process scheduled order arrivals and fill acks strictly before until."""
+        while self._queue and self._queue[0][0] < until:
+            at, kind, _, payload = heapq.heappop(self._queue)
+            self.now = at
+            self.events_processed += 1
+            if kind == ORDER_ARRIVAL:
+                self._arrive(payload)
+            else:
+                self.strategy.on_fill(self, payload)
+
+    def run(self, candles=None, ticks=None):
+        """
+        Run the strategy over candles and/or ticks.
+
+        Both inputs are long DataFrames with time, pair, price (or close) and
+        volume columns. Returns a dict with the fills, final positions, cash,
+        mark-to-market equity and event throughput.
+        """
+        times, kinds, pair_ids, prices, volumes = _build_event_arrays(self.pairs, candles, ticks)
+        boundaries = np.flatnonzero((np.diff(times) != 0) | (np.diff(kinds) != 0)) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [len(times)]))
+
+        started = time.perf_counter()
+        self.strategy.on_start(self)
+        for start, stop in zip(starts, stops):
+            if start == stop:
+                continue
+            self._drain(times[start])
+            self.now = times[start]
+            batch = EventBatch(self.now, pair_ids[start:stop], prices[start:stop], volumes[start:stop])
+            self.exchange.update(batch)
+            self._match_resting(batch.pair_ids)
+            self.events_processed += stop - start
+            if kinds[start] == CANDLE:
+                self.strategy.on_candle(self, batch)
+            else:
+                self.strategy.on_tick(self, batch)
+        self._drain(np.iinfo(np.int64).max)
+        self.strategy.on_finish(self)
+        elapsed = time.perf_counter() - started
+
+        marks = np.nan_to_num(self.exchange.last_price)
+        equity = self.cash + (self.positions * marks).sum()
+        fills = pd.DataFrame(self.fills, columns=Fill._fields)
+        fills["pair"] = self.pairs.take(fills["pair_id"].to_numpy(dtype=np.int64))
+        logger.info(f"Processed {self.events_processed} events in {elapsed:.2f}s ({self.events_processed / max(elapsed, 1e-9):.0f} events/s).")
+        return {
+            "fills": fills,
+            "positions": pd.Series(self.positions, index=self.pairs),
+            "cash": self.cash,
+            "equity": equity,
+            "profit": equity - self.initial_cash,
+            "events": self.events_processed,
+            "elapsed": elapsed,
+        }
+
+
+def _build_event_arrays(pairs, candles=None, ticks=None):
+    """Merge candle and tick frames into time-sorted typed arrays."""
+    parts = []
+    for kind, frame in ((CANDLE, candles), (TICK, ticks)):
+        if frame is None or frame.empty:
+            continue
+        price_column = "price" if "price" in frame.columns else "close"
+        parts.append((
+            pd.to_datetime(frame["time"]).values.astype("datetime64[ns]").view("int64"),
+            np.full(len(frame), kind, dtype=np.int8),
+            pairs.get_indexer(frame["pair"]).astype(np.int32),
+            frame[price_column].to_numpy(dtype=np.float64),
+            frame["volume"].to_numpy(dtype=np.float64),
+        ))
+    if not parts:
+        raise ValueError("No market data to backtest.")
+    times, kinds, pair_ids, prices, volumes = (np.concatenate(column) for column in zip(*parts))
+    known = pair_ids >= 0
+    order = np.lexsort((kinds[known], times[known]))
+    return times[known][order], kinds[known][order], pair_ids[known][order], prices[known][order], volumes[known][order]
+
+
+class ThresholdArbStrategy(Strategy):
+    """
+    Two-leg arbitrage on configured pair combinations.
+
+    When the fee-adjusted price gap between two pairs exceeds threshold, buy
+    the cheaper pair and sell the dearer one; flatten both when the gap
+    closes. Signals for all combinations are computed per batch in one step.
+    """
+
+    def __init__(self, combinations, threshold, size=1.0, fee=0.0026):
+        self.combinations = combinations
+        self.threshold = threshold
+        self.size = size
+        self.fee = fee
+        self.open = None
+
+    def on_start(self, engine):
+        ids = np.array([[engine.pair_id(a), engine.pair_id(b)] for a, b in self.combinations], dtype=np.int64).reshape(-1, 2)
+        self.leg_a, self.leg_b = ids[:, 0], ids[:, 1]
+        self.open = np.zeros(len(ids), dtype=np.int8)
+
+    def on_candle(self, engine, batch):
+        price_a = engine.last_price[self.leg_a]
+        price_b = engine.last_price[self.leg_b]
+        gap = price_b - price_a
+        adjusted = np.abs(gap) - self.fee * (price_a + price_b)
+        enter = (self.open == 0) & (adjusted > self.threshold)
+        leave = (self.open != 0) & ~(adjusted > 0)
+
+        for i in np.flatnonzero(enter):
+            direction = 1 if gap[i] > 0 else -1
+            engine.submit_order(self.leg_a[i], BUY * direction, self.size)
+            engine.submit_order(self.leg_b[i], SELL * direction, self.size)
+            self.open[i] = direction
+        for i in np.flatnonzero(leave):
+            direction = self.open[i]
+            engine.submit_order(self.leg_a[i], SELL * direction, self.size)
+            engine.submit_order(self.leg_b[i], BUY * direction, self.size)
+            self.open[i] = 0
@@ -0,0 +1,155 @@
+import logging
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Kraken volume tiers are based on trailing 30-day USD volume
+VOLUME_WINDOW = pd.Timedelta(days=30)
+# Columns holding the discrepancy before fees, in order of preference
+RAW_DISCREPANCY_COLUMNS = ("discrepancy", "raw_discrepancy")
+
+
+class FeeSchedule:
+    """
+    Volume-tiered maker/taker fee schedule for every pair, stored as arrays.
+
+    Pairs are mapped to integer IDs; tier thresholds and fee rates are kept in
+    (n_pairs, max_tiers) arrays padded with +inf thresholds, so looking up the
+    fee for millions of rows is a single fancy-indexing operation. Taker and
+    maker fees have their own volume breakpoints (maker_thresholds defaults
+    to thresholds). The current tier follows the account's rolling 30-day
+    volume.
+    """
+
+    def __init__(self, pairs, thresholds, taker, maker, maker_thresholds=None):
+        self.pairs = pd.Index(pairs)
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.maker_thresholds = self.thresholds if maker_thresholds is None else np.asarray(maker_thresholds, dtype=np.float64)
+        self.taker = np.asarray(taker, dtype=np.float64)
+        self.maker = np.asarray(maker, dtype=np.float64)
+        self.volume_30d = 0.0
+        self._volume_events = deque()
+
+    @classmethod
+    def from_tier_table(cls, tiers_df):
+        """
+        Build from a long tier table with columns Pair, FeeType, Volume, Fee%.
+        FeeType is "taker" or "maker"; Fee% is a percentage.
+        """
+        tiers_df = tiers_df.sort_values(["Pair", "Volume"])
+        pairs = tiers_df["Pair"].unique()
+        max_tiers = tiers_df.groupby(["Pair", "FeeType"]).size().max()
+
+        thresholds = {"taker": np.full((len(pairs), max_tiers), np.inf), "maker": np.full((len(pairs), max_tiers), np.inf)}
+        rates = {"taker": np.zeros((len(pairs), max_tiers)), "maker": np.zeros((len(pairs), max_tiers))}
+        pair_ids = pd.Index(pairs)
+        for (pair, fee_type), group in tiers_df.groupby(["Pair", "FeeType"], sort=False):
+            row = pair_ids.get_loc(pair)
+            count = len(group)
+            thresholds[fee_type][row, :count] = group["Volume"].to_numpy(dtype=np.float64)
+            rates[fee_type][row, :count] = group["Fee%"].to_numpy(dtype=np.float64) / 100
+            # Padding repeats the top tier so out-of-range tiers keep the best rate
+            rates[fee_type][row, count:] = rates[fee_type][row, count - 1]
+        logger.info(f"Loaded fee tiers for {len(pairs)} pairs (up to {max_tiers} tiers each).")
+        return cls(pairs, thresholds["taker"], rates["taker"], rates["maker"], thresholds["maker"])
+
+    @classmethod
+    def from_fee_table(cls, fees_df):
+        """
+        Build a single-tier schedule from the flat trade_fees.csv layout
+        (Pair, TakerFee%, MakerFee%) or the already-decimal (Pair, TakerFee, MakerFee).
+        """
+        if "TakerFee%" in fees_df.columns:
+            taker = fees_df["TakerFee%"].to_numpy(dtype=np.float64) / 100
+            maker = fees_df["MakerFee%"].to_numpy(dtype=np.float64) / 100
+        else:
+            taker = fees_df["TakerFee"].to_numpy(dtype=np.float64)
+            maker = fees_df["MakerFee"].to_numpy(dtype=np.float64)
+        thresholds = np.zeros((len(fees_df), 1))
+        return cls(fees_df["Pair"].to_numpy(), thresholds, taker[:, None], maker[:, None])
+
+    @classmethod
+    def from_asset_pairs(cls, asset_pairs):
+        """Build from the result of the AssetPairs endpoint."""
+        return cls.from_tier_table(tier_table_from_asset_pairs(asset_pairs))
+
+    def record_volume(self, time, notional):
+        """Add a trade's USD notional to the rolling 30-day volume."""
+        time = pd.Timestamp(time)
+        self._volume_events.append((time, notional))
+        self.volume_30d += notional
+        self.expire_volume(time)
+
+    def expire_volume(self, now):
+        """Drop trades older than the 30-day window."""
+        cutoff = pd.Timestamp(now) - VOLUME_WINDOW
+        while self._volume_events and self._volume_events[0][0] <= cutoff:
+            self.volume_30d -= self._volume_events.popleft()[1]
+
+    def set_volume(self, volume_30d):
+        """Override the rolling volume, e.g. with the figure from TradeVolume."""
+        self._volume_events.clear()
+        self.volume_30d = float(volume_30d)
+
+    def pair_ids(self, pairs):
+        """Map pair names to integer IDs; unknown pairs map to -1."""
+        return self.pairs.get_indexer(pd.Index(pairs))
+
+    def tier_index(self, ids, volume_30d=None, maker=False):
+        """Current taker (or maker) tier for each pair ID at the given (or tracked) 30-day volume."""
+        volume = self.volume_30d if volume_30d is None else volume_30d
+        thresholds = self.maker_thresholds if maker else self.thresholds
+        tiers = (thresholds[ids] <= volume).sum(axis=1) - 1
+        return np.maximum(tiers, 0)
+
+    def rates(self, pairs, maker=False, volume_30d=None):
+        """Decimal fee rate per row for an array of pair names (NaN for unknown pairs)."""
+        ids = self.pair_ids(pairs)
+        known = ids >= 0
+        safe_ids = np.where(known, ids, 0)
+        table = self.maker if maker else self.taker
+        # Resolve the tier once per pair, then gather per row
+        tiers = self.tier_index(np.arange(len(self.pairs)), volume_30d, maker)
+        rates = table[safe_ids, tiers[safe_ids]]
+        return np.where(known, rates, np.nan)
+
+    def apply(self, df, maker_a=False, maker_b=False, volume_30d=None):
+        """
+        Set fee_a and fee_b on both legs of every row in one vectorized call.
+        Pairs missing from the schedule get a zero fee.
+        """
+        df["fee_a"] = np.nan_to_num(self.rates(df["pair_a"], maker_a, volume_30d))
+        df["fee_b"] = np.nan_to_num(self.rates(df["pair_b"], maker_b, volume_30d))
+        return df
+
+
+def net_of_fees(df):
+    """
+    Recompute adjusted_discrepancy as the raw discrepancy less fee_a and fee_b.
+
+    adjusted_discrepancy already has fees taken out when it is written, so
+    after fees are re-priced (e.g. from the tier schedule) it is rebuilt
+    from the raw discrepancy rather than having fees subtracted a second
+    time. The raw value is discrepancy in frames from compare_pairs and
+    raw_discrepancy in older recorded comparisons. Frames with neither keep
+    their adjusted_discrepancy, with a warning that fee changes are lost.
+    """
+    raw = next((column for column in RAW_DISCREPANCY_COLUMNS if column in df.columns), None)
+    if raw is None:
+        logger.warning("No raw discrepancy column; adjusted_discrepancy keeps the fees it was written with.")
+        return df
+    df["adjusted_discrepancy"] = df[raw] - df["fee_a"] - df["fee_b"]
+    return df
+
+
+def tier_table_from_asset_pairs(asset_pairs):
+    """Flatten the fees/fees_maker tier lists of AssetPairs into a long tier table."""
+    rows = []
+    for pair, details in asset_pairs.items():
+        for fee_type, key in (("taker", "fees"), ("maker", "fees_maker")):
+            for volume, fee in details.get(key, [[0, 0]]):
+                rows.append({"Pair": pair, "FeeType": fee_type, "Volume": volume, "Fee%": fee})
+    return pd.DataFrame(rows, columns=["Pair", "FeeType", "Volume", "Fee%"])
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+kraken-arb: one entry point for the ARB Foresight workflow.
+
+    kraken-arb fetch       refresh trade_fees.csv and trade_fee_tiers.csv
+    kraken-arb compare     fetch OHLC and compare every pair combination
+    kraken-arb sync        load comparison results into arbitrage_data.db
+    kraken-arb analyze     fee-adjusted backtest and risk metrics
+    kraken-arb tune        optimize global and per-pair thresholds
+    kraken-arb backtest    run the strategy builder over the database
+    kraken-arb live        run the dynamic strategy against live prices
+    kraken-arb bench       benchmark hot paths against a saved baseline
+    kraken-arb simulate    generate synthetic market data files or streams
+    kraken-arb log         inspect, replay or record raw market logs
+
+Only argparse is imported up front; each subcommand imports its script
+(and with it pandas, aiohttp or matplotlib) when it runs, so cron jobs and
+--help start without paying for libraries they never touch. Link this file
+onto PATH as kraken-arb to use it from anywhere.
+
+--profile (or ARB_PROFILE=1) times every instrumented stage with cProfile
+and tracemalloc and writes a report under profiles/ when the run ends.
+"""
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+STRATEGY_DIRECTORY = os.path.join(DIRECTORY, "Strategy")
+KRAKEN_DIRECTORY = os.path.dirname(os.path.dirname(DIRECTORY))
+
+
+def _load(module, *paths):
+    """Import a sibling script by name, adding any extra directories it lives in."""
+    for path in (DIRECTORY, *paths):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return importlib.import_module(module)
+
+
+def _run_async(coroutine):
+    import asyncio
+
+    return asyncio.run(coroutine)
+
+
+def fetch(args):
+    return _load("kraken_get_trade_fees").main()
+
+
+def compare(args):
+    arb_foresight = _load("arb_foresight")
+    return _run_async(arb_foresight.main(
+        config_file=args.config or arb_foresight.CONFIG_FILE,
+        trade_fees_file=args.fees or arb_foresight.TRADE_FEES_FILE,
+        output_file=args.output,
+    ))
+
+
+def sync(args):
+    return _load("analyze_data").main()
+
+
+def analyze(args):
+    return _load("enhanced_analysis").main()
+
+
+def tune(args):
+    return _load("arb_backtest_tuner").main()
+
+
+def backtest(args):
+    return _load("strategy_builder", STRATEGY_DIRECTORY).main()
+
+
+def live(args):
+    return _run_async(_load("dynamic_strategy_analysis", KRAKEN_DIRECTORY).main())
+
+
+def bench(args):
+    return _load("benchmarks").main(args.extra)
+
+
+def simulate(args):
+    return _load("synthetic_market").main(args.extra)
+
+
+def log(args):
+    return _load("market_log").main(args.extra)
+
+
+# Subcommands whose options (and --help) belong to the script they run
+PASSTHROUGH = (bench, simulate, log)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="kraken-arb", description="Kraken cross-pair arbitrage toolkit.")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Logging verbosity")
+    parser.add_argument("--profile", nargs="?", const="all", metavar="MODES", help="Profile each stage (all, or a comma list of time,cpu,memory); same as ARB_PROFILE")
+    parser.add_argument("--profile-dir", help="Directory for profile reports (default: profiles/ next to the scripts)")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    commands.add_parser("fetch", help="Refresh trade fees and fee tiers from the AssetPairs endpoint").set_defaults(func=fetch)
+
+    compare_parser = commands.add_parser("compare", help="Fetch OHLC data and compare all pair combinations")
+    compare_parser.add_argument("--config", help="Path to config.json (default: next to arb_foresight.py)")
+    compare_parser.add_argument("--fees", help="Path to trade_fees.csv (default: next to arb_foresight.py)")
+    compare_parser.add_argument("--output", default="analyzed_pair_comparison_results.csv", help="CSV the analyzed rows are spilled to")
+    compare_parser.set_defaults(func=compare)
+
+    commands.add_parser("sync", help="Load comparison results into the database and chart top opportunities").set_defaults(func=sync)
+    commands.add_parser("analyze", help="Backtest opportunities after fees and bootstrap risk metrics").set_defaults(func=analyze)
+    commands.add_parser("tune", help="Optimize global and per-pair thresholds").set_defaults(func=tune)
+    commands.add_parser("backtest", help="Run the strategy builder over historical opportunities").set_defaults(func=backtest)
+    commands.add_parser("live", help="Run the dynamic strategy against real-time prices").set_defaults(func=live)
+
+    commands.add_parser("bench", add_help=False, help="Benchmark hot paths on generated data and gate on a baseline").set_defaults(func=bench)
+    commands.add_parser("simulate", add_help=False, help="Generate correlated synthetic market data as files or a stream").set_defaults(func=simulate)
+    commands.add_parser("log", add_help=False, help="Inspect, replay or record compressed market logs").set_defaults(func=log)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, args.extra = parser.parse_known_args(argv)
+    if args.extra and args.func not in PASSTHROUGH:
+        parser.error(f"unrecognized arguments: {' '.join(args.extra)}")
+    # Configured before any script is imported, so their own basicConfig calls are no-ops
+    logging.basicConfig(level=args.log_level, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.profile:
+        profiling = _load("profiling")
+        profiling.enable(profiling.parse_modes(args.profile), args.profile_dir)
+    result = args.func(args)
+    return result if isinstance(result, int) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,10 +2,12 @@ import requests
 import csv
 import os
 from datetime import datetime
+from fee_schedule import tier_table_from_asset_pairs
 
 # Directory and file path for backtesting
 directory = os.path.dirname(os.path.abspath(__file__))  # Set directory to current script location
 file_path = os.path.join(directory, "trade_fees.csv")
+tiers_file_path = os.path.join(directory, "trade_fee_tiers.csv")
 
 # Ensure directory exists
 os.makedirs(directory, exist_ok=True)
@@ -46,6 +48,10 @@ def save_fees_to_csv(data):
                 maker_fee
             ])
 
+def save_fee_tiers_to_csv(data):
+    """Save the full volume-tier fee schedule (all fees/fees_maker tiers) to a CSV file."""
+    tier_table_from_asset_pairs(data).to_csv(tiers_file_path, index=False)
+
 def main():
     print("Fetching trade pair information from Kraken API...")
     trade_data = fetch_trade_fees()
@@ -54,6 +60,8 @@ def main():
     
     print(f"Saving trade fee data to {file_path}...")
     save_fees_to_csv(trade_data)
+    print(f"Saving fee tiers to {tiers_file_path}...")
+    save_fee_tiers_to_csv(trade_data)
     print(f"Trade fees saved successfully at {datetime.now()}.")
 
 if __name__ == "__main__":
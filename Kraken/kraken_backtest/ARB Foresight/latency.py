@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import math
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tick-to-trade stages in the order a trace passes through them
+STAGES = ("receive", "decode", "detect", "size", "submit", "ack")
+TOTAL = "tick_to_trade"
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+SUMMARY_INTERVAL = 60.0
+METRIC_NAME = "arb_stage_latency_seconds"
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of nanosecond latencies.
+
+    Values below 2 ** sub_bucket_bits are counted exactly; above that each
+    power of two is split into half as many linear sub-buckets, so every
+    recorded value keeps significant_digits of precision (about 0.1% for
+    the default 3) with a fixed, small counts array and O(1) recording.
+    Values above highest are clamped into the last bucket.
+    """
+
+    def __init__(self, highest=60 * 10 ** 9, significant_digits=3):
+        self.sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.half_count = self.sub_bucket_count // 2
+        self.highest = int(highest)
+        # A plain list: incrementing it is several times cheaper than a numpy scalar update
+        self.counts = [0] * (self._index(self.highest) + 1)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + ((value >> shift) - self.half_count)
+
+    def _highest_equivalent(self, index):
+        """Largest value that lands in bucket index."""
+        if index < self.sub_bucket_count:
+            return index
+        shift, sub = divmod(index - self.sub_bucket_count, self.half_count)
+        return ((sub + self.half_count + 1) << (shift + 1)) - 1
+
+    def record(self, value, count=1):
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, quantile):
+        """Value at or below which quantile (0..1) of the recorded values fall."""
+        if self.total == 0:
+            return math.nan
+        rank = max(math.ceil(quantile * self.total), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self._highest_equivalent(index), self.max)
+
+    def percentiles(self, quantiles=SUMMARY_QUANTILES):
+        if self.total == 0:
+            return {quantile: math.nan for quantile in quantiles}
+        cumulative = np.cumsum(self.counts)
+        ranks = np.maximum(np.ceil(np.asarray(quantiles) * self.total), 1)
+        indices = np.searchsorted(cumulative, ranks)
+        return {quantile: min(self._highest_equivalent(int(index)), self.max) for quantile, index in zip(quantiles, indices)}
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else math.nan
+
+    def merge(self, other):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.sum += other.sum
+        if other.total:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.total = self.sum = 0
+        self.min = self.max = None
+
+
+class Trace:
+    """
+    Monotonic stamps of one event as it moves through the stages.
+
+    origin_ns is when the event happened (e.g. a candle close mapped onto
+    the monotonic clock). Each mark records the time since the previous
+    stamp into that stage's histogram. finish() records the end-to-end
+    tick-to-trade latency up to the last stage that was marked, so a path
+    that stops early (the paper path ends at size) is still counted.
+    """
+
+    __slots__ = ("recorder", "origin_ns", "last_ns", "stamps", "finished")
+
+    def __init__(self, recorder, origin_ns=None):
+        self.recorder = recorder
+        self.origin_ns = time.monotonic_ns() if origin_ns is None else origin_ns
+        self.last_ns = self.origin_ns
+        self.stamps = {}
+        self.finished = False
+
+    def mark(self, stage, at_ns=None):
+        at_ns = time.monotonic_ns() if at_ns is None else at_ns
+        self.recorder.record(stage, at_ns - self.last_ns)
+        self.stamps[stage] = self.last_ns = at_ns
+
+    def finish(self):
+        """Record tick-to-trade from the origin to the last mark; later calls do nothing."""
+        if not self.finished and self.stamps:
+            self.recorder.record(TOTAL, self.last_ns - self.origin_ns)
+        self.finished = True
+
+    def mark_orders(self, orders):
+        """Mark submit when the first leg left and ack when the last acknowledgement arrived."""
+        sent = [order.sent_ns for order in orders if order.sent_ns is not None]
+        acked = [order.acked_ns for order in orders if order.acked_ns is not None]
+        if sent:
+            self.mark("submit", min(sent))
+        if acked:
+            self.mark("ack", max(acked))
+
+    def branch(self):
+        """A copy sharing the stamps so far, for events that fan out (e.g. several candles in one poll)."""
+        child = Trace(self.recorder, self.origin_ns)
+        child.last_ns = self.last_ns
+        child.stamps = dict(self.stamps)
+        child.finished = self.finished
+        return child
+
+
+def wall_to_monotonic_ns(epoch_seconds):
+    """Map a wall-clock time onto the monotonic clock, e.g. to start a trace at a candle close."""
+    return time.monotonic_ns() - (time.time_ns() - int(epoch_seconds * 1e9))
+
+
+class LatencyRecorder:
+    """Per-stage latency histograms with Prometheus-text and log summaries."""
+
+    def __init__(self, stages=STAGES, highest=60 * 10 ** 9):
+        self.stages = tuple(stages)
+        self.highest = highest
+        self.histograms = {}
+
+    def histogram(self, name):
+        if name not in self.histograms:
+            self.histograms[name] = LatencyHistogram(self.highest)
+        return self.histograms[name]
+
+    def record(self, name, value_ns):
+        self.histogram(name).record(value_ns)
+
+    def trace(self, origin_ns=None):
+        return Trace(self, origin_ns)
+
+    def _ordered(self):
+        known = [name for name in (*self.stages, TOTAL) if name in self.histograms]
+        return known + sorted(set(self.histograms) - set(known))
+
+    def summary(self, quantiles=SUMMARY_QUANTILES):
+        """One line per stage with count and quantiles in milliseconds."""
+        lines = []
+        for name in self._ordered():
+            histogram = self.histograms[name]
+            if not histogram.total:
+                continue
+            values = histogram.percentiles(quantiles)
+            quantile_text = " ".join(f"p{quantile * 100:g}={value / 1e6:.3f}" for quantile, value in values.items())
+            lines.append(f"{name}: n={histogram.total} {quantile_text} max={histogram.max / 1e6:.3f} ms")
+        return lines
+
+    def prometheus(self, quantiles=SUMMARY_QUANTILES):
+        """Prometheus text exposition of every histogram as a summary in seconds."""
+        lines = [
+            f"# HELP {METRIC_NAME} Latency of each tick-to-trade stage.",
+            f"# TYPE {METRIC_NAME} summary",
+        ]
+        for name in self._ordered():
+            histogram = self.histograms[name]
+            for quantile, value in histogram.percentiles(quantiles).items():
+                lines.append(f'{METRIC_NAME}{{stage="{name}",quantile="{quantile:g}"}} {value / 1e9:.9f}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{name}"}} {histogram.sum / 1e9:.9f}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{name}"}} {histogram.total}')
+        return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(recorder, host="127.0.0.1", port=9108):
+    """Serve recorder.prometheus() at http://host:port/metrics; returns the aiohttp runner to clean up."""
+    from aiohttp import web
+
+    async def metrics(request):
+        return web.Response(text=recorder.prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving latency metrics at http://{host}:{port}/metrics")
+    return runner
+
+
+async def log_summaries(recorder, interval=SUMMARY_INTERVAL):
+    """Log recorder.summary() every interval seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        for line in recorder.summary():
+            logger.info(f"Latency {line}")
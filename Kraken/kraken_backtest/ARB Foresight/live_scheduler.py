@@ -0,0 +1,372 @@
+import asyncio
+import inspect
+import json
+import logging
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from latency import LatencyRecorder, wall_to_monotonic_ns
+from rolling_stats import DEFAULT_HALFLIFE, _ewm_step, ewm_zscores
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://api.kraken.com"
+# Candle intervals (minutes) served by the OHLC endpoint
+OHLC_INTERVALS = (1, 5, 15, 30, 60, 240, 1440, 10080, 21600)
+# Kraken commits a candle shortly after it closes
+SETTLE_DELAY = 2.0
+LATENCY_BUDGET = 20.0
+# Share of the budget fetching may use; the rest is reserved for evaluation
+FETCH_BUDGET_FRACTION = 0.8
+DEFAULT_CONCURRENCY = 10
+
+Market = namedtuple("Market", ["time", "closes", "volumes", "fees"])
+Snapshot = namedtuple("Snapshot", ["time", "ids", "discrepancy", "mean", "std", "zscore"])
+
+
+def next_boundary(now, interval_seconds):
+    """First multiple of interval_seconds strictly after now (epoch seconds)."""
+    return (math.floor(now / interval_seconds) + 1) * interval_seconds
+
+
+class CandleScheduler:
+    """
+    Wake on candle boundaries of every configured interval.
+
+    Each wake-up (SETTLE_DELAY after the boundary) calls
+    on_candle(boundary, intervals) with the intervals whose candle just
+    closed. A cycle that overruns simply skips the boundaries it missed;
+    feeds track their own cursors, so the next cycle picks up the skipped
+    candles.
+    """
+
+    def __init__(self, intervals, settle=SETTLE_DELAY, clock=time.time):
+        unsupported = sorted(set(intervals) - set(OHLC_INTERVALS))
+        if unsupported:
+            raise ValueError(f"Unsupported OHLC intervals {unsupported}; choose from {OHLC_INTERVALS}")
+        self.intervals = sorted(set(intervals))
+        self.settle = settle
+        self.clock = clock
+
+    def next_wakeup(self, now):
+        """The next boundary and the intervals that close on it."""
+        boundaries = {interval: next_boundary(now - self.settle, interval * 60) for interval in self.intervals}
+        boundary = min(boundaries.values())
+        return boundary, [interval for interval, due in boundaries.items() if due == boundary]
+
+    async def run(self, on_candle, stop=None):
+        stop = stop or asyncio.Event()
+        previous = -math.inf
+        while not stop.is_set():
+            # A timer that fires a hair early must not replay the same boundary
+            boundary, intervals = self.next_wakeup(max(self.clock(), previous + self.settle))
+            delay = boundary + self.settle - self.clock()
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=max(delay, 0))
+                break
+            except asyncio.TimeoutError:
+                pass
+            await on_candle(boundary, intervals)
+            previous = boundary
+
+
+class OhlcFeed:
+    """
+    Incremental OHLC polling for one interval over a fixed pair universe.
+
+    Each pair keeps a cursor at its last closed candle, so every poll asks
+    only for newer candles and drops the still-open one. The first poll
+    seeds cursors with the latest closed candle; older history is expected
+    to come from the database warm start.
+    """
+
+    def __init__(self, session, pairs, interval, base_url=BASE_URL, concurrency=DEFAULT_CONCURRENCY, latency=None, recorder=None):
+        self.session = session
+        self.latency = latency
+        self.recorder = recorder
+        self.pairs = list(pairs)
+        self.interval = interval
+        self.url = f"{base_url}/0/public/OHLC"
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cursors = {}
+
+    async def _fetch(self, pair, boundary):
+        params = {"pair": pair, "interval": self.interval}
+        if pair in self.cursors:
+            params["since"] = self.cursors[pair]
+        async with self.semaphore:
+            started = time.monotonic_ns()
+            async with self.session.get(self.url, params=params) as response:
+                body = await response.read()
+            if self.latency is not None:
+                self.latency.record("fetch", time.monotonic_ns() - started)
+        if self.recorder is not None:
+            self.recorder.record(f"ohlc/{self.interval}/{pair}", body)
+        return self._decode(pair, json.loads(body), boundary)
+
+    def _decode(self, pair, data, boundary):
+        """Closed candles of one OHLC response that are newer than the pair's cursor."""
+        if data.get("error"):
+            raise RuntimeError(", ".join(data["error"]))
+        rows = next((value for key, value in data.get("result", {}).items() if key != "last"), [])
+        closed = [row for row in rows if int(row[0]) + self.interval * 60 <= boundary]
+        if pair in self.cursors:
+            return pair, [row for row in closed if int(row[0]) > self.cursors[pair]]
+        return pair, closed[-1:]
+
+    async def poll(self, boundary, timeout):
+        """
+        New closed candles per pair, fetched concurrently within timeout seconds.
+
+        Pairs that fail or do not answer in time keep their cursor and are
+        caught up on a later poll. Returns ({pair: rows}, number of misses).
+        """
+        tasks = [asyncio.create_task(self._fetch(pair, boundary)) for pair in self.pairs]
+        done, pending = await asyncio.wait(tasks, timeout=max(timeout, 0))
+        for task in pending:
+            task.cancel()
+        candles = {}
+        misses = len(pending)
+        for task in done:
+            if task.exception() is not None:
+                logger.debug(f"OHLC poll failed: {task.exception()}")
+                misses += 1
+                continue
+            pair, rows = task.result()
+            if rows:
+                candles[pair] = rows
+                self.cursors[pair] = int(rows[-1][0])
+        return candles, misses
+
+
+class ReplayFeed(OhlcFeed):
+    """OhlcFeed that answers polls from recorded responses (see market_log.replay_live) instead of the network."""
+
+    def __init__(self, session, pairs, interval, **kwargs):
+        super().__init__(session, pairs, interval, **kwargs)
+        self.responses = {}
+
+    def load(self, responses):
+        """Raw response bodies, by pair, for the next poll."""
+        self.responses = responses
+
+    async def _fetch(self, pair, boundary):
+        if pair not in self.responses:
+            raise LookupError(f"No recorded OHLC response for {pair}")
+        return self._decode(pair, json.loads(self.responses[pair]), boundary)
+
+
+class PairStatistics:
+    """
+    Time-decayed EWMA statistics of every pair combination, held as arrays.
+
+    Combination k is (pairs[first[k]], pairs[second[k]]) in upper-triangle
+    order, so a candle updates the whole universe with one vectorized
+    _ewm_step: the same recursion ewm_zscores and ZScoreEngine use.
+    """
+
+    def __init__(self, pairs, halflife=DEFAULT_HALFLIFE):
+        self.pairs = pd.Index(pairs)
+        self.halflife = halflife
+        self.decay_rate = math.log(2) / pd.Timedelta(halflife).value
+        self.first, self.second = np.triu_indices(len(self.pairs), k=1)
+        size = len(self.first)
+        self.mean = np.zeros(size)
+        self.var = np.zeros(size)
+        self.last = np.zeros(size, dtype=np.int64)
+        self.seen = np.zeros(size, dtype=bool)
+
+    def combination_ids(self, pair_a, pair_b):
+        """Combination index of each (pair_a, pair_b), in either order; -1 if a pair is unknown."""
+        a = self.pairs.get_indexer(pair_a)
+        b = self.pairs.get_indexer(pair_b)
+        i, j = np.minimum(a, b), np.maximum(a, b)
+        n = len(self.pairs)
+        return np.where((a >= 0) & (b >= 0) & (a != b), i * n - i * (i + 1) // 2 + (j - i - 1), -1)
+
+    def warm(self, history, value_column="adjusted_discrepancy"):
+        """Start every combination from its EWMA state at the end of history. Returns combinations warmed."""
+        if history.empty:
+            return 0
+        ordered = history.sort_values("time", kind="stable")
+        scores = ewm_zscores(ordered, self.halflife, value_column)
+        last = ordered.assign(ewm_mean=scores["ewm_mean"], ewm_var=scores["ewm_std"] ** 2)
+        last = last.assign(combination=self.combination_ids(last["pair_a"], last["pair_b"]))
+        # Both orientations of a combination map to one slot; the latest state wins
+        last = last[last["combination"] >= 0].drop_duplicates("combination", keep="last")
+        ids = last["combination"].to_numpy()
+        self.mean[ids] = last["ewm_mean"].to_numpy()
+        self.var[ids] = last["ewm_var"].to_numpy()
+        self.last[ids] = last["time"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        self.seen[ids] = True
+        return len(ids)
+
+    def update(self, market):
+        """Step every combination whose two pairs both have a close in market; returns a Snapshot."""
+        time_ns = pd.Timestamp(market.time).value
+        valid = ~np.isnan(market.closes)
+        ids = np.flatnonzero(valid[self.first] & valid[self.second])
+        a, b = self.first[ids], self.second[ids]
+        value = np.abs(market.closes[a] - market.closes[b]) - market.fees[a] - market.fees[b]
+
+        seen = self.seen[ids]
+        elapsed = np.where(seen, time_ns - self.last[ids], 0)
+        mean, var = _ewm_step(self.mean[ids], self.var[ids], value, elapsed, self.decay_rate)
+        mean = np.where(seen, mean, value)
+        var = np.where(seen, var, 0.0)
+        self.mean[ids], self.var[ids] = mean, var
+        self.last[ids] = time_ns
+        self.seen[ids] = True
+
+        std = np.sqrt(var)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            zscore = np.where(std > 0, (value - mean) / std, np.nan)
+        return Snapshot(market.time, ids, value, mean, std, zscore)
+
+    def to_frame(self, snapshot, rows, market):
+        """Materialize the selected snapshot rows as opportunity records."""
+        ids = snapshot.ids[rows]
+        a, b = self.first[ids], self.second[ids]
+        return pd.DataFrame({
+            "time": market.time,
+            "pair_a": self.pairs[a],
+            "pair_b": self.pairs[b],
+            "close_a": market.closes[a],
+            "close_b": market.closes[b],
+            "volume_a": market.volumes[a],
+            "fee_a": market.fees[a],
+            "fee_b": market.fees[b],
+            "adjusted_discrepancy": snapshot.discrepancy[rows],
+            "ewm_mean": snapshot.mean[rows],
+            "ewm_std": snapshot.std[rows],
+            "ewm_zscore": snapshot.zscore[rows],
+        })
+
+
+class ZScoreStrategy:
+    """Signal every combination whose discrepancy is more than k EWMA deviations above its mean."""
+
+    def __init__(self, k=2):
+        self.k = k
+
+    def __call__(self, stats, snapshot, market):
+        return stats.to_frame(snapshot, np.flatnonzero(snapshot.zscore > self.k), market)
+
+
+def candle_markets(candles, pairs, fees):
+    """Group {pair: OHLC rows} into one Market per candle time, in time order."""
+    if not candles:
+        return []
+    pair_ids = pairs.get_indexer(list(candles))
+    lengths = [len(rows) for rows in candles.values()]
+    rows = np.array([row[:7] for pair_rows in candles.values() for row in pair_rows], dtype=np.float64)
+    ids = np.repeat(pair_ids, lengths)
+    times = rows[:, 0].astype(np.int64)
+    markets = []
+    for candle_time in np.unique(times):
+        at = times == candle_time
+        closes = np.full(len(pairs), np.nan)
+        volumes = np.zeros(len(pairs))
+        closes[ids[at]] = rows[at, 4]
+        volumes[ids[at]] = rows[at, 6]
+        markets.append(Market(pd.Timestamp(candle_time, unit="s"), closes, volumes, fees))
+    return markets
+
+
+class LiveRunner:
+    """
+    Candle-driven evaluation of strategies over the full pair universe.
+
+    Every due interval is polled incrementally, its statistics are stepped
+    once per new candle and each strategy returns a frame of signals that
+    is handed to on_signals(interval, signals, trace), which may be a
+    coroutine. A cycle has latency_budget seconds from its wake-up: polling
+    gets FETCH_BUDGET_FRACTION of it, and strategies that would start after
+    the deadline are skipped for that candle.
+
+    Each cycle is traced from the candle close: receive, decode and detect
+    are stamped here; the callback continues the trace as far as it goes
+    (size, then submit and ack when orders are sent). Once the callback
+    returns, tick-to-trade is recorded up to its last stamp.
+
+    With a recorder (a market_log.MarketLogWriter) the runner logs its
+    pairs and fees, every raw OHLC response and one cycle record per
+    wake-up, which is enough to replay the session exactly. The recorder
+    only writes a block at the end of each cycle, after its signals.
+    """
+
+    def __init__(self, session, pairs, intervals, taker_fees, strategies, on_signals, halflife=DEFAULT_HALFLIFE,
+                 latency_budget=LATENCY_BUDGET, concurrency=DEFAULT_CONCURRENCY, history=None, latency=None,
+                 recorder=None, feed_class=OhlcFeed):
+        self.pairs = pd.Index(pairs)
+        self.fees = pd.Series(taker_fees).reindex(self.pairs).fillna(0).to_numpy(dtype=np.float64)
+        self.strategies = list(strategies)
+        self.on_signals = on_signals
+        self.latency_budget = latency_budget
+        self.latency = latency or LatencyRecorder()
+        self.recorder = recorder
+        self.feeds = {
+            interval: feed_class(session, self.pairs, interval, concurrency=concurrency, latency=self.latency, recorder=recorder)
+            for interval in intervals
+        }
+        if recorder is not None:
+            # Polls record responses on the event loop; blocks are compressed in on_candle once signals are out
+            recorder.auto_flush = False
+            recorder.record("meta", json.dumps({
+                "pairs": list(self.pairs),
+                "intervals": list(intervals),
+                "taker_fees": dict(zip(self.pairs, self.fees.tolist())),
+                "halflife": str(halflife),
+            }))
+        self.stats = {interval: PairStatistics(self.pairs, halflife) for interval in intervals}
+        if history is not None and self.stats:
+            # Decay is in wall-clock time, so one warm start serves every interval
+            first, *others = self.stats.values()
+            warmed = first.warm(history)
+            for stats in others:
+                stats.mean, stats.var, stats.last, stats.seen = first.mean.copy(), first.var.copy(), first.last.copy(), first.seen.copy()
+            logger.info(f"Warmed statistics for {warmed} of {len(first.first)} pair combinations.")
+
+    async def on_candle(self, boundary, intervals):
+        started = time.monotonic()
+        deadline = started + self.latency_budget
+        polls = await asyncio.gather(*(self.feeds[interval].poll(boundary, self.latency_budget * FETCH_BUDGET_FRACTION) for interval in intervals))
+        received_ns = time.monotonic_ns()
+        if self.recorder is not None:
+            self.recorder.record("cycle", json.dumps({"boundary": boundary, "intervals": list(intervals)}))
+        for interval, (candles, misses) in zip(intervals, polls):
+            signal_count = 0
+            trace = self.latency.trace(wall_to_monotonic_ns(boundary))
+            trace.mark("receive", received_ns)
+            markets = candle_markets(candles, self.pairs, self.fees)
+            trace.mark("decode")
+            for market in markets:
+                market_trace = trace.branch()
+                snapshot = self.stats[interval].update(market)
+                for strategy in self.strategies:
+                    if time.monotonic() > deadline:
+                        logger.warning(f"Latency budget exhausted; skipped {strategy.__class__.__name__} for the {interval}m candle at {market.time}.")
+                        continue
+                    signals = strategy(self.stats[interval], snapshot, market)
+                    signal_trace = market_trace.branch()
+                    signal_trace.mark("detect")
+                    signal_count += len(signals)
+                    if not signals.empty:
+                        result = self.on_signals(interval, signals, signal_trace)
+                        if inspect.isawaitable(result):
+                            await result
+                        signal_trace.finish()
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"{interval}m cycle at {pd.Timestamp(boundary, unit='s')}: {len(candles)} of {len(self.pairs)} pairs updated "
+                f"({misses} missed), {signal_count} signals, {elapsed * 1000:.0f} ms."
+            )
+            if elapsed > self.latency_budget:
+                logger.warning(f"{interval}m cycle overran its {self.latency_budget:.1f}s latency budget.")
+        if self.recorder is not None:
+            # Compressing the cycle's block waits until its signals are out
+            self.recorder.flush()
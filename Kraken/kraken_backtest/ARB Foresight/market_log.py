@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Append-only, compressed logs of raw market messages, and their replay.
+
+    python market_log.py info recordings/market-20250101-000000.arblog
+    python market_log.py replay LOG --speed 0 --output signals.csv
+    python market_log.py replay LOG --speed 0 --expect signals.csv
+    python market_log.py record-synthetic --duration 86400 day.arblog
+
+The live runner records every raw OHLC response with its receive time,
+plus one cycle record per candle it evaluated. Replaying that log through
+a LiveRunner whose feeds answer from the log reproduces the detector's
+inputs exactly, in real time, N times faster or as fast as possible.
+--expect turns a replay into a regression test against saved signals.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import namedtuple
+
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ARBLOG1\n"
+# Block header: raw length, compressed length, record count, crc32, earliest and latest receive time (ns).
+# Records decode from the earliest time, so a reader can skip blocks by either bound.
+BLOCK_HEADER = struct.Struct("<IIIIqq")
+BLOCK_BYTES = 1 << 20
+COMPRESSION_LEVEL = 6
+# Sources with a meaning of their own; everything else is a raw message
+META_SOURCE = "meta"
+CYCLE_SOURCE = "cycle"
+# Replays yield to the event loop this often when running as fast as possible
+YIELD_EVERY = 1000
+PACING_SLACK = 0.002
+
+Record = namedtuple("Record", ["time_ns", "source", "payload"])
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(buffer, position):
+    value = shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+def _common_prefix(a, b):
+    """Length of the common prefix of two byte strings, by binary search over slice comparisons."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:] == b[len(b) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class MarketLogWriter:
+    """
+    Append records to a market log in independently compressed blocks.
+
+    Within a block every record stores its receive time as a delta from the
+    previous record and its payload as the prefix and suffix it shares with
+    the previous payload of the same source plus the bytes in between, so
+    repeated messages from one feed cost a few bytes before compression.
+    A block is zlib-compressed and written once it holds block_bytes, on
+    flush() and on close(). With auto_flush False only flush() and close()
+    write, for callers that must not compress in the middle of latency-bound
+    work (LiveRunner flushes once per cycle, after its signals). A torn block at the end of the file (a crash
+    mid-write) is cut off when the log is reopened for appending.
+    """
+
+    def __init__(self, path, block_bytes=BLOCK_BYTES, level=COMPRESSION_LEVEL, auto_flush=True):
+        self.path = path
+        self.block_bytes = block_bytes
+        self.auto_flush = auto_flush
+        self.level = level
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        end = _valid_end(path) if os.path.exists(path) and os.path.getsize(path) else 0
+        self.file = open(path, "r+b" if end else "wb")
+        if end:
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file.write(MAGIC)
+        self.records = 0
+        self.raw_bytes = 0
+        self._reset()
+
+    def _reset(self):
+        self._buffer = bytearray()
+        self._count = 0
+        self._sources = {}
+        self._previous = {}
+        self._first_ns = self._last_ns = self._earliest_ns = self._latest_ns = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, source, payload, time_ns=None):
+        """Append one message; payload is bytes or str, time_ns defaults to now."""
+        time_ns = time.time_ns() if time_ns is None else int(time_ns)
+        payload = payload.encode() if isinstance(payload, str) else bytes(payload)
+        if self._first_ns is None:
+            self._first_ns = self._last_ns = self._earliest_ns = self._latest_ns = time_ns
+
+        buffer = self._buffer
+        buffer += _varint(_zigzag(time_ns - self._last_ns))
+        source_id = self._sources.get(source)
+        if source_id is None:
+            source_id = self._sources[source] = len(self._sources)
+            name = source.encode()
+            buffer += _varint(source_id) + _varint(len(name)) + name
+        else:
+            buffer += _varint(source_id)
+        previous = self._previous.get(source_id, b"")
+        prefix = _common_prefix(previous, payload)
+        suffix = _common_suffix(previous, payload, min(len(previous), len(payload)) - prefix)
+        middle = payload[prefix:len(payload) - suffix]
+        buffer += _varint(prefix) + _varint(suffix) + _varint(len(middle)) + middle
+        self._previous[source_id] = payload
+
+        self._last_ns = time_ns
+        self._earliest_ns = min(self._earliest_ns, time_ns)
+        self._latest_ns = max(self._latest_ns, time_ns)
+        self._count += 1
+        self.records += 1
+        self.raw_bytes += len(payload)
+        if self.auto_flush and len(buffer) >= self.block_bytes:
+            self.flush()
+
+    def flush(self):
+        """Compress and write the buffered records as one block."""
+        if not self._count:
+            return
+        buffer = self._buffer
+        if self._earliest_ns != self._first_ns:
+            # The clock went back within the block: rebase the first record's delta (a zero byte) on the earliest time
+            buffer = _varint(_zigzag(self._first_ns - self._earliest_ns)) + buffer[1:]
+        compressed = zlib.compress(bytes(buffer), self.level)
+        header = BLOCK_HEADER.pack(len(buffer), len(compressed), self._count, zlib.crc32(compressed), self._earliest_ns, self._latest_ns)
+        self.file.write(header + compressed)
+        self.file.flush()
+        self._reset()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def _valid_end(path):
+    """Offset just past the last intact block of an existing log."""
+    reader = MarketLogReader(path)
+    end = len(MAGIC)
+    for offset, header in reader.blocks():
+        end = offset + BLOCK_HEADER.size + header[1]
+    return end
+
+
+class MarketLogReader:
+    """Sequential reader of a market log; iterating yields Records in write order."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a market log")
+
+    def blocks(self):
+        """(offset, header) of every intact block; stops at a torn or corrupt tail."""
+        with open(self.path, "rb") as file:
+            offset = len(MAGIC)
+            file.seek(offset)
+            while True:
+                raw = file.read(BLOCK_HEADER.size)
+                if len(raw) < BLOCK_HEADER.size:
+                    return
+                header = BLOCK_HEADER.unpack(raw)
+                data = file.read(header[1])
+                if len(data) < header[1] or zlib.crc32(data) != header[3]:
+                    logger.warning(f"Ignoring a torn block at offset {offset} of {self.path}.")
+                    return
+                yield offset, header
+                offset += BLOCK_HEADER.size + header[1]
+
+    def __iter__(self):
+        return self.read()
+
+    def read(self, start_ns=None, end_ns=None):
+        """Records received in [start_ns, end_ns); blocks entirely outside the range are not decompressed."""
+        with open(self.path, "rb") as file:
+            for offset, header in self.blocks():
+                raw_length, compressed_length, count, _, first_ns, latest_ns = header
+                if (start_ns is not None and latest_ns < start_ns) or (end_ns is not None and first_ns >= end_ns):
+                    continue
+                file.seek(offset + BLOCK_HEADER.size)
+                for record in self._decode(zlib.decompress(file.read(compressed_length)), count, first_ns):
+                    if (start_ns is None or record.time_ns >= start_ns) and (end_ns is None or record.time_ns < end_ns):
+                        yield record
+
+    @staticmethod
+    def _decode(buffer, count, first_ns):
+        sources = []
+        previous = {}
+        position = 0
+        time_ns = first_ns
+        for _ in range(count):
+            delta, position = _read_varint(buffer, position)
+            time_ns += _unzigzag(delta)
+            source_id, position = _read_varint(buffer, position)
+            if source_id == len(sources):
+                length, position = _read_varint(buffer, position)
+                sources.append(buffer[position:position + length].decode())
+                position += length
+            prefix, position = _read_varint(buffer, position)
+            suffix, position = _read_varint(buffer, position)
+            length, position = _read_varint(buffer, position)
+            last = previous.get(source_id, b"")
+            payload = last[:prefix] + buffer[position:position + length] + (last[len(last) - suffix:] if suffix else b"")
+            position += length
+            previous[source_id] = payload
+            yield Record(time_ns, sources[source_id], payload)
+
+    def summary(self):
+        """Blocks, records, compressed and raw sizes and the time span of the log."""
+        blocks = list(self.blocks())
+        return {
+            "blocks": len(blocks),
+            "records": sum(header[2] for _, header in blocks),
+            "compressed_bytes": os.path.getsize(self.path),
+            "encoded_bytes": sum(header[0] for _, header in blocks),
+            "first": pd.Timestamp(blocks[0][1][4], unit="ns") if blocks else None,
+            "last": pd.Timestamp(blocks[-1][1][5], unit="ns") if blocks else None,
+        }
+
+
+async def replay(records, speed=None):
+    """
+    Yield records paced by their receive times.
+
+    speed=1 replays in real time, speed=N N times faster, and None (or 0)
+    as fast as the consumer takes them.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    first_ns = None
+    for count, record in enumerate(records, 1):
+        if speed:
+            if first_ns is None:
+                first_ns = record.time_ns
+            ahead = started + (record.time_ns - first_ns) / 1e9 / speed - loop.time()
+            if ahead > PACING_SLACK:
+                await asyncio.sleep(ahead)
+        elif count % YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+        yield record
+
+
+async def replay_live(path, strategies, on_signals, speed=None, history=None):
+    """
+    Drive a LiveRunner from a recorded log; returns the runner.
+
+    OHLC responses are handed to the runner's feeds and every cycle record
+    runs on_candle for the boundary it recorded, so the statistics and
+    strategies see exactly what the live process saw. Without the live
+    run's warm-start history the statistics start cold.
+    """
+    from latency import LatencyRecorder
+    from live_scheduler import LiveRunner, ReplayFeed
+
+    records = replay(MarketLogReader(path), speed)
+    meta = None
+    async for record in records:
+        if record.source == META_SOURCE:
+            meta = json.loads(record.payload)
+            break
+    if meta is None:
+        raise ValueError(f"{path} has no live runner metadata")
+    runner = LiveRunner(
+        None, meta["pairs"], meta["intervals"], meta["taker_fees"], strategies, on_signals,
+        halflife=meta["halflife"], latency_budget=float("inf"), history=history,
+        latency=LatencyRecorder(), feed_class=ReplayFeed,
+    )
+    responses = {interval: {} for interval in runner.feeds}
+    cycles = 0
+    async for record in records:
+        if record.source == CYCLE_SOURCE:
+            cycle = json.loads(record.payload)
+            for interval in cycle["intervals"]:
+                runner.feeds[interval].load(responses[interval])
+                responses[interval] = {}
+            await runner.on_candle(cycle["boundary"], cycle["intervals"])
+            cycles += 1
+        elif record.source.startswith("ohlc/"):
+            _, interval, pair = record.source.split("/", 2)
+            responses.setdefault(int(interval), {})[pair] = record.payload
+    logger.info(f"Replayed {cycles} cycles from {path}.")
+    return runner
+
+
+def record_synthetic(path, universe, duration, seed=42, step=1.0, channels=None):
+    """Record a synthetic market's WebSocket messages, timestamped with simulated time."""
+    from synthetic_market import DEFAULT_CHANNELS, SyntheticMarket
+
+    market = SyntheticMarket(universe, seed=seed, step=step)
+    channels = channels or DEFAULT_CHANNELS
+    with MarketLogWriter(path) as writer:
+        while market.elapsed < duration:
+            messages = market.events(channels)
+            time_ns = int(market.time * 1e9)
+            for channel, i, message in messages:
+                writer.record(f"ws/{channel}/{market.pairs[i]}", message, time_ns)
+    return writer.records, writer.raw_bytes
+
+
+def _info(args):
+    summary = MarketLogReader(args.log).summary()
+    raw = sum(len(record.payload) for record in MarketLogReader(args.log))
+    logger.info(
+        f"{args.log}: {summary['records']} records in {summary['blocks']} blocks from {summary['first']} to {summary['last']}; "
+        f"{raw / 2 ** 20:.1f} MB of messages stored in {summary['compressed_bytes'] / 2 ** 20:.1f} MB "
+        f"(x{raw / max(summary['compressed_bytes'], 1):.1f})."
+    )
+    return 0
+
+
+def _replay(args):
+    started = time.perf_counter()
+    reader = MarketLogReader(args.log)
+    has_meta = next((record.source == META_SOURCE for record in reader), False)
+    if not has_meta:
+        async def drain():
+            count = 0
+            async for record in replay(reader, args.speed):
+                json.loads(record.payload)
+                count += 1
+            return count
+        count = asyncio.run(drain())
+        elapsed = time.perf_counter() - started
+        logger.info(f"Replayed {count} messages in {elapsed:.1f} s ({count / elapsed:,.0f} msg/s).")
+        return 0
+
+    from live_scheduler import ZScoreStrategy
+
+    history = None
+    if args.db:
+        from pipeline import build_pipeline
+        history = build_pipeline(args.db).get("load").dropna(subset=["pair_a", "pair_b", "adjusted_discrepancy"])
+        history = history if not history.empty else None
+    signals = []
+    runner = asyncio.run(replay_live(args.log, [ZScoreStrategy(k=args.k)], lambda interval, frame, trace: signals.append(frame.assign(interval=interval)), args.speed, history))
+    result = pd.concat(signals, ignore_index=True) if signals else pd.DataFrame()
+    logger.info(f"Replay produced {len(result)} signals in {time.perf_counter() - started:.1f} s.")
+    for line in runner.latency.summary():
+        logger.info(f"Latency {line}")
+    if args.output:
+        result.to_csv(args.output, index=False)
+        logger.info(f"Signals written to {args.output}")
+    if args.expect:
+        expected = pd.read_csv(args.expect, parse_dates=["time"])
+        # Round-trip through CSV so both sides have the same types and precision
+        actual = pd.read_csv(io.StringIO(result.to_csv(index=False)), parse_dates=["time"]) if not result.empty else pd.DataFrame()
+        try:
+            pd.testing.assert_frame_equal(actual, expected, check_dtype=False, rtol=1e-9)
+        except AssertionError as e:
+            logger.error(f"Replay signals differ from {args.expect}: {e}")
+            return 1
+        logger.info(f"Replay signals match {args.expect}.")
+    return 0
+
+
+def _record_synthetic(args):
+    from synthetic_market import load_universe
+
+    universe = load_universe(args.universe) if args.universe else load_universe()
+    if args.pairs:
+        universe = dict(list(universe.items())[:args.pairs])
+    started = time.perf_counter()
+    records, raw_bytes = record_synthetic(args.log, universe, args.duration, args.seed, args.step)
+    logger.info(
+        f"Recorded {records} messages ({raw_bytes / 2 ** 20:.1f} MB) into {os.path.getsize(args.log) / 2 ** 20:.1f} MB "
+        f"in {time.perf_counter() - started:.1f} s."
+    )
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="market_log", description="Inspect, replay and record market logs.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    info = commands.add_parser("info", help="Record count, time span and compression of a log")
+    info.add_argument("log")
+    info.set_defaults(func=_info)
+
+    replay_parser = commands.add_parser("replay", help="Replay a log through the live detector (or just decode its messages)")
+    replay_parser.add_argument("log")
+    replay_parser.add_argument("--speed", type=float, default=0, help="1 for real time, N for N times faster, 0 for as fast as possible")
+    replay_parser.add_argument("--k", type=float, default=2, help="Z-score threshold of the replayed strategy")
+    replay_parser.add_argument("--db", help="Warm the statistics from this database, as the live run did")
+    replay_parser.add_argument("--output", help="CSV to write the replayed signals to")
+    replay_parser.add_argument("--expect", help="CSV of expected signals; exit 1 if the replay differs")
+    replay_parser.set_defaults(func=_replay)
+
+    synthetic = commands.add_parser("record-synthetic", help="Record a synthetic market's messages into a log")
+    synthetic.add_argument("log")
+    synthetic.add_argument("--universe", help="AssetPairs response (.json) or trade fee table (.csv)")
+    synthetic.add_argument("--pairs", type=int, help="Only the first N pairs of the universe")
+    synthetic.add_argument("--duration", type=float, default=3600, help="Simulated seconds to record")
+    synthetic.add_argument("--step", type=float, default=1.0, help="Simulated seconds per step")
+    synthetic.add_argument("--seed", type=int, default=42)
+    synthetic.set_defaults(func=_record_synthetic)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+
+logger = logging.getLogger(__name__)
+
+# Pair combinations compared per vectorized step inside a worker
+CHUNK_SIZE = 256
+# Blocks submitted ahead of the consumer per worker; bounds how many finished results wait in memory
+IN_FLIGHT_PER_WORKER = 2
+
+
+def build_price_matrix(dataframes):
+    """
+    Align close prices and volumes of every pair on a common time index.
+
+    Returns the sorted candle times (int64 ns), the pair names and a
+    float64 matrix of shape (2, n_pairs, n_times) holding close prices in
+    plane 0 and volumes in plane 1. Missing candles are NaN.
+    """
+    pairs = list(dataframes)
+    stamps = [dataframes[pair]["time"].values.astype("datetime64[ns]").view("int64") for pair in pairs]
+    times = np.unique(np.concatenate(stamps)) if stamps else np.empty(0, dtype=np.int64)
+
+    matrix = np.full((2, len(pairs), len(times)), np.nan)
+    for col, (pair, stamp) in enumerate(zip(pairs, stamps)):
+        rows = np.searchsorted(times, stamp)
+        matrix[0, col, rows] = dataframes[pair]["close"].astype(float).values
+        matrix[1, col, rows] = dataframes[pair]["volume"].astype(float).values
+    return times, pairs, matrix
+
+
+def partition_pair_space(n_pairs, n_blocks):
+    """
+    Split the n_pairs * (n_pairs - 1) / 2 pair combinations into balanced blocks.
+
+    Every combination costs the same (one pass over the time axis), so the
+    flat upper-triangle index space is cut into contiguous ranges of equal size.
+    """
+    total = n_pairs * (n_pairs - 1) // 2
+    n_blocks = max(1, min(n_blocks, total))
+    edges = np.linspace(0, total, n_blocks + 1).astype(np.int64)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+def _compare_block(shm_name, shape, fees, start, stop, min_discrepancy, chunk_size):
+    """Compare one block of pair combinations against the shared price matrix."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        close = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)[0]
+        pair_a, pair_b = np.triu_indices(shape[1], 1)
+        pair_a = pair_a[start:stop].astype(np.int32)
+        pair_b = pair_b[start:stop].astype(np.int32)
+
+        out_time, out_a, out_b, out_raw = [], [], [], []
+        for offset in range(0, len(pair_a), chunk_size):
+            a = pair_a[offset:offset + chunk_size]
+            b = pair_b[offset:offset + chunk_size]
+            raw = np.abs(close[a] - close[b])
+            mask = ~np.isnan(raw)
+            if min_discrepancy is not None:
+                mask &= (raw - (fees[a] + fees[b])[:, None]) > min_discrepancy
+            combo, time_idx = np.nonzero(mask)
+            out_time.append(time_idx.astype(np.int32))
+            out_a.append(a[combo])
+            out_b.append(b[combo])
+            out_raw.append(raw[mask])
+        close = None
+    finally:
+        shm.close()
+
+    if not out_time:
+        return (np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0))
+    return (np.concatenate(out_time), np.concatenate(out_a), np.concatenate(out_b), np.concatenate(out_raw))
+
+
+def iter_compare_all_pairs_parallel(dataframes, fees=None, workers=None, min_discrepancy=None, chunk_size=CHUNK_SIZE):
+    """
+    Compare every pair combination in a process pool over a shared-memory price matrix.
+
+    Workers attach to the aligned matrix by name and only return flat typed
+    index/value arrays, so no DataFrame is ever pickled between processes.
+    Each block's rows are yielded as their own DataFrame, so a consumer such
+    as ResultSink never needs the full N^2 output in memory. Fees map pair
+    name to a decimal taker fee. Rows whose adjusted discrepancy is not
+    above min_discrepancy are dropped inside the workers. At most
+    IN_FLIGHT_PER_WORKER blocks per worker are submitted ahead of the
+    consumer, so peak memory does not grow with the number of blocks.
+    """
+    times, pairs, matrix = build_price_matrix(dataframes)
+    if len(pairs) < 2 or len(times) == 0:
+        logger.info("Not enough pairs to compare.")
+        return
+
+    fees = fees or {}
+    fee_array = np.array([fees.get(pair, 0.0) for pair in pairs], dtype=np.float64)
+    names = np.asarray(pairs, dtype=object)
+    workers = workers or os.cpu_count() or 1
+    # A few blocks per worker keeps the pool busy when blocks finish unevenly
+    blocks = partition_pair_space(len(pairs), workers * 4)
+
+    shm = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+    try:
+        shared = np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=shm.buf)
+        shared[:] = matrix
+        shared = None
+        logger.info(f"Comparing {len(pairs)} pairs over {len(times)} candles in {len(blocks)} blocks with {workers} workers...")
+        rows = 0
+        pending = iter(blocks)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            def submit():
+                block = next(pending, None)
+                if block is not None:
+                    futures.append(executor.submit(_compare_block, shm.name, matrix.shape, fee_array, *block, min_discrepancy, chunk_size))
+
+            futures = deque()
+            for _ in range(workers * IN_FLIGHT_PER_WORKER):
+                submit()
+            while futures:
+                # Drop the future before yielding so its result arrays are freed with the block
+                block = _block_frame(times, names, matrix, fee_array, *futures.popleft().result())
+                submit()
+                rows += len(block)
+                yield block
+        logger.info(f"Parallel comparison produced {rows} rows.")
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _block_frame(times, names, matrix, fee_array, time_idx, a, b, raw):
+    """Comparison rows of one block in the layout of compare_pairs."""
+    results = pd.DataFrame({
+        "time": pd.to_datetime(times[time_idx]),
+        "pair_a": names[a],
+        "pair_b": names[b],
+        "close_a": matrix[0, a, time_idx],
+        "close_b": matrix[0, b, time_idx],
+        "volume_a": matrix[1, a, time_idx],
+        "volume_b": matrix[1, b, time_idx],
+        "discrepancy": raw,
+        "fee_a": fee_array[a],
+        "fee_b": fee_array[b],
+    })
+    results["adjusted_discrepancy"] = results["discrepancy"] - results["fee_a"] - results["fee_b"]
+    return results
+
+
+@profiled()
+def compare_all_pairs_parallel(dataframes, fees=None, workers=None, min_discrepancy=None, chunk_size=CHUNK_SIZE):
+    """All rows of iter_compare_all_pairs_parallel in one DataFrame."""
+    blocks = list(iter_compare_all_pairs_parallel(dataframes, fees, workers, min_discrepancy, chunk_size))
+    return pd.concat(blocks, ignore_index=True) if blocks else pd.DataFrame()
@@ -0,0 +1,244 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from fee_schedule import FeeSchedule, net_of_fees
+from profiling import stage as profile_stage
+from threshold_sweep import optimize_group_thresholds, sweep_thresholds
+
+logger = logging.getLogger(__name__)
+
+# Paths shared by every ARB Foresight script
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(DIRECTORY, "arbitrage_data.db")
+TRADE_FEES_FILE = os.path.join(DIRECTORY, "trade_fees.csv")
+TRADE_FEE_TIERS_FILE = os.path.join(DIRECTORY, "trade_fee_tiers.csv")
+PIPELINE_CACHE_DIR = os.path.join(DIRECTORY, "cache", "pipeline")
+
+THRESHOLD_GRID = np.arange(1, 5.1, 0.1)
+MAX_DISCREPANCY = 50
+MAX_VOLUME = 100000
+
+
+class Stage:
+    """A named step: func(*dependency artifacts, **params) -> artifact."""
+
+    def __init__(self, name, func, deps=(), files=(), code=(), params=None, cache=True):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.files = tuple(files)
+        self.code = tuple(code)
+        self.params = params or {}
+        self.cache = cache
+
+
+class Pipeline:
+    """
+    Lazily evaluated, cached stages.
+
+    An artifact's key hashes the module source that defines the stage's
+    function, its params, any input files (size and mtime) and code files,
+    and the keys of its dependencies. Artifacts of cached stages are pickled
+    under cache_dir by key, so get() only runs the stages whose inputs
+    changed since they were last computed; everything upstream of a fresh
+    artifact is never loaded. Uncached stages are cheap intermediates that
+    are recomputed whenever a stale stage needs them.
+
+    The pipeline owns the shared preprocessing every script starts from:
+    the loaded opportunities through profit, their summary stats and the
+    threshold tables. Per-script results computed on top of it are cached
+    by content in result_cache.ResultCache, and walk_forward keeps its own
+    per-fold features and evaluations under cache/folds.
+    """
+
+    def __init__(self, cache_dir=PIPELINE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.stages = {}
+        self._keys = {}
+        self._values = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def add(self, name, func, deps=(), files=(), code=(), params=None, cache=True):
+        """Declare a stage."""
+        self.stages[name] = Stage(name, func, deps, files, code, params, cache)
+        self._keys.clear()
+        return func
+
+    def key(self, name):
+        """Content key of a stage's artifact."""
+        if name not in self._keys:
+            stage = self.stages[name]
+            digest = hashlib.sha256()
+            digest.update(name.encode())
+            # The whole module, so helpers and constants the stage uses are covered too
+            with open(inspect.getsourcefile(stage.func), "rb") as source:
+                digest.update(source.read())
+            digest.update(json.dumps(stage.params, sort_keys=True, default=str).encode())
+            for path in stage.files:
+                if os.path.exists(path):
+                    stat = os.stat(path)
+                    digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+                else:
+                    digest.update(f"{path}:missing".encode())
+            for path in stage.code:
+                with open(path, "rb") as source:
+                    digest.update(source.read())
+            for dep in stage.deps:
+                digest.update(self.key(dep).encode())
+            self._keys[name] = digest.hexdigest()
+        return self._keys[name]
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, f"{name}-{self.key(name)}.pkl")
+
+    def is_stale(self, name):
+        """True if get(name) would have to compute the stage."""
+        return name not in self._values and not (self.stages[name].cache and os.path.exists(self._path(name)))
+
+    def get(self, name):
+        """Return a stage's artifact, computing only what is stale."""
+        if name in self._values:
+            return self._values[name]
+        stage = self.stages[name]
+        path = self._path(name)
+        if stage.cache and os.path.exists(path):
+            try:
+                with open(path, "rb") as file:
+                    value = pickle.load(file)
+                logger.info(f"Pipeline stage '{name}' loaded from cache.")
+                self._values[name] = value
+                return value
+            except Exception as e:
+                logger.warning(f"Discarding unreadable artifact for '{name}': {e}")
+
+        inputs = [self.get(dep) for dep in stage.deps]
+        logger.info(f"Running pipeline stage '{name}'...")
+        with profile_stage(f"pipeline.{name}"):
+            value = stage.func(*inputs, **stage.params)
+
+        # Older artifacts of this stage can never be hit again
+        for stale in os.listdir(self.cache_dir):
+            if stale.startswith(f"{name}-") and stale.endswith(".pkl"):
+                os.remove(os.path.join(self.cache_dir, stale))
+        if not stage.cache:
+            return value
+        staging = f"{path}.tmp{os.getpid()}"
+        with open(staging, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(staging, path)
+        self._values[name] = value
+        return value
+
+    def invalidate(self):
+        """Forget in-memory artifacts and keys, e.g. after the database changed."""
+        self._keys.clear()
+        self._values.clear()
+
+
+def load_opportunities(db_file):
+    """All rows of the arbitrage_opportunities table."""
+    try:
+        with sqlite3.connect(db_file) as conn:
+            df = pd.read_sql("SELECT * FROM arbitrage_opportunities", conn, parse_dates=["time"])
+        logger.info(f"Loaded {len(df)} rows of historical data from {db_file}.")
+        return df
+    except Exception as e:
+        logger.warning(f"No historical data found: {e}")
+        return pd.DataFrame()
+
+
+def load_fees(fees_file, tiers_file):
+    """The volume-tier fee schedule when available, else the flat first-tier fees."""
+    if os.path.exists(tiers_file):
+        try:
+            return FeeSchedule.from_tier_table(pd.read_csv(tiers_file))
+        except Exception as e:
+            logger.warning(f"Error loading fee tiers, falling back to flat fees: {e}")
+    return FeeSchedule.from_fee_table(pd.read_csv(fees_file))
+
+
+def merge_fees(df, fees):
+    """Attach taker fees for both legs."""
+    return fees.apply(df.copy()) if not df.empty else df
+
+
+def normalize(df):
+    """Clip fees, volumes and discrepancies to sane ranges, taking the clipped fees out of the discrepancy once."""
+    if df.empty:
+        return df
+    df = df.copy()
+    df["fee_a"] = np.clip(df["fee_a"], 0.001, 0.005)
+    df["fee_b"] = np.clip(df["fee_b"], 0.001, 0.005)
+    df = net_of_fees(df)
+    df["adjusted_discrepancy"] = np.clip(df["adjusted_discrepancy"], -MAX_DISCREPANCY, MAX_DISCREPANCY)
+    if "volume_a" in df.columns:
+        df["volume_a"] = np.clip(df["volume_a"], 0, MAX_VOLUME)
+    return df
+
+
+def add_profit(df):
+    """Profit per opportunity (adjusted_discrepancy is already net of fees), or adjusted_discrepancy as a proxy."""
+    if df.empty:
+        return df
+    if "volume_a" in df.columns:
+        profit = df["adjusted_discrepancy"] * df["volume_a"]
+    else:
+        logger.warning("Volume data unavailable. Using adjusted discrepancy as a proxy.")
+        profit = df["adjusted_discrepancy"]
+    return df.assign(profit=profit)
+
+
+def summary_stats(df):
+    """Global mean and std of adjusted_discrepancy."""
+    return {"mean": df["adjusted_discrepancy"].mean(), "std_dev": df["adjusted_discrepancy"].std()}
+
+
+def threshold_table(df, stats, grid):
+    """Weighted profit, trade count and raw profit of every global threshold multiplier."""
+    grid = np.asarray(grid, dtype=np.float64)
+    sweep = sweep_thresholds(df["adjusted_discrepancy"], df["profit"], stats["mean"] + grid * stats["std_dev"], stats["std_dev"])
+    return pd.DataFrame({
+        "threshold": grid,
+        "profit": sweep["weighted_profit"],
+        "num_trades": sweep["num_trades"],
+        "raw_profit": sweep["profit"],
+    })
+
+
+def pair_threshold_table(df, grid):
+    """Chosen threshold of every pair combination."""
+    return optimize_group_thresholds(df, grid)
+
+
+def build_pipeline(db_file=DB_FILE, fees_file=TRADE_FEES_FILE, tiers_file=TRADE_FEE_TIERS_FILE, cache_dir=PIPELINE_CACHE_DIR, grid=THRESHOLD_GRID):
+    """
+    The ARB Foresight analysis pipeline.
+
+    load -> merged (fees) -> normalized -> profit -> stats -> thresholds,
+    plus pair_thresholds. Scripts take the artifacts they report on. Only
+    profit and what is derived from it are cached; the stages before it
+    are recomputed from the database when profit is stale.
+    """
+    fee_code = os.path.join(DIRECTORY, "fee_schedule.py")
+    sweep_code = os.path.join(DIRECTORY, "threshold_sweep.py")
+    pipeline = Pipeline(cache_dir)
+    pipeline.add("load", load_opportunities, files=[db_file], params={"db_file": db_file}, cache=False)
+    pipeline.add(
+        "fees", load_fees, files=[fees_file, tiers_file], code=[fee_code],
+        params={"fees_file": fees_file, "tiers_file": tiers_file}, cache=False,
+    )
+    pipeline.add("merged", merge_fees, deps=["load", "fees"], code=[fee_code], cache=False)
+    pipeline.add("normalized", normalize, deps=["merged"], cache=False)
+    pipeline.add("profit", add_profit, deps=["normalized"])
+    pipeline.add("stats", summary_stats, deps=["profit"])
+    pipeline.add("thresholds", threshold_table, deps=["profit", "stats"], code=[sweep_code], params={"grid": np.asarray(grid).tolist()})
+    pipeline.add("pair_thresholds", pair_threshold_table, deps=["profit"], code=[sweep_code], params={"grid": np.asarray(grid).tolist()})
+    return pipeline
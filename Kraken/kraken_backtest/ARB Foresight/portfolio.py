@@ -0,0 +1,199 @@
+import logging
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOLD = pd.Timedelta(minutes=1)
+# Share of the available balance a single trade may commit
+DEFAULT_TRADE_FRACTION = 0.1
+
+
+def normalize_asset(asset, altname, is_base):
+    """
+    Drop Kraken's legacy X/Z prefix (XXBT -> XBT, ZUSD -> USD) when the pair's altname uses the short code.
+
+    Assets that merely start with X or Z (ZEUS, ZETA) keep their name.
+    """
+    if len(asset) == 4 and asset[0] in "XZ":
+        short = asset[1:]
+        if altname.startswith(short) if is_base else altname.endswith(short):
+            return short
+    return asset
+
+
+def load_pair_assets(fees_file):
+    """Map every pair name and altname in trade_fees.csv to its normalized (base, quote)."""
+    df = pd.read_csv(fees_file, usecols=["Pair", "AltName", "BaseCurrency", "QuoteCurrency"])
+    pair_assets = {}
+    for pair, altname, base, quote in df.itertuples(index=False):
+        assets = (normalize_asset(base, altname, True), normalize_asset(quote, altname, False))
+        pair_assets[pair] = pair_assets[altname] = assets
+    return pair_assets
+
+
+class Portfolio:
+    """
+    Per-asset balances with capital reserved for open legs.
+
+    available holds what can be committed right now; amounts reserved for
+    open trades come back (as the other asset of each leg) when the trade
+    settles.
+    """
+
+    def __init__(self, balances):
+        self.assets = sorted(balances)
+        self.asset_ids = {asset: i for i, asset in enumerate(self.assets)}
+        self.available = np.array([float(balances[asset]) for asset in self.assets])
+        self.pending = deque()
+
+    def ensure_assets(self, assets):
+        """Register assets that start with a zero balance."""
+        new = sorted(set(assets) - set(self.asset_ids))
+        for asset in new:
+            self.asset_ids[asset] = len(self.assets)
+            self.assets.append(asset)
+        if new:
+            self.available = np.concatenate((self.available, np.zeros(len(new))))
+
+    def ids(self, assets):
+        """Integer ids of assets."""
+        return np.array([self.asset_ids[asset] for asset in assets], dtype=np.int64)
+
+    def settle(self, now):
+        """Credit every open trade whose release time is at or before now."""
+        while self.pending and self.pending[0][0] <= now:
+            _, asset_ids, amounts = self.pending.popleft()
+            np.add.at(self.available, asset_ids, amounts)
+
+    def settle_all(self):
+        """Credit every open trade."""
+        while self.pending:
+            _, asset_ids, amounts = self.pending.popleft()
+            np.add.at(self.available, asset_ids, amounts)
+
+    def allocate(self, debit_ids, debit_amounts):
+        """
+        Fraction of each trade that the available balances can fund.
+
+        debit_ids/debit_amounts have shape (n, legs). Every asset that is
+        oversubscribed in the batch is shared pro rata, and each trade fills
+        at the tightest ratio among its legs, so no asset is overdrawn.
+        """
+        demand = np.bincount(debit_ids.ravel(), weights=debit_amounts.ravel(), minlength=len(self.available))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(demand > 0, np.clip(self.available / demand, 0, 1), 1.0)
+        return ratio[debit_ids].min(axis=1)
+
+    def reserve(self, release_time, debit_ids, debit_amounts, credit_ids, credit_amounts):
+        """Debit the funded legs now and schedule their credits at release_time."""
+        np.subtract.at(self.available, debit_ids.ravel(), debit_amounts.ravel())
+        self.pending.append((release_time, credit_ids.ravel(), credit_amounts.ravel()))
+
+    def balances(self):
+        """Available balance per asset."""
+        return pd.Series(self.available, index=self.assets)
+
+
+def simulate_portfolio(trades, balances, pair_assets, hold=DEFAULT_HOLD, trade_fraction=DEFAULT_TRADE_FRACTION, min_fill=0.0):
+    """
+    Replay candidate trades against finite per-asset balances.
+
+    Each trade buys on the cheaper of pair_a/pair_b and sells the same amount
+    on the dearer one (prices from close_a/close_b, fees from fee_a/fee_b).
+    Buying reserves the quote currency, selling reserves the base asset; the
+    bought base and the sale proceeds become available after hold.
+    pair_assets maps pair names to (base, quote), see load_pair_assets;
+    trades on pairs it does not know are dropped.
+
+    A trade asks for trade_fraction of what is available when it arrives:
+    the smaller of that share of the buy pair's quote balance (in base units,
+    fees included) and of the sell pair's base balance. Trades are processed
+    as one stream ordered by time. All trades sharing a timestamp form a
+    batch whose allocation is computed with array operations: oversubscribed
+    assets are split pro rata. Fills below min_fill (a fraction of the
+    requested size) are dropped.
+
+    Returns a dict with the executed trades (fill, filled_size and
+    realized_profit columns added), final balances and totals.
+    """
+    required = ["time", "pair_a", "pair_b", "close_a", "close_b", "fee_a", "fee_b"]
+    missing = [column for column in required if column not in trades.columns]
+    if missing:
+        raise ValueError(f"Portfolio simulation needs columns {missing}")
+
+    known = trades["pair_a"].isin(pair_assets.keys()) & trades["pair_b"].isin(pair_assets.keys())
+    if not known.all():
+        unknown = sorted((set(trades.loc[~known, "pair_a"]) | set(trades.loc[~known, "pair_b"])) - pair_assets.keys())
+        logger.warning(f"Dropping {int((~known).sum())} trades on pairs missing from the fee table: {unknown}")
+        trades = trades[known]
+    trades = trades.sort_values("time", kind="stable").reset_index(drop=True)
+    portfolio = Portfolio(balances)
+    n = len(trades)
+
+    # Leg layout: the buy leg is the cheaper pair
+    a_cheaper = (trades["close_a"] <= trades["close_b"]).to_numpy()
+    buy_pair = np.where(a_cheaper, trades["pair_a"], trades["pair_b"])
+    sell_pair = np.where(a_cheaper, trades["pair_b"], trades["pair_a"])
+    buy_price = np.where(a_cheaper, trades["close_a"], trades["close_b"]).astype(np.float64)
+    sell_price = np.where(a_cheaper, trades["close_b"], trades["close_a"]).astype(np.float64)
+    buy_fee = np.where(a_cheaper, trades["fee_a"], trades["fee_b"]).astype(np.float64)
+    sell_fee = np.where(a_cheaper, trades["fee_b"], trades["fee_a"]).astype(np.float64)
+
+    codes, pairs = pd.factorize(np.concatenate((buy_pair, sell_pair)))
+    splits = [pair_assets[pair] for pair in pairs]
+    portfolio.ensure_assets({asset for split in splits for asset in split})
+    pair_assets = np.array([portfolio.ids(split) for split in splits], dtype=np.int64).reshape(-1, 2)
+    buy_ids, sell_ids = pair_assets[codes[:n]], pair_assets[codes[n:]]
+
+    # Per unit of size: debit quote of the buy pair and base of the sell pair,
+    # later credit base of the buy pair and quote of the sell pair
+    debit_ids = np.column_stack((buy_ids[:, 1], sell_ids[:, 0]))
+    debit_per_unit = np.column_stack((buy_price * (1 + buy_fee), np.ones(n)))
+    credit_ids = np.column_stack((buy_ids[:, 0], sell_ids[:, 1]))
+    credit_per_unit = np.column_stack((np.ones(n), sell_price * (1 - sell_fee)))
+
+    times = trades["time"].to_numpy(dtype="datetime64[ns]")
+    hold = np.timedelta64(pd.Timedelta(hold).value, "ns")
+    size = np.zeros(n)
+    fill = np.zeros(n)
+    _, starts = np.unique(times, return_index=True)
+    bounds = np.append(starts, n)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        portfolio.settle(times[start])
+        batch = slice(start, stop)
+        # Units each leg's share of its debited balance would cover
+        size[batch] = (portfolio.available[debit_ids[batch]] * trade_fraction / debit_per_unit[batch]).min(axis=1)
+        debit = debit_per_unit[batch] * size[batch, None]
+        batch_fill = portfolio.allocate(debit_ids[batch], debit)
+        batch_fill[batch_fill < max(min_fill, 1e-12)] = 0.0
+        fill[batch] = batch_fill
+        portfolio.reserve(
+            times[start] + hold,
+            debit_ids[batch],
+            debit * batch_fill[:, None],
+            credit_ids[batch],
+            credit_per_unit[batch] * (size[batch] * batch_fill)[:, None],
+        )
+    portfolio.settle_all()
+
+    executed = trades.assign(fill=fill, filled_size=size * fill)
+    if "adjusted_discrepancy" in executed.columns:
+        executed["realized_profit"] = executed["adjusted_discrepancy"] * executed["filled_size"]
+    executed = executed[fill > 0]
+    logger.info(f"Portfolio filled {len(executed)} of {n} candidate trades ({fill.sum() / max(n, 1):.1%} of requested size).")
+    return {
+        "trades": executed,
+        "balances": portfolio.balances(),
+        "requested": n,
+        "filled": len(executed),
+        "profit": executed["realized_profit"].sum() if "realized_profit" in executed.columns else np.nan,
+    }
+
+
+def load_balances(file_path):
+    """Read starting balances from a CSV with asset and balance columns."""
+    df = pd.read_csv(file_path)
+    return dict(zip(df["asset"], df["balance"].astype(float)))
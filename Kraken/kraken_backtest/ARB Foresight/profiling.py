@@ -0,0 +1,210 @@
+import atexit
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: ARB_PROFILE=1 (or "all") enables everything, or a comma list of time,cpu,memory
+PROFILE_ENV = "ARB_PROFILE"
+PROFILE_DIR_ENV = "ARB_PROFILE_DIR"
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.path.join(DIRECTORY, "profiles")
+MODES = ("time", "cpu", "memory")
+TOP_FUNCTIONS = 15
+
+
+def parse_modes(value):
+    """Modes enabled by an ARB_PROFILE value; empty when profiling is off."""
+    value = (value or "").strip().lower()
+    if value in ("", "0", "off", "false", "no"):
+        return ()
+    if value in ("1", "on", "true", "yes", "all"):
+        return MODES
+    modes = tuple(mode.strip() for mode in value.split(",") if mode.strip())
+    unknown = sorted(set(modes) - set(MODES))
+    if unknown:
+        raise ValueError(f"Unknown profiling modes {unknown}; choose from {MODES}")
+    # Timers are always on when anything is
+    return tuple(mode for mode in MODES if mode in modes or mode == "time")
+
+
+class StageRecord:
+    __slots__ = ("name", "calls", "wall", "cpu", "peak_bytes", "profile")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_bytes = 0
+        self.profile = None
+
+
+class _Frame:
+    __slots__ = ("start_bytes", "peak_bytes")
+
+    def __init__(self, start_bytes):
+        self.start_bytes = start_bytes
+        self.peak_bytes = start_bytes
+
+
+class Profiler:
+    """
+    Per-stage wall/CPU timers, cProfile capture and tracemalloc peaks for one run.
+
+    Stages nest: wall and CPU time are inclusive, and a stage's memory peak
+    covers everything allocated while it ran (nested stages included). Only
+    one cProfile can be active, so a nested stage's functions show up in
+    its outermost stage's profile rather than in a separate one.
+    """
+
+    def __init__(self, modes=MODES, output_dir=PROFILE_DIR, run_name=None):
+        self.modes = tuple(modes)
+        self.output_dir = output_dir
+        self.run_name = run_name or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+        self.started = datetime.now()
+        self.records = {}
+        self._frames = []
+        self._profiling = False
+        if "memory" in self.modes and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        record = self.records.get(name) or self.records.setdefault(name, StageRecord(name))
+        profile = None
+        if "cpu" in self.modes and not self._profiling:
+            profile = record.profile = record.profile or cProfile.Profile()
+            self._profiling = True
+            profile.enable()
+        if "memory" in self.modes:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._frames:
+                self._frames[-1].peak_bytes = max(self._frames[-1].peak_bytes, peak)
+            tracemalloc.reset_peak()
+            self._frames.append(_Frame(current))
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall += time.perf_counter() - wall
+            record.cpu += time.process_time() - cpu
+            record.calls += 1
+            if "memory" in self.modes:
+                frame = self._frames.pop()
+                frame.peak_bytes = max(frame.peak_bytes, tracemalloc.get_traced_memory()[1])
+                record.peak_bytes = max(record.peak_bytes, frame.peak_bytes - frame.start_bytes)
+                tracemalloc.reset_peak()
+                if self._frames:
+                    self._frames[-1].peak_bytes = max(self._frames[-1].peak_bytes, frame.peak_bytes)
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+
+    def summary(self):
+        """Stage table sorted by wall time."""
+        width = max([len("stage"), *(len(name) for name in self.records)])
+        lines = [f"{'stage':<{width}} {'calls':>6} {'wall s':>10} {'cpu s':>10} {'peak MB':>10}"]
+        for record in sorted(self.records.values(), key=lambda r: r.wall, reverse=True):
+            peak = f"{record.peak_bytes / 2 ** 20:10.1f}" if "memory" in self.modes else f"{'-':>10}"
+            lines.append(f"{record.name:<{width}} {record.calls:>6} {record.wall:>10.3f} {record.cpu:>10.3f} {peak}")
+        return lines
+
+    def write_report(self):
+        """Write report.txt, report.json and one .prof per profiled stage; returns the report directory."""
+        if not self.records:
+            return None
+        directory = os.path.join(self.output_dir, f"{self.run_name}-{self.started:%Y%m%d-%H%M%S}")
+        os.makedirs(directory, exist_ok=True)
+        text = [f"Profile of {self.run_name} started {self.started:%Y-%m-%d %H:%M:%S} (modes: {', '.join(self.modes)})", ""]
+        text += self.summary()
+        stages = []
+        for record in self.records.values():
+            entry = {"stage": record.name, "calls": record.calls, "wall": record.wall, "cpu": record.cpu}
+            if "memory" in self.modes:
+                entry["peak_bytes"] = record.peak_bytes
+            if record.profile is not None:
+                file_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in record.name) + ".prof"
+                record.profile.dump_stats(os.path.join(directory, file_name))
+                entry["profile"] = file_name
+                stream = io.StringIO()
+                pstats.Stats(record.profile, stream=stream).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+                text += ["", f"== {record.name} (top {TOP_FUNCTIONS} by cumulative time) ==", stream.getvalue().strip()]
+            stages.append(entry)
+        with open(os.path.join(directory, "report.txt"), "w") as file:
+            file.write("\n".join(text) + "\n")
+        with open(os.path.join(directory, "report.json"), "w") as file:
+            json.dump({"run": self.run_name, "started": self.started.isoformat(), "modes": list(self.modes), "stages": stages}, file, indent=1)
+        logger.info(f"Profile report written to {directory}")
+        return directory
+
+
+_profiler = None
+_resolved = False
+
+
+def active():
+    """The run's Profiler when ARB_PROFILE enables one, else None."""
+    global _profiler, _resolved
+    if not _resolved:
+        _resolved = True
+        modes = parse_modes(os.environ.get(PROFILE_ENV))
+        if modes:
+            _profiler = Profiler(modes, os.environ.get(PROFILE_DIR_ENV) or PROFILE_DIR)
+            atexit.register(_write_at_exit)
+    return _profiler
+
+
+def enable(modes=MODES, output_dir=None):
+    """Turn profiling on for this process (and, through the environment, its workers)."""
+    os.environ[PROFILE_ENV] = ",".join(modes)
+    if output_dir:
+        os.environ[PROFILE_DIR_ENV] = output_dir
+    global _resolved
+    _resolved = False
+    return active()
+
+
+def _write_at_exit():
+    if _profiler is not None:
+        _profiler.write_report()
+        _profiler.records.clear()
+
+
+@contextmanager
+def stage(name):
+    """Profile a block as a named stage; a no-op unless profiling is enabled."""
+    profiler = active()
+    if profiler is None:
+        yield None
+        return
+    with profiler.stage(name) as record:
+        yield record
+
+
+def profiled(name=None):
+    """Decorator form of stage(); the stage defaults to script.function."""
+    def decorate(func):
+        # The file name rather than __module__, which is __main__ for a script run directly
+        script = os.path.splitext(os.path.basename(func.__code__.co_filename))[0]
+        stage_name = name or f"{script}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = active()
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
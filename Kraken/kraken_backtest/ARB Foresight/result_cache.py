@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RESULT_CACHE_DIR = os.path.join(DIRECTORY, "cache", "results")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def hash_frame(df):
+    """Content hash of a DataFrame's values and column names (index ignored)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(column) for column in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def code_version(*paths):
+    """Hash of the source files whose logic produced a result."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache for backtest metrics and trade lists.
+
+    A key is the hash of the input data, the strategy parameters and the code
+    version. Each entry is a directory holding metrics.json and an optional
+    trades.pkl. The cache's total size is scanned once and then tracked as
+    entries are written; when it grows past max_bytes, the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, data, params, code=""):
+        """Cache key for a data partition, parameter dict and code version."""
+        digest = hashlib.sha256()
+        digest.update(hash_frame(data).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=_json_default).encode())
+        digest.update(code.encode())
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Return (metrics, trades) for key, or None on a miss."""
+        entry = self._entry(key)
+        metrics_path = os.path.join(entry, "metrics.json")
+        if not os.path.exists(metrics_path):
+            return None
+        try:
+            with open(metrics_path) as file:
+                metrics = json.load(file)
+            trades_path = os.path.join(entry, "trades.pkl")
+            trades = pd.read_pickle(trades_path) if os.path.exists(trades_path) else None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key}: {e}")
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        # Touch the entry so eviction is least-recently-used
+        now = time.time()
+        os.utime(entry, (now, now))
+        return metrics, trades
+
+    def put(self, key, metrics, trades=None):
+        """Store metrics (JSON-serializable dict) and an optional trades DataFrame."""
+        if self._bytes is None:
+            self._bytes = self.size()
+        entry = self._entry(key)
+        staging = f"{entry}.tmp{os.getpid()}"
+        os.makedirs(staging, exist_ok=True)
+        with open(os.path.join(staging, "metrics.json"), "w") as file:
+            json.dump(metrics, file, default=_json_default)
+        if trades is not None:
+            trades.to_pickle(os.path.join(staging, "trades.pkl"))
+        replaced = _entry_bytes(entry) if os.path.isdir(entry) else 0
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(staging, entry)
+        self._bytes += _entry_bytes(entry) - replaced
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def get_or_compute(self, data, params, compute, code=""):
+        """Return the cached (metrics, trades) for the inputs, running compute() on a miss."""
+        key = self.key(data, params, code)
+        cached = self.get(key)
+        if cached is not None:
+            logger.info(f"Result cache hit for {params.get('step', key[:12])}.")
+            return cached
+        metrics, trades = compute()
+        self.put(key, metrics, trades)
+        return metrics, trades
+
+    def map_partitions(self, df, func, params, code="", freq="D", time_column="time"):
+        """
+        Apply a partition-local func to df one time partition at a time.
+
+        Each partition's output frame is cached under its own content key, so
+        a nightly run only computes partitions whose rows changed.
+        """
+        if df.empty:
+            return func(df)
+        outputs = []
+        computed = 0
+        for _, partition in df.groupby(pd.Grouper(key=time_column, freq=freq), sort=True):
+            if partition.empty:
+                continue
+            key = self.key(partition, params, code)
+            cached = self.get(key)
+            if cached is None:
+                output = func(partition)
+                self.put(key, {"rows": len(output)}, output)
+                computed += 1
+            else:
+                output = cached[1]
+            outputs.append(output)
+        logger.info(f"Computed {computed} of {len(outputs)} partitions; the rest came from the result cache.")
+        return pd.concat(outputs, ignore_index=True) if outputs else func(df.iloc[:0])
+
+    def size(self):
+        """Total bytes used by cache entries."""
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path) and ".tmp" not in name:
+                entries.append((os.path.getmtime(path), _entry_bytes(path), path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        # A full scan also picks up entries other processes wrote meanwhile
+        self._bytes = total
+
+
+def _entry_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
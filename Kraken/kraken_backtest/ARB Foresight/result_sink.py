@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from threshold_sweep import lookup_thresholds
+
+logger = logging.getLogger(__name__)
+
+# Columns kept in the in-memory top-K heaps
+TOP_COLUMNS = ["time", "pair_a", "pair_b", "adjusted_discrepancy", "profit"]
+
+
+class ResultSink:
+    """
+    Streaming collector for pair comparison results.
+
+    Frames are added one at a time and never concatenated in memory. The sink
+    keeps running count/mean/variance of adjusted_discrepancy, a bounded
+    top-K heap globally and per (pair_a, pair_b), and spills every row to a
+    CSV file in chunks. Rows above the final dynamic threshold are read back
+    from the spill file chunk by chunk.
+    """
+
+    def __init__(self, spill_path=None, top_k=10, chunk_rows=100_000):
+        if spill_path is None:
+            fd, spill_path = tempfile.mkstemp(prefix="arb_results_", suffix=".csv")
+            os.close(fd)
+        self.spill_path = spill_path
+        self.top_k = top_k
+        self.chunk_rows = chunk_rows
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total_profit = 0.0
+
+        self._global_top = []
+        self._pair_top = {}
+        self._tiebreak = itertools.count()
+        self._buffer = []
+        self._buffered_rows = 0
+        self._header_written = False
+
+    def add(self, frame):
+        """Add one comparison result frame; the sink takes it over and adds a profit column in place."""
+        if frame is None or frame.empty:
+            return
+        frame["profit"] = frame["adjusted_discrepancy"] * frame["volume_a"]
+        self._update_stats(frame["adjusted_discrepancy"].to_numpy(dtype=np.float64))
+        self.total_profit += frame["profit"].sum()
+        self._update_top(frame)
+
+        self._buffer.append(frame)
+        self._buffered_rows += len(frame)
+        if self._buffered_rows >= self.chunk_rows:
+            self.flush()
+
+    def _update_stats(self, values):
+        """Merge a batch into the running mean/M2 (Chan et al. parallel update)."""
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if n == 0:
+            return
+        batch_mean = values.mean()
+        batch_m2 = ((values - batch_mean) ** 2).sum()
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += batch_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    def _push(self, heap, key, record):
+        """Push a record onto a min-heap capped at top_k entries."""
+        item = (key, next(self._tiebreak), record)
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, item)
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    def _update_top(self, frame):
+        """Offer only each pair's local top-K rows to the heaps."""
+        columns = [column for column in TOP_COLUMNS if column in frame.columns]
+        candidates = (
+            frame.sort_values("adjusted_discrepancy", ascending=False)
+            .groupby(["pair_a", "pair_b"], sort=False)
+            .head(self.top_k)[columns]
+        )
+        for record in candidates.itertuples(index=False):
+            key = record.adjusted_discrepancy
+            if np.isnan(key):
+                continue
+            pair_heap = self._pair_top.setdefault((record.pair_a, record.pair_b), [])
+            self._push(pair_heap, key, record)
+            self._push(self._global_top, key, record)
+
+    def flush(self):
+        """Append buffered rows to the spill file."""
+        if not self._buffer:
+            return
+        chunk = pd.concat(self._buffer, ignore_index=True)
+        chunk.to_csv(self.spill_path, mode="a" if self._header_written else "w", header=not self._header_written, index=False)
+        self._header_written = True
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def close(self):
+        """Flush remaining rows."""
+        self.flush()
+
+    @property
+    def std(self):
+        """Sample standard deviation of adjusted_discrepancy (ddof=1, as pandas)."""
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def threshold(self, sigma=2):
+        """Dynamic threshold mean + sigma * std over everything added so far."""
+        return self.mean + sigma * self.std
+
+    def top(self, pair=None):
+        """Return the top-K rows globally, or for one (pair_a, pair_b) tuple."""
+        heap = self._global_top if pair is None else self._pair_top.get(pair, [])
+        records = [record for _, _, record in sorted(heap, reverse=True)]
+        return pd.DataFrame(records)
+
+    def iter_above(self, threshold, chunksize=100_000, pair_thresholds=None):
+        """
+        Yield spilled rows with adjusted_discrepancy above threshold, chunk by chunk.
+
+        pair_thresholds (a Series indexed by (pair_a, pair_b), see
+        load_threshold_table) overrides threshold for the combinations it covers.
+        """
+        self.flush()
+        if not self._header_written:
+            return
+        for chunk in pd.read_csv(self.spill_path, parse_dates=["time"], chunksize=chunksize):
+            limit = threshold if pair_thresholds is None else lookup_thresholds(pair_thresholds, chunk, threshold)
+            yield chunk[chunk["adjusted_discrepancy"] > limit]
+
+    def count_above(self, threshold, pair_thresholds=None):
+        """Count spilled rows with adjusted_discrepancy above threshold."""
+        return sum(len(chunk) for chunk in self.iter_above(threshold, pair_thresholds=pair_thresholds))
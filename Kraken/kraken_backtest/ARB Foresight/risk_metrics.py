@@ -0,0 +1,121 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESAMPLES = 10_000
+# Resample rows are generated in batches sized to this memory budget; path_metrics
+# keeps about eight (batch, n) float64/int64 temporaries alive at once
+MEMORY_BUDGET = 256 * 1024 ** 2
+LIVE_TEMPORARIES = 8
+BATCH_ELEMENTS = MEMORY_BUDGET // (LIVE_TEMPORARIES * 8)
+
+
+def bootstrap_indices(n, resamples, block_size=1, rng=None):
+    """
+    Index matrix of shape (resamples, n) for an iid or circular block bootstrap.
+
+    block_size=1 is the iid bootstrap. Larger blocks keep runs of consecutive
+    trades together so autocorrelation survives resampling.
+    """
+    rng = np.random.default_rng(rng)
+    if block_size <= 1:
+        return rng.integers(0, n, size=(resamples, n))
+    n_blocks = -(-n // block_size)
+    starts = rng.integers(0, n, size=(resamples, n_blocks, 1))
+    indices = (starts + np.arange(block_size)) % n
+    return indices.reshape(resamples, -1)[:, :n]
+
+
+def path_metrics(paths):
+    """
+    Sharpe, Sortino, max drawdown and time-to-recovery per row of a (k, n) matrix of trade returns.
+
+    Drawdown is measured on the cumulative profit curve. Time-to-recovery
+    is the longest stretch of trades spent below a previous peak.
+    """
+    mean = paths.mean(axis=1)
+    std = paths.std(axis=1, ddof=1)
+
+    # Downside deviation as in evaluate_risk_metrics: sample std of the losing trades
+    losses = np.minimum(paths, 0)
+    loss_count = (paths < 0).sum(axis=1)
+    loss_sum = losses.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        loss_var = ((losses ** 2).sum(axis=1) - loss_sum ** 2 / loss_count) / (loss_count - 1)
+        downside = np.where(loss_count > 1, np.sqrt(np.maximum(loss_var, 0)), 0.0)
+        sharpe = np.where(std > 0, mean / std, 0.0)
+        sortino = np.where(downside > 0, mean / downside, 0.0)
+
+    equity = np.cumsum(paths, axis=1)
+    peak = np.maximum.accumulate(np.maximum(equity, 0), axis=1)
+    drawdown = peak - equity
+    max_drawdown = drawdown.max(axis=1)
+
+    # Longest underwater run: distance since the last step at a new peak
+    n = paths.shape[1]
+    steps = np.broadcast_to(np.arange(n), paths.shape)
+    last_peak = np.maximum.accumulate(np.where(drawdown <= 0, steps, -1), axis=1)
+    time_to_recovery = (steps - last_peak).max(axis=1)
+
+    return {
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "max_drawdown": max_drawdown,
+        "time_to_recovery": time_to_recovery,
+    }
+
+
+def bootstrap_risk(returns, resamples=DEFAULT_RESAMPLES, block_size=1, rng=None):
+    """
+    Bootstrap distributions of risk metrics for one sequence of trade returns.
+
+    All resamples are drawn and evaluated as (batch, n) matrices; rows are
+    processed in as few batches as BATCH_ELEMENTS allows. Returns a dict of
+    metric name to array of length resamples.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    returns = returns[~np.isnan(returns)]
+    n = len(returns)
+    if n < 2:
+        return {name: np.zeros(0) for name in ("sharpe", "sortino", "max_drawdown", "time_to_recovery")}
+
+    rng = np.random.default_rng(rng)
+    batch = max(1, BATCH_ELEMENTS // n)
+    parts = []
+    for start in range(0, resamples, batch):
+        count = min(batch, resamples - start)
+        parts.append(path_metrics(returns[bootstrap_indices(n, count, block_size, rng)]))
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def summarize_distribution(distribution, quantiles=(0.05, 0.5, 0.95)):
+    """Mean and quantiles of each bootstrapped metric as one flat dict."""
+    summary = {}
+    for name, values in distribution.items():
+        if len(values) == 0:
+            continue
+        summary[f"{name}_mean"] = values.mean()
+        for q, value in zip(quantiles, np.quantile(values, quantiles)):
+            summary[f"{name}_p{int(q * 100)}"] = value
+    return summary
+
+
+def bootstrap_risk_by_group(trades, group_columns=("pair_a", "pair_b"), profit_column="profit", resamples=DEFAULT_RESAMPLES, block_size=1, rng=None):
+    """
+    Bootstrapped risk summary for every group of trades (e.g. per pair combination).
+
+    Trades are ordered by time within each group when a time column exists.
+    Returns one row per group.
+    """
+    if "time" in trades.columns:
+        trades = trades.sort_values("time", kind="stable")
+    rng = np.random.default_rng(rng)
+    rows = []
+    for key, group in trades.groupby(list(group_columns), sort=False):
+        summary = summarize_distribution(bootstrap_risk(group[profit_column].to_numpy(), resamples, block_size, rng))
+        if summary:
+            rows.append({**dict(zip(group_columns, key)), "trades": len(group), **summary})
+    return pd.DataFrame(rows)
@@ -0,0 +1,206 @@
+import logging
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+GROUP_COLUMNS = ["pair_a", "pair_b"]
+DEFAULT_WINDOW = "1D"
+DEFAULT_HALFLIFE = "1h"
+
+
+def _group_order(df, group_columns):
+    """Group codes and a (group, time) sort order for df."""
+    codes = df.groupby(group_columns, sort=False).ngroup().to_numpy()
+    times = df["time"].to_numpy(dtype="datetime64[ns]")
+    return codes, times, np.lexsort((times, codes))
+
+
+def rolling_zscores(df, window=DEFAULT_WINDOW, min_periods=2, value_column="adjusted_discrepancy", group_columns=GROUP_COLUMNS):
+    """
+    Time-windowed mean, std and z-score of value_column per pair combination.
+
+    Each row is scored against the rows of its own combination within the
+    trailing window (t - window, t], including itself. Returns a frame with
+    rolling_mean, rolling_std and rolling_zscore aligned to df's index.
+    """
+    codes, times, order = _group_order(df, group_columns)
+    ordered = pd.DataFrame({"group": codes[order], "value": df[value_column].to_numpy(dtype=np.float64)[order]}, index=times[order])
+    rolling = ordered.groupby("group", sort=False)["value"].rolling(window, min_periods=min_periods)
+    # Rows are sorted by (group, time), so the grouped output is already in row order
+    mean = np.empty(len(df))
+    std = np.empty(len(df))
+    mean[order] = rolling.mean().to_numpy()
+    std[order] = rolling.std().to_numpy()
+    return _scores(df, "rolling", mean, std, value_column)
+
+
+def ewm_zscores(df, halflife=DEFAULT_HALFLIFE, value_column="adjusted_discrepancy", group_columns=GROUP_COLUMNS):
+    """
+    Exponentially weighted mean, std and z-score of value_column per pair combination.
+
+    Weights decay with elapsed time, so irregular sampling is handled. The
+    recursion is the one ZScoreEngine applies to live updates; it runs over
+    the k-th observation of every combination at once, so history costs one
+    array step per observation of the longest-lived combination.
+    Returns ewm_mean, ewm_std and ewm_zscore aligned to df's index.
+    """
+    codes, times, order = _group_order(df, group_columns)
+    codes, times = codes[order], times[order].view(np.int64)
+    values = df[value_column].to_numpy(dtype=np.float64)[order]
+    decay_rate = math.log(2) / pd.Timedelta(halflife).value
+
+    # Groups ordered longest first, so the groups still active at step k are a prefix
+    starts = np.r_[0, np.flatnonzero(np.diff(codes)) + 1] if len(codes) else np.zeros(0, dtype=np.int64)
+    lengths = np.diff(np.r_[starts, len(codes)])
+    by_length = np.argsort(-lengths, kind="stable")
+    starts, lengths = starts[by_length], lengths[by_length]
+    active_counts = np.searchsorted(-lengths, -np.arange(int(lengths.max()) if len(lengths) else 0), side="left")
+
+    mean_sorted = np.empty(len(codes))
+    var_sorted = np.zeros(len(codes))
+    mean, var, last = values[starts], np.zeros(len(starts)), times[starts]
+    mean_sorted[starts] = mean
+    for step in range(1, len(active_counts)):
+        active = int(active_counts[step])
+        rows = starts[:active] + step
+        mean[:active], var[:active] = _ewm_step(mean[:active], var[:active], values[rows], times[rows] - last[:active], decay_rate)
+        last[:active] = times[rows]
+        mean_sorted[rows], var_sorted[rows] = mean[:active], var[:active]
+
+    mean = np.empty(len(df))
+    std = np.empty(len(df))
+    mean[order] = mean_sorted
+    std[order] = np.sqrt(var_sorted)
+    return _scores(df, "ewm", mean, std, value_column)
+
+
+def _ewm_step(mean, var, value, elapsed, decay_rate):
+    """One time-decayed EWMA update of mean and variance (scalars or arrays)."""
+    alpha = -np.expm1(-decay_rate * np.maximum(elapsed, 0))
+    diff = value - mean
+    increment = alpha * diff
+    return mean + increment, (1 - alpha) * (var + diff * increment)
+
+
+def _scores(df, prefix, mean, std, value_column):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(std > 0, (df[value_column].to_numpy(dtype=np.float64) - mean) / std, np.nan)
+    return pd.DataFrame({f"{prefix}_mean": mean, f"{prefix}_std": std, f"{prefix}_zscore": z}, index=df.index)
+
+
+class _WindowState:
+    __slots__ = ("points", "count", "mean", "m2")
+
+    def __init__(self):
+        self.points = deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, time, value):
+        self.points.append((time, value))
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove_before(self, cutoff):
+        while self.points and self.points[0][0] <= cutoff:
+            _, value = self.points.popleft()
+            self.count -= 1
+            if self.count == 0:
+                self.mean = self.m2 = 0.0
+                continue
+            delta = value - self.mean
+            self.mean -= delta / self.count
+            self.m2 -= delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(max(self.m2, 0.0) / (self.count - 1)) if self.count > 1 else math.nan
+
+
+class _EwmState:
+    __slots__ = ("last", "mean", "var")
+
+    def __init__(self, time, value, var=0.0):
+        self.last = time
+        self.mean = value
+        self.var = var
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+
+class ZScoreEngine:
+    """
+    Incremental per-pair z-scores for live ticks.
+
+    With window set, statistics cover the trailing time window (each tick
+    enters and leaves a deque once, so updates are amortized O(1)); with
+    halflife set they are exponentially weighted by elapsed time (strictly
+    O(1)). Either way the results match rolling_zscores/ewm_zscores over
+    the same history, so thresholds follow current volatility without
+    rescanning the database.
+    """
+
+    def __init__(self, window=None, halflife=None, min_periods=2):
+        if (window is None) == (halflife is None):
+            raise ValueError("Set exactly one of window or halflife.")
+        self.window = pd.Timedelta(window).value if window is not None else None
+        self.decay_rate = math.log(2) / pd.Timedelta(halflife).value if halflife is not None else None
+        self.min_periods = min_periods
+        self.states = {}
+
+    @classmethod
+    def from_history(cls, df, window=None, halflife=None, min_periods=2, value_column="adjusted_discrepancy", group_columns=GROUP_COLUMNS):
+        """Warm an engine from historical rows so live scoring starts where history ends."""
+        engine = cls(window=window, halflife=halflife, min_periods=min_periods)
+        if df.empty:
+            return engine
+        ordered = df.sort_values("time", kind="stable")
+        if window is not None:
+            # Only rows inside the last window of each combination matter
+            cutoff = ordered["time"].max() - pd.Timedelta(window)
+            ordered = ordered[ordered["time"] > cutoff]
+            for key, time, value in zip(zip(*(ordered[c] for c in group_columns)), ordered["time"], ordered[value_column]):
+                engine.update(key, time, value)
+            return engine
+        scores = ewm_zscores(ordered, halflife, value_column, group_columns)
+        last = ordered.assign(ewm_mean=scores["ewm_mean"], ewm_var=scores["ewm_std"] ** 2).groupby(group_columns, sort=False).tail(1)
+        for row in last.itertuples(index=False):
+            key = tuple(getattr(row, c) for c in group_columns)
+            engine.states[key] = _EwmState(pd.Timestamp(row.time).value, row.ewm_mean, row.ewm_var)
+        return engine
+
+    def update(self, key, time, value):
+        """Add one observation for key and return its (mean, std, zscore)."""
+        time = pd.Timestamp(time).value
+        value = float(value)
+        state = self.states.get(key)
+        if self.window is not None:
+            if state is None:
+                state = self.states[key] = _WindowState()
+            state.add(time, value)
+            state.remove_before(time - self.window)
+            if state.count < self.min_periods:
+                return math.nan, math.nan, math.nan
+        elif state is None:
+            state = self.states[key] = _EwmState(time, value)
+        else:
+            state.mean, state.var = _ewm_step(state.mean, state.var, value, time - state.last, self.decay_rate)
+            state.last = time
+        std = state.std
+        return state.mean, std, (value - state.mean) / std if std > 0 else math.nan
+
+    def threshold(self, key, k=2):
+        """Adaptive threshold mean + k * std for key, or NaN before enough data."""
+        state = self.states.get(key)
+        if state is None or (self.window is not None and state.count < self.min_periods):
+            return math.nan
+        return state.mean + k * state.std
@@ -0,0 +1,109 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def book_to_arrays(books, side, levels=25):
+    """
+    Convert Kraken Depth snapshots into padded (n_books, levels) price/volume arrays.
+
+    books is a list of Depth results ({"asks": [[price, volume, ts], ...], "bids": ...}).
+    side is "asks" or "bids". Missing levels are padded with zero volume.
+    """
+    prices = np.zeros((len(books), levels))
+    volumes = np.zeros((len(books), levels))
+    for row, book in enumerate(books):
+        entries = (book or {}).get(side, [])[:levels]
+        if entries:
+            level_data = np.asarray([entry[:2] for entry in entries], dtype=np.float64)
+            prices[row, :len(level_data)] = level_data[:, 0]
+            volumes[row, :len(level_data)] = level_data[:, 1]
+    return prices, volumes
+
+
+def walk_book(prices, volumes, size):
+    """
+    Fill size units against each book, level by level, in one vectorized pass.
+
+    prices/volumes have shape (n, levels) ordered best level first; size has
+    shape (n,). Returns the filled size (capped by available depth) and the
+    VWAP fill price (NaN where nothing fills).
+    """
+    size = np.broadcast_to(np.asarray(size, dtype=np.float64), (prices.shape[0],))
+    depth_before = np.cumsum(volumes, axis=1) - volumes
+    fills = np.clip(size[:, None] - depth_before, 0, volumes)
+    filled = fills.sum(axis=1)
+    notional = (fills * prices).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        vwap = np.where(filled > 0, notional / filled, np.nan)
+    return filled, vwap
+
+
+def _level_at(cum_volumes, quantity):
+    """Index of the level that fills the unit just above quantity, per row."""
+    return (cum_volumes[:, None, :] <= quantity[:, :, None]).sum(axis=2)
+
+
+def executable_size(ask_prices, ask_volumes, bid_prices, bid_volumes, fee_buy=0.0, fee_sell=0.0, max_size=None):
+    """
+    Largest size at which buying on the ask book and selling on the bid book still pays.
+
+    Both books are walked together: the breakpoints of the combined depth
+    split each opportunity into segments with a constant marginal ask and
+    bid. Since asks only rise and bids only fall, profitable segments form a
+    prefix, so their summed length is the executable size.
+    """
+    n, levels = ask_prices.shape
+    cum_ask = np.cumsum(ask_volumes, axis=1)
+    cum_bid = np.cumsum(bid_volumes, axis=1)
+    depth = np.minimum(cum_ask[:, -1], cum_bid[:, -1])
+    if max_size is not None:
+        depth = np.minimum(depth, np.broadcast_to(np.asarray(max_size, dtype=np.float64), (n,)))
+
+    breakpoints = np.sort(np.concatenate([np.zeros((n, 1)), cum_ask, cum_bid], axis=1), axis=1)
+    breakpoints = np.minimum(breakpoints, depth[:, None])
+    lengths = np.diff(breakpoints, axis=1)
+    starts = breakpoints[:, :-1]
+
+    rows = np.arange(n)[:, None]
+    ask_level = np.minimum(_level_at(cum_ask, starts), levels - 1)
+    bid_level = np.minimum(_level_at(cum_bid, starts), levels - 1)
+    buy_cost = ask_prices[rows, ask_level] * (1 + np.asarray(fee_buy, dtype=np.float64).reshape(-1, 1))
+    sell_proceeds = bid_prices[rows, bid_level] * (1 - np.asarray(fee_sell, dtype=np.float64).reshape(-1, 1))
+    profitable = (sell_proceeds > buy_cost) & (lengths > 0)
+    return np.where(profitable, lengths, 0.0).sum(axis=1)
+
+
+def executable_profit(ask_prices, ask_volumes, bid_prices, bid_volumes, fee_buy=0.0, fee_sell=0.0, max_size=None):
+    """
+    Executable size, per-leg VWAP fills and net profit for a batch of opportunities.
+
+    Row i buys on the book given by ask_prices[i]/ask_volumes[i] and sells on
+    the book given by bid_prices[i]/bid_volumes[i]. Prices must be quoted in
+    the same currency. Fees are decimal taker fees per leg (scalar or per row).
+    Returns a DataFrame with one row per opportunity; slippage is NaN where
+    a book is empty.
+    """
+    size = executable_size(ask_prices, ask_volumes, bid_prices, bid_volumes, fee_buy, fee_sell, max_size)
+    _, buy_vwap = walk_book(ask_prices, ask_volumes, size)
+    _, sell_vwap = walk_book(bid_prices, bid_volumes, size)
+
+    buy_notional = np.nan_to_num(buy_vwap) * size
+    sell_notional = np.nan_to_num(sell_vwap) * size
+    fees = buy_notional * fee_buy + sell_notional * fee_sell
+    # An empty book has no best price to measure slippage from
+    best_ask = np.where(ask_prices[:, 0] > 0, ask_prices[:, 0], np.nan)
+    best_bid = np.where(bid_prices[:, 0] > 0, bid_prices[:, 0], np.nan)
+    return pd.DataFrame({
+        "executable_size": size,
+        "buy_vwap": buy_vwap,
+        "sell_vwap": sell_vwap,
+        "buy_slippage": buy_vwap / best_ask - 1,
+        "sell_slippage": 1 - sell_vwap / best_bid,
+        "gross_profit": sell_notional - buy_notional,
+        "fees": fees,
+        "net_profit": sell_notional - buy_notional - fees,
+    })
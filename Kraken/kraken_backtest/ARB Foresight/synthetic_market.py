@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Synthetic, internally consistent Kraken market data for load and scale tests.
+
+    python synthetic_market.py --pairs 100 --duration 3600 --output-dir synthetic
+    python synthetic_market.py --stream --rate 50000 --duration 600
+    python synthetic_market.py --serve 8765 --rate 50000
+
+The universe comes from AssetPairs-style metadata (a saved AssetPairs
+response or trade_fees.csv). Every asset follows a GBM with jumps whose
+crypto returns share a common market factor, and every pair is priced as
+the cross of its base and quote, so triangles stay consistent except for
+short-lived dislocations: that is where arbitrage appears and vanishes.
+
+Output is Kraken WebSocket v1 messages (ticker, spread, book, ohlc) as
+JSON text, written to a .jsonl file, yielded by an async stream at a
+configurable rate, or served over a local WebSocket, plus REST-shaped OHLC
+files and the universe as asset_pairs.json.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+UNIVERSE_FILE = os.path.join(DIRECTORY, "trade_fees.csv")
+OUTPUT_DIR = os.path.join(DIRECTORY, "synthetic")
+SECONDS_PER_YEAR = 365 * 86400
+
+# Legacy X/Z-prefixed asset codes and the names used in wsname
+LEGACY_ASSETS = {
+    "XXBT": "XBT", "XETH": "ETH", "XLTC": "LTC", "XXRP": "XRP", "XXLM": "XLM", "XXDG": "XDG", "XZEC": "ZEC",
+    "XXMR": "XMR", "XETC": "ETC", "XMLN": "MLN", "XREP": "REP", "ZUSD": "USD", "ZEUR": "EUR", "ZGBP": "GBP",
+    "ZCAD": "CAD", "ZJPY": "JPY", "ZAUD": "AUD", "ZCHF": "CHF",
+}
+NUMERAIRE = "USD"
+FIAT = {"USD", "EUR", "GBP", "CAD", "JPY", "AUD", "CHF"}
+STABLECOINS = {"USDT", "USDC", "DAI", "PYUSD", "TUSD", "USDG", "RLUSD"}
+# Starting USD prices; unlisted assets draw a log-uniform price between 0.001 and 1000
+START_PRICES = {
+    "USD": 1.0, "EUR": 1.08, "GBP": 1.27, "CAD": 0.73, "JPY": 0.0067, "AUD": 0.66, "CHF": 1.12,
+    "XBT": 60000.0, "ETH": 3000.0, "SOL": 150.0, "XRP": 0.5, "DOT": 7.0, "ADA": 0.45, "LTC": 80.0,
+    "XDG": 0.12, "POL": 0.5,
+}
+
+# Annualized volatilities and the share of crypto variance driven by the common market factor
+CRYPTO_VOLATILITY = 0.8
+FIAT_VOLATILITY = 0.08
+STABLE_VOLATILITY = 0.01
+MARKET_SHARE = 0.6
+# Crypto price jumps: per asset per day, with a normal log-size
+JUMP_RATE = 4.0
+JUMP_SIZE = 0.02
+# Pair dislocations from the cross price: per pair per hour, log-size, and half-life in seconds
+DISLOCATION_RATE = 2.0
+DISLOCATION_SIZE = 0.01
+DISLOCATION_HALFLIFE = 20.0
+HALF_SPREAD_BPS = (1.0, 15.0)
+# Trades per pair per second (median) and median trade notional in USD
+TRADE_RATE = 0.2
+TRADE_NOTIONAL = 500.0
+LOT_DECIMALS = 8
+PRICE_DIGITS = 6
+BOOK_DEPTH = 10
+OHLC_INTERVAL = 15
+
+CHANNELS = ("ticker", "spread", "book", "ohlc")
+DEFAULT_CHANNELS = ("ticker", "spread")
+# Pacing sleeps only once the stream is this far ahead of schedule
+PACING_SLACK = 0.002
+
+
+def short_asset(code):
+    """Asset name as used in wsname, e.g. XXBT -> XBT."""
+    return LEGACY_ASSETS.get(code, code)
+
+
+def universe_from_fee_table(fees_df):
+    """AssetPairs-style metadata from the trade_fees.csv layout (Pair, AltName, BaseCurrency, QuoteCurrency)."""
+    universe = {}
+    for row in fees_df.itertuples(index=False):
+        universe[row.Pair] = {
+            "altname": row.AltName,
+            "wsname": f"{short_asset(row.BaseCurrency)}/{short_asset(row.QuoteCurrency)}",
+            "base": row.BaseCurrency,
+            "quote": row.QuoteCurrency,
+            "lot_decimals": LOT_DECIMALS,
+        }
+    return universe
+
+
+def load_universe(path=UNIVERSE_FILE):
+    """Pair metadata from a saved AssetPairs response (.json) or a trade fee table (.csv)."""
+    if path.endswith(".json"):
+        with open(path) as file:
+            data = json.load(file)
+        return data.get("result", data)
+    return universe_from_fee_table(pd.read_csv(path))
+
+
+class SyntheticMarket:
+    """
+    Correlated prices, quotes, trades and candles for every pair of a universe.
+
+    Each step advances the clock by step seconds. Asset log-prices (in USD)
+    move by a common crypto factor, idiosyncratic noise and Poisson jumps;
+    each pair's mid is base / quote times exp(dislocation), where the
+    dislocation decays with DISLOCATION_HALFLIFE and is occasionally
+    shocked. Quotes sit half a spread either side of the mid, rounded to the
+    pair's price decimals; trades print at the bid or the ask.
+    """
+
+    def __init__(self, universe, seed=None, step=1.0, start=None, interval=OHLC_INTERVAL, book_depth=BOOK_DEPTH):
+        self.rng = np.random.default_rng(seed)
+        self.step_seconds = float(step)
+        self.interval = interval
+        self.book_depth = book_depth
+        self.time = float(start if start is not None else int(time.time()) // 60 * 60)
+        self.start = self.time
+
+        self.universe = {name: dict(details) for name, details in universe.items()}
+        self.pairs = list(self.universe)
+        self.wsnames = [details.get("wsname") or name for name, details in self.universe.items()]
+        bases = [short_asset(details["base"]) for details in self.universe.values()]
+        quotes = [short_asset(details["quote"]) for details in self.universe.values()]
+        self.assets = sorted(set(bases) | set(quotes) | {NUMERAIRE})
+        index = {asset: i for i, asset in enumerate(self.assets)}
+        self.base_ids = np.array([index[asset] for asset in bases], dtype=np.int64)
+        self.quote_ids = np.array([index[asset] for asset in quotes], dtype=np.int64)
+
+        n_assets, n_pairs = len(self.assets), len(self.pairs)
+        self.log_price = np.log([self._start_price(asset) for asset in self.assets])
+        crypto = np.array([asset not in FIAT and asset not in STABLECOINS for asset in self.assets])
+        self.volatility = np.where(crypto, CRYPTO_VOLATILITY, np.where([asset in FIAT for asset in self.assets], FIAT_VOLATILITY, STABLE_VOLATILITY))
+        self.volatility[index[NUMERAIRE]] = 0.0
+        self.loading = np.where(crypto, math.sqrt(MARKET_SHARE), 0.0)
+        self.jump_rate = np.where(crypto, JUMP_RATE, 0.0)
+
+        self.dislocation = np.zeros(n_pairs)
+        self.half_spread = self.rng.uniform(*HALF_SPREAD_BPS, n_pairs) / 1e4
+        self.trade_rate = TRADE_RATE * self.rng.lognormal(0, 1, n_pairs)
+        mid = self._mid()
+        self.price_decimals = np.array([
+            int(details["pair_decimals"]) if "pair_decimals" in details else max(0, PRICE_DIGITS - 1 - math.floor(math.log10(price)))
+            for details, price in zip(self.universe.values(), mid)
+        ])
+        self.lot_decimals = np.array([int(details.get("lot_decimals", LOT_DECIMALS)) for details in self.universe.values()])
+        for details, decimals in zip(self.universe.values(), self.price_decimals):
+            details.setdefault("pair_decimals", int(decimals))
+        self._scale = 10.0 ** self.price_decimals
+        self._quote(mid)
+        self.last = mid.copy()
+        self.trade_volume = np.zeros(n_pairs)
+        self.trade_count = np.zeros(n_pairs, dtype=np.int64)
+
+        # Running session statistics for ticker messages
+        self.session_open = mid.copy()
+        self.session_low = mid.copy()
+        self.session_high = mid.copy()
+        self.session_volume = np.zeros(n_pairs)
+        self.session_notional = np.zeros(n_pairs)
+        self.session_trades = np.zeros(n_pairs, dtype=np.int64)
+        # The candle being built and every closed candle per pair
+        self.candle_start = self.time // (interval * 60) * interval * 60
+        self._open_candles(mid)
+        self.candles = [[] for _ in self.pairs]
+
+    def _start_price(self, asset):
+        if asset in START_PRICES:
+            return START_PRICES[asset]
+        if asset in STABLECOINS:
+            return 1.0
+        return 10 ** self.rng.uniform(-3, 3)
+
+    def _mid(self):
+        return np.exp(self.log_price[self.base_ids] - self.log_price[self.quote_ids] + self.dislocation)
+
+    def _quote(self, mid):
+        self.bid = np.floor(mid * (1 - self.half_spread) * self._scale) / self._scale
+        self.ask = np.ceil(mid * (1 + self.half_spread) * self._scale) / self._scale
+
+    def _open_candles(self, price):
+        self.candle_open = price.copy()
+        self.candle_high = price.copy()
+        self.candle_low = price.copy()
+        self.candle_close = price.copy()
+        self.candle_volume = np.zeros(len(self.pairs))
+        self.candle_notional = np.zeros(len(self.pairs))
+        self.candle_count = np.zeros(len(self.pairs), dtype=np.int64)
+
+    @property
+    def elapsed(self):
+        return self.time - self.start
+
+    def usd_price(self, pair_ids=None):
+        """USD price of each pair's base asset."""
+        ids = self.base_ids if pair_ids is None else self.base_ids[pair_ids]
+        return np.exp(self.log_price[ids])
+
+    def step(self):
+        """Advance one step; returns the candles closed by it as {pair index: row}."""
+        dt = self.step_seconds / SECONDS_PER_YEAR
+        n_assets, n_pairs = len(self.assets), len(self.pairs)
+        shocks = self.loading * self.rng.standard_normal() + np.sqrt(1 - self.loading ** 2) * self.rng.standard_normal(n_assets)
+        jumps = self.rng.poisson(self.jump_rate * self.step_seconds / 86400)
+        self.log_price += -0.5 * self.volatility ** 2 * dt + self.volatility * math.sqrt(dt) * shocks
+        self.log_price += np.sqrt(jumps) * JUMP_SIZE * self.rng.standard_normal(n_assets)
+
+        self.dislocation *= 0.5 ** (self.step_seconds / DISLOCATION_HALFLIFE)
+        shocked = np.flatnonzero(self.rng.random(n_pairs) < DISLOCATION_RATE * self.step_seconds / 3600)
+        self.dislocation[shocked] += self.rng.normal(0, DISLOCATION_SIZE, len(shocked))
+        mid = self._mid()
+        self._quote(mid)
+
+        self.time += self.step_seconds
+        closed = {}
+        if self.time >= self.candle_start + self.interval * 60:
+            for i in np.flatnonzero(self.candle_count > 0):
+                closed[int(i)] = self.candle_row(i)
+                self.candles[i].append(closed[int(i)])
+            self.candle_start = self.time // (self.interval * 60) * self.interval * 60
+            self._open_candles(self.last)
+
+        # Trades print at the bid or the ask; pairs without a trade keep their last price
+        self.trade_count = self.rng.poisson(self.trade_rate * self.step_seconds)
+        traded = self.trade_count > 0
+        buys = self.rng.random(n_pairs) < 0.5
+        self.last = np.where(traded, np.where(buys, self.ask, self.bid), self.last)
+        notional = self.trade_count * TRADE_NOTIONAL * self.rng.lognormal(0, 1, n_pairs)
+        self.trade_volume = np.round(notional / self.usd_price(), LOT_DECIMALS)
+
+        self.candle_high = np.where(traded, np.maximum(self.candle_high, self.last), self.candle_high)
+        self.candle_low = np.where(traded, np.minimum(self.candle_low, self.last), self.candle_low)
+        self.candle_close = self.last
+        self.candle_volume += self.trade_volume
+        self.candle_notional += self.trade_volume * self.last
+        self.candle_count += self.trade_count
+        self.session_low = np.minimum(self.session_low, self.last)
+        self.session_high = np.maximum(self.session_high, self.last)
+        self.session_volume += self.trade_volume
+        self.session_notional += self.trade_volume * self.last
+        self.session_trades += self.trade_count
+        return closed
+
+    def _price(self, i, value):
+        return f"{value:.{self.price_decimals[i]}f}"
+
+    def candle_row(self, i):
+        """The current candle of pair i as a REST OHLC row."""
+        vwap = self.candle_notional[i] / self.candle_volume[i] if self.candle_volume[i] else self.candle_close[i]
+        return [
+            int(self.candle_start), self._price(i, self.candle_open[i]), self._price(i, self.candle_high[i]),
+            self._price(i, self.candle_low[i]), self._price(i, self.candle_close[i]), self._price(i, vwap),
+            f"{self.candle_volume[i]:.8f}", int(self.candle_count[i]),
+        ]
+
+    def ticker_message(self, i):
+        vwap = self.session_notional[i] / self.session_volume[i] if self.session_volume[i] else self.last[i]
+        bid, ask, last = self._price(i, self.bid[i]), self._price(i, self.ask[i]), self._price(i, self.last[i])
+        low, high, open_ = self._price(i, self.session_low[i]), self._price(i, self.session_high[i]), self._price(i, self.session_open[i])
+        volume, vwap, trades = f"{self.session_volume[i]:.8f}", self._price(i, vwap), int(self.session_trades[i])
+        return (
+            f'[{i},{{"a":["{ask}",1,"1.00000000"],"b":["{bid}",1,"1.00000000"],"c":["{last}","{self.trade_volume[i]:.8f}"],'
+            f'"v":["{volume}","{volume}"],"p":["{vwap}","{vwap}"],"t":[{trades},{trades}],"l":["{low}","{low}"],'
+            f'"h":["{high}","{high}"],"o":["{open_}","{open_}"]}},"ticker","{self.wsnames[i]}"]'
+        )
+
+    def spread_message(self, i):
+        return (
+            f'[{i},["{self._price(i, self.bid[i])}","{self._price(i, self.ask[i])}","{self.time:.6f}",'
+            f'"1.00000000","1.00000000"],"spread","{self.wsnames[i]}"]'
+        )
+
+    def book_message(self, i):
+        """A book snapshot of book_depth levels a price increment apart, with lognormal volumes."""
+        tick = 1 / self._scale[i]
+        levels = np.arange(self.book_depth)
+        volumes = np.round(TRADE_NOTIONAL * self.rng.lognormal(0, 1, (2, self.book_depth)) / self.usd_price([i])[0], self.lot_decimals[i])
+        stamp = f"{self.time:.6f}"
+        asks = ",".join(f'["{self._price(i, self.ask[i] + level * tick)}","{volume:.{self.lot_decimals[i]}f}","{stamp}"]' for level, volume in zip(levels, volumes[0]))
+        bids = ",".join(f'["{self._price(i, self.bid[i] - level * tick)}","{volume:.{self.lot_decimals[i]}f}","{stamp}"]' for level, volume in zip(levels, volumes[1]))
+        return f'[{i},{{"as":[{asks}],"bs":[{bids}]}},"book-{self.book_depth}","{self.wsnames[i]}"]'
+
+    def ohlc_message(self, i):
+        row = self.candle_row(i)
+        end = self.candle_start + self.interval * 60
+        return (
+            f'[{i},["{self.time:.6f}","{end:.6f}","{row[1]}","{row[2]}","{row[3]}","{row[4]}","{row[5]}","{row[6]}",{row[7]}],'
+            f'"ohlc-{self.interval}","{self.wsnames[i]}"]'
+        )
+
+    def events(self, channels=DEFAULT_CHANNELS):
+        """Advance one step and return its WebSocket messages as (channel, pair index, JSON text)."""
+        self.step()
+        makers = [getattr(self, f"{channel}_message") for channel in channels]
+        output = []
+        for i in range(len(self.pairs)):
+            # Ticker and ohlc only update on trades, as on the exchange
+            traded = self.trade_count[i] > 0
+            for channel, make in zip(channels, makers):
+                if traded or channel in ("spread", "book"):
+                    output.append((channel, i, make(i)))
+        return output
+
+    def messages(self, channels=DEFAULT_CHANNELS):
+        """Advance one step and return its WebSocket messages as JSON text."""
+        return [message for _, _, message in self.events(channels)]
+
+    def rest_ohlc(self, i):
+        """Closed candles of pair i as a /0/public/OHLC response."""
+        rows = self.candles[i]
+        return {"error": [], "result": {self.pairs[i]: rows, "last": rows[-1][0] if rows else int(self.candle_start)}}
+
+    def asset_pairs(self):
+        """The universe as a /0/public/AssetPairs response."""
+        return {"error": [], "result": self.universe}
+
+
+async def stream(market, rate=None, channels=DEFAULT_CHANNELS, duration=None):
+    """
+    Yield WebSocket messages as JSON text at rate messages per second.
+
+    rate=None streams as fast as the consumer takes them. Simulated time
+    advances step seconds per batch regardless of the wall-clock rate, so a
+    high rate replays hours of market in minutes. Stops after duration
+    simulated seconds, or never.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    sent = 0
+    while duration is None or market.elapsed < duration:
+        for message in market.messages(channels):
+            yield message
+            sent += 1
+            if rate:
+                ahead = started + sent / rate - loop.time()
+                if ahead > PACING_SLACK:
+                    await asyncio.sleep(ahead)
+        if not rate:
+            # Let other tasks run between batches
+            await asyncio.sleep(0)
+
+
+def write_files(market, output_dir=OUTPUT_DIR, duration=3600, channels=DEFAULT_CHANNELS):
+    """
+    Simulate duration seconds into output_dir.
+
+    Writes asset_pairs.json, messages.jsonl (one WebSocket message per line)
+    and ohlc/<pair>_<interval>.json in the REST OHLC layout.
+    """
+    os.makedirs(os.path.join(output_dir, "ohlc"), exist_ok=True)
+    count = 0
+    with open(os.path.join(output_dir, "messages.jsonl"), "w") as file:
+        while market.elapsed < duration:
+            batch = market.messages(channels)
+            if batch:
+                file.write("\n".join(batch) + "\n")
+            count += len(batch)
+    for i, pair in enumerate(market.pairs):
+        with open(os.path.join(output_dir, "ohlc", f"{pair}_{market.interval}.json"), "w") as file:
+            json.dump(market.rest_ohlc(i), file)
+    with open(os.path.join(output_dir, "asset_pairs.json"), "w") as file:
+        json.dump(market.asset_pairs(), file)
+    logger.info(f"Wrote {count} messages and {sum(map(len, market.candles))} candles for {len(market.pairs)} pairs to {output_dir}.")
+    return count
+
+
+async def measure_stream(market, rate, channels, duration):
+    """Consume the stream, decoding every message, and log the achieved rate."""
+    started = time.perf_counter()
+    count = 0
+    async for message in stream(market, rate, channels, duration):
+        json.loads(message)
+        count += 1
+    elapsed = time.perf_counter() - started
+    logger.info(f"Streamed {count} messages covering {market.elapsed:.0f} s of market in {elapsed:.2f} s: {count / elapsed:,.0f} msg/s.")
+
+
+async def serve(universe, seed, step, rate, channels, host="127.0.0.1", port=8765):
+    """Serve the stream at ws://host:port/ as a stand-in for Kraken's public WebSocket; each client gets its own seeded market."""
+    from aiohttp import web
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        market = SyntheticMarket(universe, seed=seed, step=step)
+        logger.info(f"Client {request.remote} connected.")
+
+        async def send():
+            async for message in stream(market, rate, channels):
+                await ws.send_str(message)
+
+        sender = asyncio.create_task(send())
+        try:
+            # Reading is what notices the client's close handshake
+            async for _ in ws:
+                pass
+        finally:
+            sender.cancel()
+        logger.info(f"Client {request.remote} disconnected after {market.elapsed:.0f} simulated seconds.")
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving synthetic market data at ws://{host}:{port}/")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="synthetic_market", description="Generate synthetic Kraken market data.")
+    parser.add_argument("--universe", default=UNIVERSE_FILE, help="AssetPairs response (.json) or trade fee table (.csv)")
+    parser.add_argument("--pairs", type=int, help="Only the first N pairs of the universe")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed; the same seed replays the same market")
+    parser.add_argument("--step", type=float, default=1.0, help="Simulated seconds per step")
+    parser.add_argument("--duration", type=float, default=3600, help="Simulated seconds to generate")
+    parser.add_argument("--channels", default=",".join(DEFAULT_CHANNELS), help=f"Comma list of {', '.join(CHANNELS)}")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="Directory for generated files")
+    parser.add_argument("--stream", action="store_true", help="Stream in-process and report the achieved message rate instead of writing files")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Serve the stream over a local WebSocket")
+    parser.add_argument("--rate", type=float, help="Messages per second for --stream and --serve (default: as fast as possible)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    channels = tuple(channel.strip() for channel in args.channels.split(",") if channel.strip())
+    unknown = sorted(set(channels) - set(CHANNELS))
+    if unknown:
+        logger.error(f"Unknown channels {unknown}; choose from {CHANNELS}")
+        return 2
+    universe = load_universe(args.universe)
+    if args.pairs:
+        universe = dict(list(universe.items())[:args.pairs])
+    logger.info(f"Simulating {len(universe)} pairs.")
+
+    if args.serve:
+        try:
+            asyncio.run(serve(universe, args.seed, args.step, args.rate, channels, port=args.serve))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    market = SyntheticMarket(universe, seed=args.seed, step=args.step)
+    if args.stream:
+        asyncio.run(measure_stream(market, args.rate, channels, args.duration))
+    else:
+        write_files(market, args.output_dir, args.duration, channels)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
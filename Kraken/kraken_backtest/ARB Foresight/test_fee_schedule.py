@@ -0,0 +1,61 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fee_schedule import FeeSchedule, net_of_fees
+from pipeline import add_profit, merge_fees, normalize
+
+
+def fee_table(taker_percent):
+    return pd.DataFrame({"Pair": ["XBTUSD", "XBTEUR"], "TakerFee%": taker_percent, "MakerFee%": 0.16})
+
+
+def opportunities(raw_column):
+    """Rows in the layout of compare_pairs (discrepancy) or of recorded comparisons (raw_discrepancy)."""
+    return pd.DataFrame({
+        "time": pd.date_range("2024-01-01", periods=3, freq="min"),
+        "pair_a": "XBTUSD",
+        "pair_b": "XBTEUR",
+        raw_column: [2.0, 3.0, 4.0],
+        # Written with 0.4% fees on both legs
+        "adjusted_discrepancy": [1.992, 2.992, 3.992],
+        "fee_a": 0.004,
+        "fee_b": 0.004,
+        "volume_a": [10.0, 20.0, 30.0],
+    })
+
+
+def profit(df, taker_percent):
+    return add_profit(normalize(merge_fees(df, FeeSchedule.from_fee_table(fee_table(taker_percent)))))["profit"]
+
+
+@pytest.mark.parametrize("raw_column", ["discrepancy", "raw_discrepancy"])
+def test_fee_change_reaches_profit(raw_column):
+    df = opportunities(raw_column)
+
+    at_40bp = profit(df, 0.4)
+    at_20bp = profit(df, 0.2)
+
+    np.testing.assert_allclose(at_40bp, (df[raw_column] - 0.008) * df["volume_a"])
+    np.testing.assert_allclose(at_20bp, (df[raw_column] - 0.004) * df["volume_a"])
+
+
+def test_fees_are_taken_out_once():
+    df = opportunities("raw_discrepancy")
+
+    net_of_fees(net_of_fees(df))
+
+    np.testing.assert_allclose(df["adjusted_discrepancy"], df["raw_discrepancy"] - 0.008)
+
+
+def test_without_raw_discrepancy_keeps_adjusted_and_warns(caplog):
+    df = opportunities("discrepancy").drop(columns="discrepancy")
+    df["fee_a"] = df["fee_b"] = 0.001
+
+    with caplog.at_level(logging.WARNING):
+        net_of_fees(df)
+
+    np.testing.assert_allclose(df["adjusted_discrepancy"], [1.992, 2.992, 3.992])
+    assert "No raw discrepancy column" in caplog.text
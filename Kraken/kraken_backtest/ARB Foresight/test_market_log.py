@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from market_log import MAGIC, MarketLogReader, MarketLogWriter, Record
+
+
+def ohlc_payload(i):
+    return f'{{"error":[],"result":{{"XXBTZUSD":[[{1700000000 + 60 * i},"{60000 + i}.0","1.5",{i}]],"last":{i}}}}}'
+
+
+def sample_records():
+    records = []
+    for i in range(300):
+        # Out-of-order receive times and payloads that share prefixes, suffixes or nothing
+        records.append(Record(1_000_000_000 + i * 1_000 - (i % 7) * 3_000, "ohlc-15", ohlc_payload(i).encode()))
+        records.append(Record(1_000_000_500 + i * 1_000, "ohlc-60", ohlc_payload(i // 10).encode()))
+        if i % 50 == 0:
+            records.append(Record(1_000_000_700 + i * 1_000, "cycle", b""))
+            records.append(Record(1_000_000_800 + i * 1_000, "binary", bytes(range(256)) * (i // 50 + 1)))
+    return records
+
+
+def write(path, records, block_bytes=4096):
+    with MarketLogWriter(path, block_bytes=block_bytes) as writer:
+        for record in records:
+            writer.record(record.source, record.payload, record.time_ns)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "market.arblog")
+    records = sample_records()
+
+    write(path, records)
+
+    reader = MarketLogReader(path)
+    assert len(list(reader.blocks())) > 1
+    assert list(reader) == records
+
+
+def test_str_payloads_are_stored_as_utf8(tmp_path):
+    path = str(tmp_path / "market.arblog")
+
+    with MarketLogWriter(path) as writer:
+        writer.record("meta", '{"pair": "ÆTHUSD"}', 5)
+
+    assert list(MarketLogReader(path)) == [Record(5, "meta", '{"pair": "ÆTHUSD"}'.encode())]
+
+
+def test_read_time_range(tmp_path):
+    path = str(tmp_path / "market.arblog")
+    records = sample_records()
+    write(path, records, block_bytes=512)
+    start, end = 1_000_050_000, 1_000_120_000
+
+    selected = list(MarketLogReader(path).read(start, end))
+
+    assert selected == [record for record in records if start <= record.time_ns < end]
+
+
+def test_append_after_torn_tail(tmp_path):
+    path = str(tmp_path / "market.arblog")
+    records = sample_records()
+    first, second = records[:400], records[400:]
+    write(path, first, block_bytes=1024)
+    intact = os.path.getsize(path)
+    # A crash in the middle of writing the next block
+    with MarketLogWriter(path, block_bytes=1 << 30) as writer:
+        for record in second[:100]:
+            writer.record(record.source, record.payload, record.time_ns)
+        writer.flush()
+        writer.file.truncate(writer.file.tell() - 10)
+
+    assert list(MarketLogReader(path)) == first
+
+    write(path, second, block_bytes=1024)
+
+    assert os.path.getsize(path) > intact
+    assert list(MarketLogReader(path)) == records
+
+
+def test_without_auto_flush_blocks_wait_for_flush(tmp_path):
+    path = str(tmp_path / "market.arblog")
+    records = sample_records()
+
+    with MarketLogWriter(path, block_bytes=512, auto_flush=False) as writer:
+        for record in records:
+            writer.record(record.source, record.payload, record.time_ns)
+        assert writer.file.tell() == len(MAGIC)
+        writer.flush()
+
+    assert len(list(MarketLogReader(path).blocks())) == 1
+    assert list(MarketLogReader(path)) == records
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not_a_log.bin"
+    path.write_bytes(b"X" * len(MAGIC))
+
+    with pytest.raises(ValueError):
+        MarketLogReader(str(path))
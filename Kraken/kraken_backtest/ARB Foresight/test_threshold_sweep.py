@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from threshold_sweep import WEIGHT_CAP, sweep_thresholds, sweep_thresholds_by_group
+
+GRID = np.arange(0, 3.1, 0.25)
+
+
+def brute_force(values, profits, threshold_values, std):
+    """Reference for sweep_thresholds: filter and weigh every threshold separately."""
+    rows = []
+    for t in threshold_values:
+        selected = values > t
+        weights = np.exp(-np.minimum((values[selected] - t) / std, WEIGHT_CAP))
+        rows.append((selected.sum(), profits[selected].sum(), (profits[selected] * weights).sum()))
+    return np.array(rows)
+
+
+def make_groups(seed=0, sizes=(50, 200, 7, 1000)):
+    rng = np.random.default_rng(seed)
+    groups = np.concatenate([np.full(size, g) for g, size in enumerate(sizes)])
+    # Each group has its own location and spread, as pair combinations do
+    values = rng.normal(size=len(groups)) * (groups + 1) + groups * 10
+    profits = rng.normal(size=len(groups))
+    order = rng.permutation(len(groups))
+    return groups[order], values[order], profits[order]
+
+
+def test_sweep_thresholds_matches_brute_force():
+    rng = np.random.default_rng(1)
+    values, profits = rng.normal(size=500), rng.normal(size=500)
+    thresholds = np.linspace(-2, 2, 17)
+
+    sweep = sweep_thresholds(values, profits, thresholds, std=0.7)
+
+    expected = brute_force(values, profits, thresholds, 0.7)
+    np.testing.assert_array_equal(sweep["num_trades"], expected[:, 0])
+    np.testing.assert_allclose(sweep["profit"], expected[:, 1], atol=1e-9)
+    np.testing.assert_allclose(sweep["weighted_profit"], expected[:, 2], atol=1e-9)
+
+
+def test_by_group_matches_per_group_sweep():
+    groups, values, profits = make_groups()
+
+    sweep = sweep_thresholds_by_group(groups, values, profits, GRID)
+
+    for g in range(4):
+        mask = groups == g
+        mean, std = values[mask].mean(), values[mask].std(ddof=1)
+        expected = sweep_thresholds(values[mask], profits[mask], mean + GRID * std, std)
+        assert sweep["count"][g] == mask.sum()
+        assert sweep["mean"][g] == pytest.approx(mean)
+        assert sweep["std"][g] == pytest.approx(std)
+        np.testing.assert_array_equal(sweep["num_trades"][g], expected["num_trades"])
+        np.testing.assert_allclose(sweep["profit"][g], expected["profit"], atol=1e-9)
+        np.testing.assert_allclose(sweep["weighted_profit"][g], expected["weighted_profit"], atol=1e-9)
+
+
+def test_by_group_skips_degenerate_groups_and_nans():
+    groups = np.array([0, 1, 1, 1, 2, 2, 2, 2])
+    values = np.array([5.0, 2.0, 2.0, 2.0, 0.0, 1.0, np.nan, 3.0])
+    profits = np.ones(len(values))
+
+    sweep = sweep_thresholds_by_group(groups, values, profits, GRID, n_groups=4)
+
+    # A single row, a constant group and an empty group cannot be standardized
+    assert np.isnan(sweep["std"][[0, 1, 3]]).all()
+    assert not sweep["num_trades"][[0, 1, 3]].any()
+    assert not sweep["profit"][[0, 1, 3]].any()
+    # The NaN row is ignored rather than poisoning its group
+    assert sweep["count"][2] == 3
+    expected = sweep_thresholds(values[[4, 5, 7]], profits[[4, 5, 7]], 4 / 3 + GRID * sweep["std"][2], sweep["std"][2])
+    np.testing.assert_array_equal(sweep["num_trades"][2], expected["num_trades"])
+    np.testing.assert_allclose(sweep["weighted_profit"][2], expected["weighted_profit"], atol=1e-12)
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from walk_forward import _load_segments, cache_segment_features, walk_forward
+
+
+def history(days=8, seed=0):
+    rng = np.random.default_rng(seed)
+    n = days * 500
+    return pd.DataFrame({
+        "time": pd.date_range("2024-01-01", periods=n, freq=pd.Timedelta(days=1) / 500),
+        "adjusted_discrepancy": rng.normal(size=n),
+        "profit": rng.normal(size=n),
+    })
+
+
+def cache_bytes(cache_dir):
+    return sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+
+def test_pooled_segment_stats_match_whole_window(tmp_path):
+    rng = np.random.default_rng(3)
+    values, profits = rng.normal(5, 2, 1000), rng.normal(size=1000)
+    values[::97] = np.nan
+
+    paths = cache_segment_features(values, profits, [(0, 10), (10, 300), (300, 301), (301, 1000)], str(tmp_path))
+    merged_values, merged_profits, mean, std = _load_segments(paths)
+
+    assert len(merged_values) == len(merged_profits) == 1000
+    assert mean == pytest.approx(np.nanmean(values))
+    assert std == pytest.approx(np.nanstd(values, ddof=1))
+
+
+def test_appended_history_reuses_earlier_folds(tmp_path):
+    df = history()
+    cache_dir = str(tmp_path)
+
+    before, _ = walk_forward(df[df["time"] < "2024-01-06"], freq="D", workers=1, cache_dir=cache_dir)
+    size_before = cache_bytes(cache_dir)
+    after, _ = walk_forward(df, freq="D", workers=1, cache_dir=cache_dir)
+
+    pd.testing.assert_frame_equal(before, after.iloc[:len(before)])
+    # Each appended day adds one segment and one result, not another copy of the history
+    assert cache_bytes(cache_dir) < 2 * size_before
+
+
+def test_cache_is_trimmed_to_max_bytes(tmp_path):
+    df = history()
+    cache_dir = str(tmp_path)
+
+    expected, _ = walk_forward(df, freq="D", workers=1, cache_dir=cache_dir)
+    max_bytes = cache_bytes(cache_dir) // 2
+    trimmed, _ = walk_forward(df, freq="D", workers=1, cache_dir=cache_dir, max_bytes=max_bytes)
+
+    assert 0 < cache_bytes(cache_dir) <= max_bytes
+    pd.testing.assert_frame_equal(expected, trimmed)
@@ -0,0 +1,179 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Weights are exp(-clip(distance / std, 0, WEIGHT_CAP)) as in backtest_trades_with_weights
+WEIGHT_CAP = 10
+
+
+def sweep_thresholds(values, profits, threshold_values, std):
+    """
+    Evaluate every threshold of a grid in one pass over sorted values.
+
+    For each threshold t, trades are the rows with value > t. Returns the
+    trade count, plain profit and weighted profit, where each trade is
+    weighted by exp(-min((value - t) / std, WEIGHT_CAP)).
+
+    Values are sorted once; suffix sums of profit and profit * exp(-value / std)
+    then give each threshold's totals with two binary searches, so the cost
+    is O(n log n + grid * log n) instead of O(grid * n). Inputs are not
+    modified.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    profits = np.asarray(profits, dtype=np.float64)
+    threshold_values = np.asarray(threshold_values, dtype=np.float64)
+    valid = ~(np.isnan(values) | np.isnan(profits))
+    values, profits = values[valid], profits[valid]
+
+    order = np.argsort(values, kind="stable")
+    values, profits = values[order], profits[order]
+    n = len(values)
+
+    # Exponents are taken relative to the lowest threshold so that every term
+    # that can fall inside a weighting window is at most 1
+    reference = threshold_values.min() if len(threshold_values) else 0.0
+    exponent = np.minimum(-(values - reference) / std, 700)
+    decayed = profits * np.exp(exponent)
+
+    suffix_profit = np.concatenate((np.cumsum(profits[::-1])[::-1], [0.0]))
+    suffix_decayed = np.concatenate((np.cumsum(decayed[::-1])[::-1], [0.0]))
+
+    start = np.searchsorted(values, threshold_values, side="right")
+    cap = np.searchsorted(values, threshold_values + WEIGHT_CAP * std, side="left")
+    cap = np.maximum(cap, start)
+
+    window = (suffix_decayed[start] - suffix_decayed[cap]) * np.exp((threshold_values - reference) / std)
+    capped = suffix_profit[cap] * np.exp(-WEIGHT_CAP)
+
+    return pd.DataFrame({
+        "threshold_value": threshold_values,
+        "num_trades": n - start,
+        "profit": suffix_profit[start],
+        "weighted_profit": window + capped,
+    })
+
+
+def sweep_thresholds_by_group(groups, values, profits, grid, n_groups=None):
+    """
+    Evaluate a threshold grid separately for every group in one vectorized pass.
+
+    Group g's thresholds are mean_g + grid * std_g, using its own mean and
+    sample std. Each value becomes a z-score (value - mean_g) / std_g, so a
+    grid point k selects z > k and weighs a trade by exp(-min(z - k,
+    WEIGHT_CAP)), exactly as sweep_thresholds does for one group.
+
+    Rows are sorted by (group, z) once. Segmented suffix sums then give
+    every (group, grid point) total from two binary searches on a composite
+    key group * span + z, where z is clipped to a band that leaves every
+    result unchanged. Returns a dict of per-group mean, std and count and
+    (n_groups, len(grid)) arrays num_trades, profit and weighted_profit.
+    Groups with fewer than two rows or zero spread get NaN thresholds and
+    no trades.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    profits = np.asarray(profits, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+    valid = ~(np.isnan(values) | np.isnan(profits))
+    groups, values, profits = groups[valid], values[valid], profits[valid]
+    if n_groups is None:
+        n_groups = int(groups.max()) + 1 if len(groups) else 0
+
+    count = np.bincount(groups, minlength=n_groups).astype(np.float64)
+    total = np.bincount(groups, weights=values, minlength=n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        variance = (np.bincount(groups, weights=(values - mean[groups]) ** 2, minlength=n_groups)) / (count - 1)
+    std = np.sqrt(variance)
+    usable = (count > 1) & (std > 0)
+    scale = np.where(usable, std, 1.0)
+
+    # Outside [low, high] a z-score is never selected or always at the weight cap
+    low = grid.min() - 1 if len(grid) else 0.0
+    high = (grid.max() if len(grid) else 0.0) + WEIGHT_CAP + 1
+    z = np.clip((values - mean[groups]) / scale[groups], low, high)
+    z[~usable[groups]] = low
+    span = high - low + 1
+
+    order = np.lexsort((z, groups))
+    groups, z, profits = groups[order], z[order], profits[order]
+    keys = groups * span + (z - low)
+    decayed = profits * np.exp(-(z - low))
+
+    suffix_profit = np.concatenate((np.cumsum(profits[::-1])[::-1], [0.0]))
+    suffix_decayed = np.concatenate((np.cumsum(decayed[::-1])[::-1], [0.0]))
+    ends = np.cumsum(count).astype(np.int64)[:, None]
+
+    base = np.arange(n_groups)[:, None] * span
+    start = np.searchsorted(keys, base + (grid - low), side="right")
+    cap = np.maximum(np.searchsorted(keys, base + (grid + WEIGHT_CAP - low), side="left"), start)
+    # The lowest z of each group is the clip floor, which no grid point selects
+    start = np.minimum(start, ends)
+    cap = np.minimum(cap, ends)
+
+    profit = suffix_profit[start] - suffix_profit[ends]
+    window = (suffix_decayed[start] - suffix_decayed[cap]) * np.exp(grid - low)
+    capped = (suffix_profit[cap] - suffix_profit[ends]) * np.exp(-WEIGHT_CAP)
+    num_trades = np.where(usable[:, None], ends - start, 0)
+
+    return {
+        "mean": mean,
+        "std": np.where(usable, std, np.nan),
+        "count": count.astype(np.int64),
+        "num_trades": num_trades,
+        "profit": np.where(usable[:, None], profit, 0.0),
+        "weighted_profit": np.where(usable[:, None], window + capped, 0.0),
+    }
+
+
+def optimize_group_thresholds(df, grid, group_columns=("pair_a", "pair_b"), min_trades=1):
+    """
+    Choose the weighted-profit-maximizing threshold for every pair combination.
+
+    Grid points with fewer than min_trades trades are not eligible. Returns
+    one row per group with the chosen multiplier k, its threshold_value and
+    the in-sample totals; groups with no eligible grid point are dropped.
+    """
+    group_columns = list(group_columns)
+    grouped = df.groupby(group_columns, sort=False)
+    codes = grouped.ngroup().to_numpy()
+    uniques = grouped.size().index
+    grid = np.asarray(grid, dtype=np.float64)
+    sweep = sweep_thresholds_by_group(
+        codes, df["adjusted_discrepancy"].to_numpy(), df["profit"].to_numpy(), grid, n_groups=len(uniques)
+    )
+
+    eligible = sweep["num_trades"] >= min_trades
+    scores = np.where(eligible, sweep["weighted_profit"], -np.inf)
+    chosen = np.argmax(scores, axis=1)
+    rows = np.arange(len(uniques))
+    keep = eligible[rows, chosen] & ~np.isnan(sweep["std"])
+
+    table = uniques.to_frame(index=False)
+    table = table.assign(
+        mean=sweep["mean"],
+        std=sweep["std"],
+        count=sweep["count"],
+        k=grid[chosen],
+        threshold_value=sweep["mean"] + grid[chosen] * sweep["std"],
+        num_trades=sweep["num_trades"][rows, chosen],
+        profit=sweep["profit"][rows, chosen],
+        weighted_profit=sweep["weighted_profit"][rows, chosen],
+    )[keep].reset_index(drop=True)
+    logger.info(f"Chose thresholds for {len(table)} of {len(uniques)} pair combinations.")
+    return table
+
+
+def load_threshold_table(file_path, group_columns=("pair_a", "pair_b")):
+    """Load a saved per-group threshold table as a Series indexed by group."""
+    table = pd.read_csv(file_path)
+    return table.set_index(list(group_columns))["threshold_value"]
+
+
+def lookup_thresholds(table, frame, default, group_columns=("pair_a", "pair_b")):
+    """Per-row thresholds for frame from a threshold table, default where a group has none."""
+    positions = table.index.get_indexer(pd.MultiIndex.from_frame(frame[list(group_columns)]))
+    return np.where(positions >= 0, table.to_numpy()[positions], default)
@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+from result_cache import code_version
+from threshold_sweep import sweep_thresholds
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FOLD_CACHE_DIR = os.path.join(DIRECTORY, "cache", "folds")
+# Least recently used segment and result files are evicted beyond this size
+FOLD_CACHE_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_GRID = np.arange(1, 5.1, 0.1)
+# Cached fold evaluations are invalidated whenever the code that produced them changes
+CODE_VERSION = code_version(os.path.abspath(__file__), os.path.join(DIRECTORY, "threshold_sweep.py"))
+
+
+def make_folds(times, n_folds=5, min_train_fraction=0.3, expanding=True):
+    """
+    Split time-sorted rows into rolling-origin train/test folds.
+
+    The first min_train_fraction of history is only ever used for training;
+    the rest is cut into n_folds consecutive test windows. Each fold trains on
+    everything before its test window (expanding) or on a window of the same
+    length as the initial training span (rolling). Returns (train, test)
+    index slices into the time-sorted rows.
+    """
+    n = len(times)
+    first_test = int(n * min_train_fraction)
+    edges = np.linspace(first_test, n, n_folds + 1).astype(int)
+    folds = []
+    for test_start, test_stop in zip(edges[:-1], edges[1:]):
+        if test_stop <= test_start:
+            continue
+        train_start = 0 if expanding else max(0, test_start - first_test)
+        folds.append((slice(train_start, test_start), slice(test_start, test_stop)))
+    return folds
+
+
+def make_period_folds(times, freq="D", min_train_periods=3, expanding=True):
+    """
+    Rolling-origin folds whose test windows are calendar periods of freq.
+
+    times must be sorted. The first min_train_periods periods are only ever
+    used for training; every later period is one test window, trained on
+    everything before it (expanding) or on the min_train_periods periods
+    just before it (rolling). Because the boundaries are fixed in calendar
+    time, appending new history leaves every earlier fold's rows unchanged,
+    so their cached features and results are reused.
+    """
+    periods = pd.DatetimeIndex(times).floor(freq)
+    starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]]) if len(periods) else np.zeros(0, dtype=int)
+    edges = np.append(starts, len(periods))
+    folds = []
+    for number in range(min_train_periods, len(starts)):
+        train_start = 0 if expanding else edges[number - min_train_periods]
+        folds.append((slice(int(train_start), int(edges[number])), slice(int(edges[number]), int(edges[number + 1]))))
+    return folds
+
+
+def _segments(folds):
+    """Split the rows covered by folds at every fold boundary; returns the (start, stop) segments."""
+    edges = sorted({edge for train, test in folds for edge in (train.start, train.stop, test.start, test.stop)})
+    return [(start, stop) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+def _segment_key(values, profits, start, stop):
+    """Content hash of one segment's rows."""
+    digest = hashlib.sha1()
+    for array in (values[start:stop], profits[start:stop]):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def cache_segment_features(values, profits, segments, cache_dir=FOLD_CACHE_DIR):
+    """
+    Write each segment's feature arrays to an .npz file keyed by its content.
+
+    A segment is stored once however many folds train or test on it, so
+    the cache grows with the history rather than with folds * history, and
+    appending a period only hashes and writes that period. Files that
+    already exist are reused. Returns the file paths.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = []
+    for start, stop in segments:
+        path = os.path.join(cache_dir, f"segment_{_segment_key(values, profits, start, stop)}.npz")
+        if not os.path.exists(path):
+            # Stored presorted by value: concatenated segments sort as a merge of runs
+            order = np.argsort(values[start:stop], kind="stable")
+            segment_values = values[start:stop][order]
+            valid = segment_values[~np.isnan(segment_values)]
+            mean = valid.mean() if len(valid) else 0.0
+            np.savez(
+                path,
+                values=segment_values,
+                profits=profits[start:stop][order],
+                count=len(valid),
+                mean=mean,
+                m2=((valid - mean) ** 2).sum(),
+            )
+        else:
+            # Reads count as use for the cache's LRU eviction
+            os.utime(path)
+        paths.append(path)
+    return paths
+
+
+def _load_segments(paths):
+    """Concatenated values and profits of segments, with their pooled mean and sample std."""
+    values, profits = [], []
+    count, mean, m2 = 0, 0.0, 0.0
+    for path in paths:
+        with np.load(path) as segment:
+            values.append(segment["values"])
+            profits.append(segment["profits"])
+            # Chan et al.'s pairwise update of count, mean and sum of squared deviations
+            n, segment_mean, segment_m2 = int(segment["count"]), float(segment["mean"]), float(segment["m2"])
+        if n:
+            delta = segment_mean - mean
+            total = count + n
+            mean += delta * n / total
+            m2 += segment_m2 + delta ** 2 * count * n / total
+            count = total
+    std = np.sqrt(m2 / (count - 1)) if count > 1 else np.nan
+    return np.concatenate(values), np.concatenate(profits), mean if count else np.nan, std
+
+
+def evaluate_fold(train_paths, test_paths, grid):
+    """
+    Fit the threshold on a fold's training segments and score the grid out of sample.
+
+    Thresholds are mean + k * std with mean/std taken from the training
+    window only, so the test window never leaks into the fit.
+    """
+    train_values, train_profits, mean, std = _load_segments(train_paths)
+    test_values, test_profits, _, _ = _load_segments(test_paths)
+    threshold_values = mean + grid * std
+    train = sweep_thresholds(train_values, train_profits, threshold_values, std)
+    test = sweep_thresholds(test_values, test_profits, threshold_values, std)
+    chosen = int(np.argmax(train["weighted_profit"].to_numpy()))
+    return {
+        "grid": grid,
+        "chosen": chosen,
+        "train_weighted_profit": train["weighted_profit"].to_numpy(),
+        "test_weighted_profit": test["weighted_profit"].to_numpy(),
+        "test_profit": test["profit"].to_numpy(),
+        "test_trades": test["num_trades"].to_numpy(),
+    }
+
+
+def _result_path(cache_dir, train_paths, test_paths, grid):
+    """Cache file of a fold's evaluation over grid, keyed by its segments, the grid and the code."""
+    digest = hashlib.sha1()
+    for path in (*train_paths, "|", *test_paths):
+        digest.update(os.path.basename(path).encode())
+    digest.update(np.ascontiguousarray(grid).tobytes() + CODE_VERSION.encode())
+    return os.path.join(cache_dir, f"result_{digest.hexdigest()}.npz")
+
+
+def evict_fold_cache(cache_dir=FOLD_CACHE_DIR, max_bytes=FOLD_CACHE_MAX_BYTES):
+    """Remove least recently used files until the fold cache fits in max_bytes."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+@profiled()
+def walk_forward(df, grid=DEFAULT_GRID, n_folds=5, expanding=True, workers=None, cache_dir=FOLD_CACHE_DIR, freq=None, min_train_periods=3,
+                 max_bytes=FOLD_CACHE_MAX_BYTES):
+    """
+    Walk-forward threshold optimization over adjusted_discrepancy/profit.
+
+    Folds are n_folds equal slices of the history, or with freq one fold per
+    calendar period (see make_period_folds). Features are cached under
+    cache_dir per segment between fold boundaries, and evaluations per fold,
+    so with freq a run over appended history only hashes, stores and
+    evaluates the new periods. The cache is trimmed to max_bytes, least
+    recently used files first.
+
+    Returns (folds_df, grid_df): one row per fold with the threshold chosen
+    in-sample and its out-of-sample result, and per-grid-point totals of the
+    out-of-sample results across all folds. df is not modified.
+    """
+    ordered = df.sort_values("time", kind="stable") if "time" in df.columns else df
+    values = ordered["adjusted_discrepancy"].to_numpy(dtype=np.float64)
+    profits = ordered["profit"].to_numpy(dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+
+    if freq is not None:
+        folds = make_period_folds(ordered["time"].to_numpy(), freq, min_train_periods, expanding)
+    else:
+        folds = make_folds(np.arange(len(values)), n_folds=n_folds, expanding=expanding)
+    if not folds:
+        logger.warning("Not enough history for walk-forward folds.")
+        return pd.DataFrame(), pd.DataFrame()
+    segments = _segments(folds)
+    segment_paths = dict(zip(segments, cache_segment_features(values, profits, segments, cache_dir)))
+    fold_paths = [
+        tuple([segment_paths[segment] for segment in segments if window.start <= segment[0] and segment[1] <= window.stop] for window in fold)
+        for fold in folds
+    ]
+    result_paths = [_result_path(cache_dir, train_paths, test_paths, grid) for train_paths, test_paths in fold_paths]
+    missing = [i for i, path in enumerate(result_paths) if not os.path.exists(path)]
+    logger.info(f"Evaluating {len(grid)} thresholds over {len(missing)} of {len(folds)} walk-forward folds; the rest are cached.")
+
+    # Workers load their fold's segments from the cache files instead of receiving arrays
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            train_paths, test_paths = zip(*(fold_paths[i] for i in missing))
+            for i, result in zip(missing, executor.map(evaluate_fold, train_paths, test_paths, [grid] * len(missing))):
+                np.savez(result_paths[i], **result)
+    results = []
+    for path in result_paths:
+        with np.load(path) as cached:
+            result = {name: cached[name] for name in cached.files}
+        os.utime(path)
+        result["chosen"] = int(result["chosen"])
+        results.append(result)
+    evict_fold_cache(cache_dir, max_bytes)
+
+    times = ordered["time"].to_numpy() if "time" in ordered.columns else np.arange(len(values))
+    fold_rows = []
+    for number, ((_, test), result) in enumerate(zip(folds, results)):
+        chosen = result["chosen"]
+        fold_rows.append({
+            "fold": number,
+            "test_start": times[test.start],
+            "test_end": times[test.stop - 1],
+            "threshold": grid[chosen],
+            "train_weighted_profit": result["train_weighted_profit"][chosen],
+            "test_weighted_profit": result["test_weighted_profit"][chosen],
+            "test_profit": result["test_profit"][chosen],
+            "test_trades": result["test_trades"][chosen],
+        })
+    folds_df = pd.DataFrame(fold_rows)
+    grid_df = pd.DataFrame({
+        "threshold": grid,
+        "test_weighted_profit": np.sum([r["test_weighted_profit"] for r in results], axis=0),
+        "test_profit": np.sum([r["test_profit"] for r in results], axis=0),
+        "test_trades": np.sum([r["test_trades"] for r in results], axis=0),
+    })
+
+    logger.info(f"Walk-forward out-of-sample weighted profit: {folds_df['test_weighted_profit'].sum():.2f} over {folds_df['test_trades'].sum()} trades.")
+    return folds_df, grid_df
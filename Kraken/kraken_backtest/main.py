@@ -35,7 +35,7 @@ async def main():
             save_to_cache(pair, interval, ohlc_data)
             data[pair] = ohlc_data
 
-    results = perform_backtest(data)
+    results = perform_backtest(data, interval=interval)
     plot_backtest_results(results, output_path)
 
     logger.info("Backtesting completed. Results saved to output directory.")
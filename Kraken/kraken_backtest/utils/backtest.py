@@ -1,10 +1,98 @@
-def perform_backtest(data):
+import numpy as np
+from utils.kernels import position_kernel
+
+# Kraken OHLC rows: [time, open, high, low, close, vwap, volume, count]
+OHLC_FIELDS = ["time", "open", "high", "low", "close", "vwap", "volume"]
+DEFAULT_FEE = 0.0026
+PERIODS_PER_YEAR = {1: 525600, 5: 105120, 15: 35040, 30: 17520, 60: 8760, 240: 2190, 1440: 365}
+
+
+def ohlc_to_arrays(ohlc, fields=OHLC_FIELDS):
+    """
+    Convert raw OHLC rows (strings from the API or cache) into float64 arrays.
+
+    Only the requested fields are parsed. Returns a dict keyed by field name;
+    time is int64 seconds.
+    """
+    arrays = {}
+    for field in fields:
+        column = OHLC_FIELDS.index(field)
+        arrays[field] = np.fromiter((row[column] for row in ohlc), dtype=np.float64, count=len(ohlc))
+    if "time" in arrays:
+        arrays["time"] = arrays["time"].astype(np.int64)
+    return arrays
+
+
+def momentum_signal(close, lookback=1):
+    """Long (1) when the close is above the close lookback bars ago, else flat (0)."""
+    signal = np.zeros(len(close))
+    if len(close) > lookback:
+        signal[lookback:] = close[lookback:] > close[:-lookback]
+    return signal
+
+
+def backtest_arrays(close, signal, fee=DEFAULT_FEE, initial_capital=1.0, periods_per_year=None):
+    """
+    Backtest a target-position signal over a close price array.
+
+    The position held over bar t is the signal of bar t-1, so decisions only
+    use data already known. Every change in position is filled at the close
+    and pays fee on the traded fraction. Returns the equity curve and stats.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    signal = np.asarray(signal, dtype=np.float64)
+    n = len(close)
+    if n < 2:
+        return {"equity": np.full(n, initial_capital), "total_return": 0.0, "profit": 0.0, "trades": 0,
+                "win_rate": 0.0, "max_drawdown": 0.0, "sharpe": 0.0}
+
+    position = np.concatenate(([0.0], signal[:-1]))
+    bar_returns = np.concatenate(([0.0], close[1:] / close[:-1] - 1))
+    turnover = np.abs(np.diff(position, prepend=0.0))
+    strategy_returns = position * bar_returns - fee * turnover
+    equity = initial_capital * np.cumprod(1 + strategy_returns)
+
+    running_peak = np.maximum.accumulate(equity)
+    max_drawdown = float(np.max(1 - equity / running_peak))
+
+    # Round trips: returns compounded from the entry bar through the exit fee
+    entries = np.flatnonzero((position[1:] > 0) & (position[:-1] == 0)) + 1
+    exits = np.flatnonzero((position[1:] == 0) & (position[:-1] > 0)) + 1
+    if len(exits) < len(entries):
+        exits = np.append(exits, n - 1)
+    log_equity = np.concatenate(([0.0], np.cumsum(np.log1p(strategy_returns))))
+    trade_returns = np.expm1(log_equity[exits + 1] - log_equity[entries])
+
+    std = strategy_returns[1:].std()
+    sharpe = strategy_returns[1:].mean() / std if std > 0 else 0.0
+    if periods_per_year:
+        sharpe *= np.sqrt(periods_per_year)
+
+    return {
+        "equity": equity,
+        "total_return": float(equity[-1] / initial_capital - 1),
+        "profit": float(equity[-1] - initial_capital),
+        "trades": int(len(entries)),
+        "win_rate": float((trade_returns > 0).mean()) if len(trade_returns) else 0.0,
+        "max_drawdown": max_drawdown,
+        "sharpe": float(sharpe),
+    }
+
+
+def perform_backtest(data, interval=None, fee=DEFAULT_FEE, lookback=1, stop_loss=0.0, take_profit=0.0, cooldown=0, max_hold=0):
+    """
+    Backtest a momentum strategy for every pair.
+
+    data maps pair to raw OHLC rows. Stop-loss, take-profit, cooldown and
+    max_hold run through the compiled position kernel. Returns pair -> stats
+    dict with the equity curve under "equity".
+    """
+    path_dependent = stop_loss or take_profit or cooldown or max_hold
     results = {}
     for pair, ohlc in data.items():
-        total_profit = 0
-        for i in range(1, len(ohlc)):
-            if ohlc[i][4] > ohlc[i - 1][4]:
-                profit = ohlc[i][4] - ohlc[i - 1][4]
-                total_profit += profit
-        results[pair] = total_profit
+        close = ohlc_to_arrays(ohlc, fields=["close"])["close"]
+        signal = momentum_signal(close, lookback)
+        if path_dependent:
+            signal = position_kernel(close, signal > 0, signal == 0, stop_loss, take_profit, cooldown, max_hold)
+        results[pair] = backtest_arrays(close, signal, fee=fee, periods_per_year=PERIODS_PER_YEAR.get(interval))
     return results
@@ -0,0 +1,101 @@
+import numpy as np
+
+# Numba is optional: without it the same kernels run as plain Python loops
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def _position_kernel(close, entry, exit_signal, stop_loss, take_profit, cooldown, max_hold):
+    n = close.shape[0]
+    target = np.zeros(n)
+    holding = False
+    entry_price = 0.0
+    entry_bar = 0
+    blocked_until = 0
+    for t in range(n):
+        if holding:
+            change = close[t] / entry_price - 1.0
+            stopped = stop_loss > 0 and change <= -stop_loss
+            taken = take_profit > 0 and change >= take_profit
+            expired = max_hold > 0 and t - entry_bar >= max_hold
+            if stopped or taken or expired or exit_signal[t]:
+                holding = False
+                if stopped:
+                    blocked_until = t + cooldown + 1
+            else:
+                target[t] = 1.0
+        elif t >= blocked_until and entry[t]:
+            holding = True
+            entry_price = close[t]
+            entry_bar = t
+            target[t] = 1.0
+    return target
+
+
+def position_kernel(close, entry, exit_signal=None, stop_loss=0.0, take_profit=0.0, cooldown=0, max_hold=0):
+    """
+    Path-dependent long/flat state machine over a close price array.
+
+    Enters at the close of a bar where entry is true and holds until
+    exit_signal, a stop-loss or take-profit (fractions of the entry price), or
+    max_hold bars. After a stop-loss no new entry is taken for cooldown bars.
+    Returns the target position after each bar, suitable as the signal for
+    backtest_arrays. Zero disables a rule.
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    entry = np.ascontiguousarray(entry, dtype=np.bool_)
+    if exit_signal is None:
+        exit_signal = np.zeros(len(close), dtype=np.bool_)
+    exit_signal = np.ascontiguousarray(exit_signal, dtype=np.bool_)
+    return _position_kernel(close, entry, exit_signal, float(stop_loss), float(take_profit), int(cooldown), int(max_hold))
+
+
+@njit(cache=True)
+def _gate_kernel(group_ids, times, n_groups, cooldown, max_open, hold):
+    n = group_ids.shape[0]
+    keep = np.zeros(n, dtype=np.bool_)
+    last_trade = np.full(n_groups, np.iinfo(np.int64).min)
+    # Releases are FIFO because every trade is held for the same time
+    releases = np.zeros(max(max_open, 1), dtype=np.int64)
+    head = 0
+    open_count = 0
+    for i in range(n):
+        while open_count > 0 and releases[head] <= times[i]:
+            head = (head + 1) % releases.shape[0]
+            open_count -= 1
+        group = group_ids[i]
+        if last_trade[group] != np.iinfo(np.int64).min and times[i] - last_trade[group] < cooldown:
+            continue
+        if max_open > 0 and open_count >= max_open:
+            continue
+        keep[i] = True
+        last_trade[group] = times[i]
+        if max_open > 0:
+            releases[(head + open_count) % releases.shape[0]] = times[i] + hold
+            open_count += 1
+    return keep
+
+
+def gate_opportunities(group_ids, times, cooldown=0, max_open=0, hold=0):
+    """
+    Accept time-ordered opportunities subject to cooldowns and an inventory limit.
+
+    group_ids identify the pair combination of each row (0..n_groups-1) and
+    times are int64 timestamps in ascending order. A group cannot trade again
+    within cooldown of its last accepted trade; at most max_open trades can
+    be open at once, each occupying inventory for hold. Returns a boolean
+    keep mask. Zero disables a rule.
+    """
+    group_ids = np.ascontiguousarray(group_ids, dtype=np.int64)
+    times = np.ascontiguousarray(times, dtype=np.int64)
+    n_groups = int(group_ids.max()) + 1 if len(group_ids) else 0
+    return _gate_kernel(group_ids, times, n_groups, int(cooldown), int(max_open), int(hold))
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# A few thousand points per series is beyond what a saved figure can resolve
+MAX_POINTS = 4000
+HASH_MANIFEST = ".chart_hashes.json"
+
+
+def _as_numeric(x):
+    """Float view of x, with datetimes as integer ticks."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.view(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def minmax_decimate(x, y, max_points=MAX_POINTS):
+    """
+    Keep the first, minimum, maximum and last point of each of max_points // 4 equal-count buckets.
+
+    x must be sorted. Spikes survive decimation, so a line plot at figure
+    resolution looks the same as the full series.
+    """
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= max_points:
+        return x, y
+    buckets = max(1, max_points // 4)
+    width = -(-n // buckets)
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = y
+    rows = padded.reshape(buckets, width)
+    valid = ~np.isnan(rows).all(axis=1)
+    offsets = np.arange(buckets) * width
+    # All-NaN buckets keep only their first/last points
+    mins = offsets[valid] + np.nanargmin(rows[valid], axis=1)
+    maxs = offsets[valid] + np.nanargmax(rows[valid], axis=1)
+    lasts = np.minimum(offsets + width, n) - 1
+    keep = np.unique(np.concatenate((offsets[offsets < n], lasts, mins, maxs)))
+    return x[keep], y[keep]
+
+
+def lttb(x, y, max_points=MAX_POINTS):
+    """
+    Largest-Triangle-Three-Buckets downsampling to max_points points.
+
+    Keeps the point in each bucket that forms the largest triangle with the
+    previously kept point and the next bucket's average. x must be sorted.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return x, y
+    xn = _as_numeric(x)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = xn[stop:next_stop].mean() if next_stop > stop else xn[-1]
+        next_y = y[stop:next_stop].mean() if next_stop > stop else y[-1]
+        area = np.abs(
+            (xn[previous] - next_x) * (y[start:stop] - y[previous])
+            - (xn[previous] - xn[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.nanargmax(area)) if np.isfinite(area).any() else start
+        keep[i + 1] = previous
+    return x[keep], y[keep]
+
+
+def line(x, y, label=None, max_points=MAX_POINTS, method="minmax", **style):
+    """Series spec for a line, downsampled for plotting."""
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    x, y = (lttb if method == "lttb" else minmax_decimate)(x, y, max_points)
+    return {"kind": "line", "x": x, "y": y, "label": label, "style": style}
+
+
+def scatter(x, y, label=None, **style):
+    """Series spec for scatter points (not downsampled; keep these few)."""
+    return {"kind": "scatter", "x": np.asarray(x), "y": np.asarray(y), "label": label, "style": style}
+
+
+def histogram(values, bins=50, label=None, **style):
+    """Series spec for a histogram; only the counts and edges are shipped to the renderer."""
+    values = np.asarray(values, dtype=np.float64)
+    counts, edges = np.histogram(values[~np.isnan(values)], bins=bins)
+    return {"kind": "hist", "counts": counts, "edges": edges, "label": label, "style": style}
+
+
+def vline(x, label=None, **style):
+    """Vertical reference line spec."""
+    return {"x": float(x), "label": label, "style": style}
+
+
+def panel(series, title=None, xlabel=None, ylabel=None, vlines=(), legend=True, grid=True):
+    """One axes worth of series."""
+    return {"series": list(series), "vlines": list(vlines), "title": title, "xlabel": xlabel, "ylabel": ylabel, "legend": legend, "grid": grid}
+
+
+def chart(panels, figsize=(10, 6), rotate_xticks=False, tight=True):
+    """A figure made of vertically stacked panels."""
+    return {"panels": list(panels), "figsize": figsize, "rotate_xticks": rotate_xticks, "tight": tight}
+
+
+def draw_chart(spec, output_file):
+    """Render one chart spec to output_file on an Agg canvas (no pyplot state)."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=spec["figsize"])
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(len(spec["panels"]), 1, squeeze=False)
+    for ax, item in zip(axes[:, 0], spec["panels"]):
+        for series in item["series"]:
+            if series["kind"] == "line":
+                ax.plot(series["x"], series["y"], label=series["label"], **series["style"])
+            elif series["kind"] == "scatter":
+                ax.scatter(series["x"], series["y"], label=series["label"], **series["style"])
+            elif series["kind"] == "hist":
+                ax.stairs(series["counts"], series["edges"], fill=True, label=series["label"], **series["style"])
+        for reference in item["vlines"]:
+            ax.axvline(reference["x"], label=reference["label"], **reference["style"])
+        if item["title"]:
+            ax.set_title(item["title"])
+        if item["xlabel"]:
+            ax.set_xlabel(item["xlabel"])
+        if item["ylabel"]:
+            ax.set_ylabel(item["ylabel"])
+        if item["legend"] and any(s["label"] for s in item["series"] + item["vlines"]):
+            ax.legend()
+        if item["grid"]:
+            ax.grid(alpha=0.3)
+        if spec["rotate_xticks"]:
+            for label in ax.get_xticklabels():
+                label.set_rotation(45)
+                label.set_horizontalalignment("right")
+    if spec["tight"]:
+        fig.tight_layout()
+    fig.savefig(output_file)
+    return output_file
+
+
+def _update_hash(digest, value):
+    if isinstance(value, dict):
+        for key in sorted(value):
+            digest.update(repr(key).encode())
+            _update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"[{len(value)}".encode())
+        for item in value:
+            _update_hash(digest, item)
+    elif isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    else:
+        digest.update(repr(value).encode())
+
+
+def spec_hash(spec):
+    """Content hash of a chart spec (its downsampled data and styling)."""
+    digest = hashlib.sha1()
+    _update_hash(digest, spec)
+    return digest.hexdigest()
+
+
+def _load_manifest(directory):
+    path = os.path.join(directory, HASH_MANIFEST)
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_charts(charts, workers=None):
+    """
+    Render {output_file: spec} charts, skipping those whose inputs are unchanged.
+
+    Each directory keeps a manifest of the spec hash behind every chart it
+    holds; a chart is redrawn only if its hash changed or the file is gone.
+    Stale charts are drawn in a process pool (Agg backend) when there is
+    more than one. Returns the list of files written.
+    """
+    pending = {}
+    hashes = {}
+    manifests = {}
+    for output_file, spec in charts.items():
+        directory = os.path.dirname(os.path.abspath(output_file))
+        manifest = manifests.setdefault(directory, _load_manifest(directory))
+        digest = spec_hash(spec)
+        hashes[output_file] = digest
+        name = os.path.basename(output_file)
+        if manifest.get(name) == digest and os.path.exists(output_file):
+            continue
+        pending[output_file] = spec
+
+    if len(pending) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            written = list(executor.map(draw_chart, pending.values(), pending.keys()))
+    else:
+        written = [draw_chart(spec, output_file) for output_file, spec in pending.items()]
+
+    for output_file in written:
+        directory = os.path.dirname(os.path.abspath(output_file))
+        manifests[directory][os.path.basename(output_file)] = hashes[output_file]
+    for directory, manifest in manifests.items():
+        with open(os.path.join(directory, HASH_MANIFEST), "w") as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+
+    logger.info(f"Rendered {len(written)} of {len(charts)} charts; {len(charts) - len(written)} unchanged.")
+    return written
@@ -1,13 +1,25 @@
-import matplotlib.pyplot as plt
 import os
 
-def plot_backtest_results(results, output_path):
+from utils.rendering import chart, line, panel, render_charts
+
+
+def plot_backtest_results(results, output_path, workers=None):
+    """
+    Save one equity-curve chart per pair.
+
+    Curves are min-max decimated, charts are drawn in parallel, and pairs
+    whose curve is unchanged since the last run are not redrawn.
+    """
     os.makedirs(output_path, exist_ok=True)
-    for pair, profit in results.items():
-        plt.figure()
-        plt.bar(pair, profit)
-        plt.title(f"Backtest Results for {pair}")
-        plt.xlabel("Pair")
-        plt.ylabel("Profit")
-        plt.savefig(os.path.join(output_path, f"{pair}_results.png"))
-        plt.close()
+    charts = {}
+    for pair, stats in results.items():
+        charts[os.path.join(output_path, f"{pair.replace('/', '_')}_results.png")] = chart([
+            panel(
+                [line(range(len(stats["equity"])), stats["equity"])],
+                title=f"Backtest Results for {pair} (return {stats['total_return']:.2%}, {stats['trades']} trades)",
+                xlabel="Candle",
+                ylabel="Equity",
+                grid=False,
+            )
+        ], figsize=(6.4, 4.8), tight=False)
+    return render_charts(charts, workers=workers)
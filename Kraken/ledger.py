@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+
+from order_gateway import FINAL_STATUSES, OrderRejected
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = 30.0
+# Held on top of a buy's notional for the taker fee, which Kraken charges in the quote asset
+FEE_MARGIN = 0.0026
+# Relative difference between local and exchange balances reported as drift
+DRIFT_TOLERANCE = 1e-8
+
+
+class _Leg:
+    """Funds one of our orders holds and the part of its fills already booked."""
+
+    __slots__ = ("base", "quote", "spend", "initial", "hold", "vol_exec", "cost", "fee")
+
+    def __init__(self, base, quote, spend, hold):
+        self.base = base
+        self.quote = quote
+        self.spend = spend
+        self.initial = hold
+        self.hold = hold
+        self.vol_exec = 0.0
+        self.cost = 0.0
+        self.fee = 0.0
+
+
+class Ledger:
+    """
+    In-memory balances, holds and open orders, kept current from our own order events.
+
+    Attached to an OrderGateway as a listener. A leg holds what it can spend
+    from the moment it is sent: quote plus FEE_MARGIN for a buy, base for a
+    sell. Each reported fill moves the balances, and whatever is still held
+    is released when the leg reaches a final status. available() and
+    can_afford() are dictionary lookups, so sizing a leg needs no private
+    API call.
+
+    A background task reconciles against Balance and OpenOrders every
+    reconcile_interval seconds. Orders placed outside this process become
+    external holds. Balances are only replaced while the local view is
+    settled, that is when every tracked leg is open on the exchange with the
+    fills we have booked. Otherwise a fill would be counted twice, once in
+    the snapshot and again when the gateway reports it.
+    """
+
+    def __init__(self, gateway, reconcile_interval=RECONCILE_INTERVAL, fee_margin=FEE_MARGIN, balances=None):
+        self.gateway = gateway
+        self.reconcile_interval = reconcile_interval
+        self.fee_margin = fee_margin
+        self.balances = {asset: float(amount) for asset, amount in (balances or {}).items()}
+        self.holds = {}
+        self.external_holds = {}
+        self.orders = {}
+        self.marks = {}
+        self.reconciled_at = None
+        self._version = 0
+        self._task = None
+        gateway.listeners.append(self.on_order)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        """Load balances from the exchange, then keep reconciling in the background."""
+        await self.reconcile()
+        self._task = asyncio.create_task(self._reconcile_periodically())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def available(self, asset):
+        return self.balances.get(asset, 0.0) - self.holds.get(asset, 0.0) - self.external_holds.get(asset, 0.0)
+
+    def mark(self, pair, price):
+        """Latest price of a pair, used to size holds for buys without a limit price."""
+        self.marks[self.gateway.registry.get(pair).name] = float(price)
+
+    def _spend(self, pair, side, volume, price=None):
+        """(asset, amount) a leg needs; buys are priced at price, else the pair's mark."""
+        info = self.gateway.registry.get(pair)
+        if side == "sell":
+            return info.base, float(volume)
+        price = price or self.marks.get(info.name)
+        if price is None:
+            raise OrderRejected(f"{pair}: no price to size a buy against")
+        return info.quote, float(volume) * float(price) * (1 + self.fee_margin)
+
+    def can_afford(self, pair, side, volume, price=None):
+        """Whether available funds cover one leg right now."""
+        asset, amount = self._spend(pair, side, volume, price)
+        return amount <= self.available(asset)
+
+    def _add(self, book, asset, amount):
+        book[asset] = book.get(asset, 0.0) + amount
+
+    def on_order(self, order):
+        """Gateway listener: hold funds for a new leg, book its fills and release the hold when it is done."""
+        self._version += 1
+        leg = self.orders.get(order)
+        if leg is None:
+            info = self.gateway.registry.get(order.pair)
+            try:
+                spend, hold = self._spend(order.pair, order.side, order.volume, order.price)
+            except OrderRejected as e:
+                logger.warning(f"Not holding funds for {order}: {e}")
+                spend, hold = info.quote, 0.0
+            leg = self.orders[order] = _Leg(info.base, info.quote, spend, hold)
+            self._add(self.holds, spend, hold)
+
+        cost = order.vol_exec * (order.avg_price or 0.0)
+        volume, notional, fee = order.vol_exec - leg.vol_exec, cost - leg.cost, order.fee - leg.fee
+        if volume or fee:
+            sign = 1 if order.side == "buy" else -1
+            self._add(self.balances, leg.base, sign * volume)
+            self._add(self.balances, leg.quote, -sign * notional - fee)
+            leg.vol_exec, leg.cost, leg.fee = order.vol_exec, cost, order.fee
+
+        if order.status in FINAL_STATUSES:
+            remaining = 0.0
+        else:
+            remaining = leg.initial * max(1 - order.vol_exec / order.volume, 0.0) if order.volume else 0.0
+        self._add(self.holds, leg.spend, remaining - leg.hold)
+        leg.hold = remaining
+        if order.status in FINAL_STATUSES:
+            del self.orders[order]
+
+    async def reconcile(self):
+        """
+        Refresh external holds and, when the local view is settled, balances from the exchange.
+
+        Returns True when balances were replaced. Differences from the local
+        balances are logged as drift.
+        """
+        version = self._version
+        balance, open_orders = await asyncio.gather(
+            self.gateway.private("/0/private/Balance"),
+            self.gateway.private("/0/private/OpenOrders"),
+        )
+        open_orders = open_orders.get("open", {})
+        tracked = {order.txid for order in self.orders}
+
+        external = {}
+        for txid, info in open_orders.items():
+            if txid in tracked:
+                continue
+            descr = info.get("descr", {})
+            try:
+                price = float(descr.get("price", 0)) or None
+                asset, amount = self._spend(descr["pair"], descr["type"], float(info["vol"]) - float(info.get("vol_exec", 0)), price)
+            except (KeyError, OrderRejected) as e:
+                logger.warning(f"Not holding funds for open order {txid}: {e}")
+                continue
+            self._add(external, asset, amount)
+        self.external_holds = external
+
+        lagging = [
+            order for order, leg in self.orders.items()
+            if order.txid not in open_orders or float(open_orders[order.txid].get("vol_exec", 0)) != leg.vol_exec
+        ]
+        if self._version != version or lagging:
+            logger.debug(f"Ledger not settled ({len(lagging)} legs behind the exchange); keeping local balances.")
+            return False
+
+        balances = {asset: float(amount) for asset, amount in balance.items()}
+        if self.reconciled_at is not None:
+            for asset in sorted(set(balances) | set(self.balances)):
+                local, remote = self.balances.get(asset, 0.0), balances.get(asset, 0.0)
+                if abs(local - remote) > DRIFT_TOLERANCE * max(abs(remote), 1.0):
+                    logger.warning(f"Ledger drift on {asset}: local {local:.10g}, exchange {remote:.10g}.")
+        self.balances = balances
+        self.reconciled_at = time.time()
+        return True
+
+    async def _reconcile_periodically(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.warning(f"Ledger reconciliation failed: {e}")
+
+    def summary(self):
+        """One line per asset: balance, held and available."""
+        assets = sorted(set(self.balances) | set(self.holds) | set(self.external_holds))
+        return [
+            f"{asset}: balance {self.balances.get(asset, 0.0):.10g}, "
+            f"held {self.holds.get(asset, 0.0) + self.external_holds.get(asset, 0.0):.10g}, available {self.available(asset):.10g}"
+            for asset in assets
+        ]
@@ -0,0 +1,363 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import time
+import urllib.parse
+from collections import defaultdict
+from decimal import ROUND_DOWN, Decimal
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://api.kraken.com"
+# AddOrderBatch takes 2 to 15 orders, all on one pair
+BATCH_MIN = 2
+BATCH_MAX = 15
+# QueryOrders accepts up to 50 txids per call
+QUERY_CHUNK = 50
+FILL_POLL_INTERVAL = 0.5
+FINAL_STATUSES = ("closed", "canceled", "expired", "rejected")
+
+
+class OrderRejected(ValueError):
+    """An order failed pre-validation or was refused by the exchange."""
+
+
+class PairInfo:
+    """Trading rules of one pair from the AssetPairs endpoint."""
+
+    __slots__ = ("name", "altname", "base", "quote", "lot_decimals", "pair_decimals", "ordermin", "costmin")
+
+    def __init__(self, name, altname, lot_decimals, pair_decimals, ordermin, costmin, base="", quote=""):
+        self.name = name
+        self.altname = altname
+        self.base = base
+        self.quote = quote
+        self.lot_decimals = lot_decimals
+        self.pair_decimals = pair_decimals
+        self.ordermin = ordermin
+        self.costmin = costmin
+
+
+class PairRegistry:
+    """
+    Lot size, price precision and minimums per pair, keyed by pair name and altname.
+
+    Volumes are truncated (never rounded up) to lot_decimals so a leg can
+    not exceed the size it was funded for.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = {}
+        for info in pairs:
+            self.pairs[info.name] = info
+            self.pairs[info.altname] = info
+
+    @classmethod
+    def from_asset_pairs(cls, result):
+        """Build from the result of /0/public/AssetPairs."""
+        return cls(
+            PairInfo(
+                name,
+                details.get("altname", name),
+                int(details.get("lot_decimals", 8)),
+                int(details.get("pair_decimals", 8)),
+                Decimal(str(details.get("ordermin", "0"))),
+                Decimal(str(details.get("costmin", "0"))),
+                details.get("base", ""),
+                details.get("quote", ""),
+            )
+            for name, details in result.items()
+        )
+
+    @classmethod
+    async def load(cls, session, base_url=BASE_URL):
+        async with session.get(f"{base_url}/0/public/AssetPairs") as response:
+            data = await response.json()
+        if data.get("error"):
+            raise RuntimeError(f"AssetPairs failed: {data['error']}")
+        return cls.from_asset_pairs(data["result"])
+
+    def get(self, pair):
+        try:
+            return self.pairs[pair]
+        except KeyError:
+            raise OrderRejected(f"Unknown pair {pair}") from None
+
+    def format_volume(self, pair, volume):
+        """Volume truncated to the pair's lot size; rejects volumes below ordermin."""
+        info = self.get(pair)
+        step = Decimal(1).scaleb(-info.lot_decimals)
+        quantized = Decimal(str(volume)).quantize(step, rounding=ROUND_DOWN)
+        if quantized <= 0 or quantized < info.ordermin:
+            raise OrderRejected(f"{pair}: volume {volume} is below ordermin {info.ordermin}")
+        return format(quantized, "f")
+
+    def format_price(self, pair, price):
+        info = self.get(pair)
+        return format(Decimal(str(price)).quantize(Decimal(1).scaleb(-info.pair_decimals)), "f")
+
+    def check_cost(self, pair, volume, price):
+        info = self.get(pair)
+        if info.costmin and Decimal(volume) * Decimal(price) < info.costmin:
+            raise OrderRejected(f"{pair}: order cost {Decimal(volume) * Decimal(price)} is below costmin {info.costmin}")
+
+
+class Order:
+    """
+    One leg and its lifecycle.
+
+    status moves new -> sent -> open -> closed (or canceled/expired), or to
+    rejected. sent_ns and acked_ns are monotonic stamps taken as the request
+    is handed to the connection and as the acknowledgement arrives; done
+    resolves once the order reaches a final status.
+    """
+
+    def __init__(self, pair, side, volume, ordertype="market", price=None, userref=None):
+        if side not in ("buy", "sell"):
+            raise OrderRejected(f"Order side must be buy or sell, not {side}")
+        if ordertype != "market" and price is None:
+            raise OrderRejected(f"{ordertype} orders need a price")
+        self.pair = pair
+        self.side = side
+        self.volume = volume
+        self.ordertype = ordertype
+        self.price = price
+        self.userref = userref
+        self.txid = None
+        self.status = "new"
+        self.error = None
+        self.sent_ns = None
+        self.acked_ns = None
+        self.vol_exec = 0.0
+        self.avg_price = None
+        self.fee = 0.0
+        self.done = None
+
+    def __repr__(self):
+        return f"Order({self.side} {self.volume} {self.pair} {self.ordertype}, txid={self.txid}, status={self.status})"
+
+
+def leg_skew_ns(orders):
+    """Spread between the first and last leg leaving the gateway."""
+    stamps = [order.sent_ns for order in orders if order.sent_ns is not None]
+    return max(stamps) - min(stamps) if stamps else 0
+
+
+class OrderGateway:
+    """
+    Async order submission over one persistent, signed HTTP session.
+
+    submit() validates every leg against the pair registry before anything
+    is sent, signs all requests up front, then fires them concurrently:
+    legs sharing a pair go out as AddOrderBatch, the rest as AddOrder. A
+    background task polls QueryOrders for open orders and resolves each
+    order's done future when it reaches a final status.
+
+    Concurrent requests can reach the exchange out of nonce order, so the
+    API key needs a nonce window.
+
+    Every listener is called with the order whenever a leg is sent, opens,
+    fills further or reaches a final status (see ledger.Ledger).
+    """
+
+    def __init__(self, api_key, secret_key, registry, base_url=BASE_URL, poll_interval=FILL_POLL_INTERVAL):
+        self.api_key = api_key
+        self.secret = base64.b64decode(secret_key)
+        self.registry = registry
+        self.base_url = base_url
+        self.poll_interval = poll_interval
+        self.session = None
+        self.open_orders = {}
+        self.listeners = []
+        self._last_nonce = 0
+        self._tracker = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+        self._tracker = asyncio.create_task(self._track_fills())
+
+    async def close(self):
+        if self._tracker is not None:
+            self._tracker.cancel()
+            try:
+                await self._tracker
+            except asyncio.CancelledError:
+                pass
+        if self.session is not None:
+            await self.session.close()
+
+    async def warm(self, connections=4):
+        """Open keep-alive connections ahead of time so legs do not wait on TCP/TLS handshakes."""
+        async def ping():
+            async with self.session.get(f"{self.base_url}/0/public/Time") as response:
+                await response.read()
+        await asyncio.gather(*(ping() for _ in range(connections)))
+
+    def _nonce(self):
+        self._last_nonce = max(time.time_ns() // 1000, self._last_nonce + 1)
+        return self._last_nonce
+
+    def _prepare(self, path, params, as_json=False):
+        """Headers and body of a signed private request."""
+        nonce = self._nonce()
+        if as_json:
+            body = json.dumps({"nonce": str(nonce), **params})
+            content_type = "application/json"
+        else:
+            body = urllib.parse.urlencode({"nonce": nonce, **params})
+            content_type = "application/x-www-form-urlencoded"
+        message = path.encode() + hashlib.sha256((str(nonce) + body).encode()).digest()
+        signature = base64.b64encode(hmac.new(self.secret, message, hashlib.sha512).digest()).decode()
+        headers = {"API-Key": self.api_key, "API-Sign": signature, "Content-Type": content_type}
+        return path, headers, body
+
+    def _notify(self, order):
+        for listener in self.listeners:
+            listener(order)
+
+    async def private(self, path, params=None):
+        """Result of one signed private request, e.g. private("/0/private/Balance")."""
+        return await self._post(self._prepare(path, params or {}))
+
+    async def _post(self, prepared):
+        path, headers, body = prepared
+        async with self.session.post(self.base_url + path, headers=headers, data=body) as response:
+            data = await response.json(content_type=None)
+        if data.get("error"):
+            raise OrderRejected(", ".join(data["error"]))
+        return data["result"]
+
+    def _order_params(self, order):
+        params = {
+            "ordertype": order.ordertype,
+            "type": order.side,
+            "volume": self.registry.format_volume(order.pair, order.volume),
+        }
+        if order.price is not None and order.ordertype != "market":
+            params["price"] = self.registry.format_price(order.pair, order.price)
+            self.registry.check_cost(order.pair, params["volume"], params["price"])
+        if order.userref is not None:
+            params["userref"] = order.userref
+        return params
+
+    def _requests(self, orders):
+        """Group validated legs into (orders, signed request) pairs."""
+        by_pair = defaultdict(list)
+        for order in orders:
+            by_pair[self.registry.get(order.pair).name].append((order, self._order_params(order)))
+        requests = []
+        for pair, legs in by_pair.items():
+            for start in range(0, len(legs), BATCH_MAX):
+                chunk = legs[start:start + BATCH_MAX]
+                if len(chunk) >= BATCH_MIN:
+                    params = {"pair": pair, "orders": [params for _, params in chunk]}
+                    requests.append(([order for order, _ in chunk], self._prepare("/0/private/AddOrderBatch", params, as_json=True)))
+                else:
+                    order, params = chunk[0]
+                    requests.append(([order], self._prepare("/0/private/AddOrder", {"pair": pair, **params})))
+        return requests
+
+    async def submit(self, orders):
+        """
+        Send all legs as close together as possible; returns once every leg is acknowledged or rejected.
+
+        Raises OrderRejected before sending anything if a leg fails validation.
+        """
+        loop = asyncio.get_running_loop()
+        requests = self._requests(orders)
+        for order in orders:
+            order.done = loop.create_future()
+        await asyncio.gather(*(self._send(legs, prepared) for legs, prepared in requests))
+        return orders
+
+    async def _send(self, legs, prepared):
+        sent = time.monotonic_ns()
+        for order in legs:
+            order.sent_ns = sent
+            order.status = "sent"
+            self._notify(order)
+        try:
+            result = await self._post(prepared)
+        except Exception as e:
+            for order in legs:
+                self._finish(order, "rejected", str(e))
+            logger.error(f"Order request failed for {legs}: {e}")
+            return
+        acked = time.monotonic_ns()
+        # AddOrderBatch answers per order; AddOrder answers with one txid list
+        outcomes = result.get("orders", [result])
+        for order, outcome in zip(legs, outcomes):
+            order.acked_ns = acked
+            if outcome.get("error"):
+                self._finish(order, "rejected", outcome["error"])
+                continue
+            txid = outcome["txid"]
+            order.txid = txid[0] if isinstance(txid, list) else txid
+            order.status = "open"
+            self.open_orders[order.txid] = order
+            self._notify(order)
+
+    def _finish(self, order, status, error=None):
+        order.status = status
+        order.error = error
+        self.open_orders.pop(order.txid, None)
+        self._notify(order)
+        if order.done is not None and not order.done.done():
+            order.done.set_result(order)
+
+    async def _track_fills(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self.open_orders:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logger.warning(f"Order status poll failed: {e}")
+
+    async def refresh(self):
+        """Update every open order from QueryOrders."""
+        txids = list(self.open_orders)
+        chunks = [txids[i:i + QUERY_CHUNK] for i in range(0, len(txids), QUERY_CHUNK)]
+        results = await asyncio.gather(*(self.private("/0/private/QueryOrders", {"txid": ",".join(chunk)}) for chunk in chunks))
+        for result in results:
+            for txid, info in result.items():
+                order = self.open_orders.get(txid)
+                if order is None:
+                    continue
+                vol_exec = float(info.get("vol_exec", 0))
+                filled = vol_exec != order.vol_exec
+                order.vol_exec = vol_exec
+                order.fee = float(info.get("fee", 0))
+                order.avg_price = float(info["price"]) if float(info.get("price", 0)) else order.avg_price
+                if info.get("status") in FINAL_STATUSES:
+                    self._finish(order, info["status"], info.get("reason"))
+                elif filled:
+                    self._notify(order)
+
+    async def wait(self, orders, timeout=None):
+        """Wait until every order reaches a final status; returns the orders."""
+        await asyncio.wait_for(asyncio.gather(*(order.done for order in orders)), timeout)
+        return orders
+
+    async def execute(self, orders, timeout=None):
+        """Submit legs and wait for their fills; logs leg skew and acknowledgement latency."""
+        await self.submit(orders)
+        acked = [order.acked_ns - order.sent_ns for order in orders if order.acked_ns is not None]
+        logger.info(
+            f"Sent {len(orders)} legs with {leg_skew_ns(orders) / 1e6:.2f} ms skew; "
+            f"ack latency {max(acked, default=0) / 1e6:.1f} ms."
+        )
+        return await self.wait(orders, timeout)
@@ -0,0 +1,222 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import statistics
+import time
+import urllib.parse
+from decimal import Decimal
+
+from aiohttp import web
+
+from ledger import Ledger
+from order_gateway import Order, OrderGateway, PairRegistry, leg_skew_ns
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+STUB_PAIRS = {
+    "XXBTZUSD": {"altname": "XBTUSD", "base": "XXBT", "quote": "ZUSD", "lot_decimals": 8, "pair_decimals": 1, "ordermin": "0.0001", "costmin": "0.5"},
+    "XETHZUSD": {"altname": "ETHUSD", "base": "XETH", "quote": "ZUSD", "lot_decimals": 8, "pair_decimals": 2, "ordermin": "0.002", "costmin": "0.5"},
+    "XETHXXBT": {"altname": "ETHXBT", "base": "XETH", "quote": "XXBT", "lot_decimals": 8, "pair_decimals": 5, "ordermin": "0.002", "costmin": "0.00002"},
+}
+STUB_PRICES = {"XXBTZUSD": 60000.0, "XETHZUSD": 3000.0, "XETHXXBT": 0.05}
+STUB_BALANCES = {"ZUSD": 10000.0, "XXBT": 0.5, "XETH": 5.0}
+STUB_FEE = 0.0026
+
+
+class StubExchange:
+    """
+    Local stand-in for Kraken's REST order endpoints.
+
+    Serves AssetPairs, Time, AddOrder, AddOrderBatch, QueryOrders,
+    OpenOrders and Balance, checks API-Sign exactly as Kraken does and
+    enforces lot_decimals and ordermin. Every order records the monotonic
+    time it arrived, so leg skew can be measured on the exchange side.
+    Orders fill completely at STUB_PRICES (or their limit price)
+    fill_delay seconds after arrival, paying STUB_FEE in the quote asset.
+    """
+
+    def __init__(self, api_key, secret_key, pairs=STUB_PAIRS, prices=STUB_PRICES, fill_delay=0.05, balances=STUB_BALANCES):
+        self.api_key = api_key
+        self.secret = base64.b64decode(secret_key)
+        self.pairs = pairs
+        self.altnames = {details["altname"]: name for name, details in pairs.items()}
+        self.prices = prices
+        self.fill_delay = fill_delay
+        self.balances = dict(balances)
+        self.orders = {}
+        self._ids = itertools.count(1)
+        self._runner = None
+        self.base_url = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_get("/0/public/AssetPairs", self.asset_pairs)
+        app.router.add_get("/0/public/Time", self.server_time)
+        app.router.add_post("/0/private/AddOrder", self.add_order)
+        app.router.add_post("/0/private/AddOrderBatch", self.add_order_batch)
+        app.router.add_post("/0/private/QueryOrders", self.query_orders)
+        app.router.add_post("/0/private/OpenOrders", self.open_orders)
+        app.router.add_post("/0/private/Balance", self.balance)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def asset_pairs(self, request):
+        return web.json_response({"error": [], "result": self.pairs})
+
+    async def server_time(self, request):
+        return web.json_response({"error": [], "result": {"unixtime": int(time.time())}})
+
+    async def _authenticate(self, request):
+        received = time.monotonic_ns()
+        body = await request.text()
+        if request.content_type == "application/json":
+            params = json.loads(body)
+        else:
+            params = dict(urllib.parse.parse_qsl(body))
+        message = request.path.encode() + hashlib.sha256((str(params.get("nonce", "")) + body).encode()).digest()
+        expected = base64.b64encode(hmac.new(self.secret, message, hashlib.sha512).digest()).decode()
+        if request.headers.get("API-Key") != self.api_key or not hmac.compare_digest(request.headers.get("API-Sign", ""), expected):
+            raise ValueError("EAPI:Invalid signature")
+        return params, received
+
+    def _place(self, pair, params, received):
+        name = pair if pair in self.pairs else self.altnames.get(pair)
+        if name is None:
+            return {"error": "EQuery:Unknown asset pair"}
+        rules = self.pairs[name]
+        volume = Decimal(params["volume"])
+        if -volume.as_tuple().exponent > rules["lot_decimals"] or volume < Decimal(rules["ordermin"]):
+            return {"error": "EOrder:Invalid volume"}
+        if params["ordertype"] != "market" and "price" not in params:
+            return {"error": "EGeneral:Invalid arguments:price"}
+        txid = f"O{next(self._ids):05d}-STUB"
+        price = float(params.get("price", self.prices.get(name, 0)))
+        self.orders[txid] = {
+            "pair": name, "type": params["type"], "ordertype": params["ordertype"], "vol": params["volume"],
+            "status": "open", "vol_exec": "0", "price": "0", "fee": "0", "received_ns": received,
+            "descr": {"pair": rules["altname"], "type": params["type"], "ordertype": params["ordertype"], "price": params.get("price", "0")},
+        }
+        asyncio.get_running_loop().call_later(self.fill_delay, self._fill, txid, price)
+        return {"txid": txid, "descr": {"order": f"{params['type']} {params['volume']} {pair} @ {params['ordertype']}"}}
+
+    def _fill(self, txid, price):
+        order = self.orders[txid]
+        volume = float(order["vol"])
+        fee = volume * price * STUB_FEE
+        order.update(status="closed", vol_exec=order["vol"], price=str(price), fee=str(fee))
+        rules = self.pairs[order["pair"]]
+        sign = 1 if order["type"] == "buy" else -1
+        self.balances[rules["base"]] = self.balances.get(rules["base"], 0.0) + sign * volume
+        self.balances[rules["quote"]] = self.balances.get(rules["quote"], 0.0) - sign * volume * price - fee
+
+    async def add_order(self, request):
+        try:
+            params, received = await self._authenticate(request)
+        except ValueError as e:
+            return web.json_response({"error": [str(e)]})
+        placed = self._place(params.get("pair"), params, received)
+        if "error" in placed:
+            return web.json_response({"error": [placed["error"]]})
+        return web.json_response({"error": [], "result": {"descr": placed["descr"], "txid": [placed["txid"]]}})
+
+    async def add_order_batch(self, request):
+        try:
+            params, received = await self._authenticate(request)
+        except ValueError as e:
+            return web.json_response({"error": [str(e)]})
+        orders = [self._place(params.get("pair"), order, received) for order in params.get("orders", [])]
+        return web.json_response({"error": [], "result": {"orders": orders}})
+
+    async def query_orders(self, request):
+        try:
+            params, _ = await self._authenticate(request)
+        except ValueError as e:
+            return web.json_response({"error": [str(e)]})
+        result = {}
+        for txid in params.get("txid", "").split(","):
+            if txid in self.orders:
+                result[txid] = {key: value for key, value in self.orders[txid].items() if key != "received_ns"}
+        return web.json_response({"error": [], "result": result})
+
+    async def open_orders(self, request):
+        try:
+            await self._authenticate(request)
+        except ValueError as e:
+            return web.json_response({"error": [str(e)]})
+        open_orders = {
+            txid: {key: value for key, value in order.items() if key != "received_ns"}
+            for txid, order in self.orders.items() if order["status"] == "open"
+        }
+        return web.json_response({"error": [], "result": {"open": open_orders}})
+
+    async def balance(self, request):
+        try:
+            await self._authenticate(request)
+        except ValueError as e:
+            return web.json_response({"error": [str(e)]})
+        return web.json_response({"error": [], "result": {asset: f"{amount:.10f}" for asset, amount in self.balances.items()}})
+
+    def arrival_skew_ns(self, txids):
+        """Spread of arrival times at the exchange across the given orders."""
+        stamps = [self.orders[txid]["received_ns"] for txid in txids if txid in self.orders]
+        return max(stamps) - min(stamps) if stamps else 0
+
+
+async def main(rounds=50):
+    """Fire a three-leg triangle repeatedly against the stub, report leg skew and check the ledger against the stub's balances."""
+    api_key = "stub-key"
+    secret_key = base64.b64encode(os.urandom(64)).decode()
+    exchange = StubExchange(api_key, secret_key)
+    base_url = await exchange.start()
+    try:
+        async with OrderGateway(api_key, secret_key, None, base_url=base_url, poll_interval=0.02) as gateway:
+            gateway.registry = await PairRegistry.load(gateway.session, base_url)
+            await gateway.warm(3)
+            ledger = Ledger(gateway, reconcile_interval=0.2)
+            await ledger.start()
+            for name, price in exchange.prices.items():
+                ledger.mark(name, price)
+            gateway_skew, exchange_skew = [], []
+            for _ in range(rounds):
+                legs = [
+                    Order("XBTUSD", "buy", 0.001234567891),
+                    Order("ETHXBT", "buy", 0.02),
+                    Order("ETHUSD", "sell", 0.02),
+                ]
+                if not all(ledger.can_afford(leg.pair, leg.side, leg.volume) for leg in legs):
+                    logger.warning("Ledger cannot fund the triangle; stopping.")
+                    break
+                await gateway.execute(legs, timeout=5)
+                gateway_skew.append(leg_skew_ns(legs) / 1e6)
+                exchange_skew.append(exchange.arrival_skew_ns([leg.txid for leg in legs]) / 1e6)
+            logger.info(f"Gateway leg skew ms: median {statistics.median(gateway_skew):.3f}, max {max(gateway_skew):.3f}")
+            logger.info(f"Exchange arrival skew ms: median {statistics.median(exchange_skew):.3f}, max {max(exchange_skew):.3f}")
+            logger.info(f"Last round: {legs}")
+            await ledger.close()
+            local = dict(ledger.balances)
+            await ledger.reconcile()
+            drift = max(abs(local.get(asset, 0.0) - amount) for asset, amount in ledger.balances.items())
+            logger.info(f"Ledger after {rounds} rounds (max drift from the exchange {drift:.2e}):")
+            for line in ledger.summary():
+                logger.info(f"  {line}")
+    finally:
+        await exchange.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
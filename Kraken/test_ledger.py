@@ -0,0 +1,116 @@
+import asyncio
+import base64
+import os
+
+import pytest
+
+from ledger import FEE_MARGIN, Ledger
+from order_gateway import Order, OrderGateway, PairRegistry
+from stub_exchange import STUB_BALANCES, STUB_FEE, STUB_PAIRS, STUB_PRICES, StubExchange
+
+API_KEY = "stub-key"
+
+
+class FakeGateway:
+    """Just enough of an OrderGateway for feeding the ledger order events by hand."""
+
+    def __init__(self):
+        self.registry = PairRegistry.from_asset_pairs(STUB_PAIRS)
+        self.listeners = []
+
+
+async def with_exchange(test, fill_delay=0.01):
+    """Run test(exchange, gateway, ledger) against a stub exchange with a started ledger."""
+    secret_key = base64.b64encode(os.urandom(64)).decode()
+    exchange = StubExchange(API_KEY, secret_key, fill_delay=fill_delay)
+    base_url = await exchange.start()
+    try:
+        async with OrderGateway(API_KEY, secret_key, None, base_url=base_url, poll_interval=0.01) as gateway:
+            gateway.registry = await PairRegistry.load(gateway.session, base_url)
+            async with Ledger(gateway, reconcile_interval=3600) as ledger:
+                for name, price in STUB_PRICES.items():
+                    ledger.mark(name, price)
+                await test(exchange, gateway, ledger)
+    finally:
+        await exchange.stop()
+
+
+def test_fills_move_balances_and_release_holds():
+    ledger = Ledger(FakeGateway(), balances={"ZUSD": 1000.0, "XXBT": 0.0})
+    ledger.mark("XBTUSD", 60000.0)
+    order = Order("XBTUSD", "buy", 0.01)
+
+    ledger.on_order(order)
+    assert ledger.holds["ZUSD"] == pytest.approx(600 * (1 + FEE_MARGIN))
+
+    order.status, order.vol_exec, order.avg_price, order.fee = "open", 0.004, 60000.0, 0.5
+    ledger.on_order(order)
+    assert ledger.balances["XXBT"] == pytest.approx(0.004)
+    assert ledger.balances["ZUSD"] == pytest.approx(1000 - 240 - 0.5)
+    assert ledger.holds["ZUSD"] == pytest.approx(360 * (1 + FEE_MARGIN))
+
+    order.status, order.vol_exec, order.fee = "closed", 0.01, 1.25
+    ledger.on_order(order)
+    assert ledger.balances["XXBT"] == pytest.approx(0.01)
+    assert ledger.balances["ZUSD"] == pytest.approx(1000 - 600 - 1.25)
+    assert ledger.holds["ZUSD"] == pytest.approx(0.0, abs=1e-9)
+    assert not ledger.orders
+
+
+def test_can_afford_checks_available_funds():
+    ledger = Ledger(FakeGateway(), balances={"ZUSD": 1000.0, "XETH": 1.0})
+    ledger.mark("ETHUSD", 3000.0)
+
+    assert ledger.can_afford("ETHUSD", "sell", 1.0)
+    assert not ledger.can_afford("ETHUSD", "sell", 1.5)
+    assert ledger.can_afford("ETHUSD", "buy", 0.3)
+    assert not ledger.can_afford("ETHUSD", "buy", 0.34)
+
+    ledger.on_order(Order("ETHUSD", "sell", 0.6))
+    assert ledger.available("XETH") == pytest.approx(0.4)
+    assert not ledger.can_afford("ETHUSD", "sell", 0.5)
+
+
+def test_ledger_matches_stub_exchange_after_triangles():
+    async def test(exchange, gateway, ledger):
+        assert ledger.balances == pytest.approx(STUB_BALANCES)
+        for _ in range(5):
+            legs = [Order("XBTUSD", "buy", 0.001234567), Order("ETHXBT", "buy", 0.02), Order("ETHUSD", "sell", 0.02)]
+            assert all(ledger.can_afford(leg.pair, leg.side, leg.volume) for leg in legs)
+            await gateway.execute(legs, timeout=5)
+
+        local = dict(ledger.balances)
+        assert local == pytest.approx(exchange.balances, abs=1e-8)
+        assert all(abs(held) < 1e-9 for held in ledger.holds.values())
+        assert await ledger.reconcile()
+        assert ledger.balances == pytest.approx(local, abs=1e-8)
+
+    asyncio.run(with_exchange(test))
+
+
+def test_open_legs_hold_funds_until_filled():
+    async def test(exchange, gateway, ledger):
+        leg = Order("ETHUSD", "buy", 0.5)
+        await gateway.submit([leg])
+        assert ledger.holds["ZUSD"] == pytest.approx(0.5 * 3000 * (1 + FEE_MARGIN))
+        assert ledger.available("ZUSD") == pytest.approx(STUB_BALANCES["ZUSD"] - 1500 * (1 + FEE_MARGIN))
+        await gateway.wait([leg], timeout=5)
+
+        assert ledger.holds["ZUSD"] == pytest.approx(0.0, abs=1e-9)
+        assert ledger.balances["ZUSD"] == pytest.approx(STUB_BALANCES["ZUSD"] - 1500 * (1 + STUB_FEE))
+        assert ledger.balances["XETH"] == pytest.approx(STUB_BALANCES["XETH"] + 0.5)
+
+    asyncio.run(with_exchange(test, fill_delay=0.3))
+
+
+def test_orders_placed_elsewhere_become_external_holds():
+    async def test(exchange, gateway, ledger):
+        # Sent around the gateway, so the ledger only learns about it from OpenOrders
+        await gateway.private("/0/private/AddOrder", {"pair": "XBTUSD", "type": "sell", "ordertype": "market", "volume": "0.2"})
+        assert await ledger.reconcile()
+
+        assert ledger.external_holds == pytest.approx({"XXBT": 0.2})
+        assert ledger.available("XXBT") == pytest.approx(STUB_BALANCES["XXBT"] - 0.2)
+        assert not ledger.can_afford("XBTUSD", "sell", 0.4)
+
+    asyncio.run(with_exchange(test, fill_delay=60))